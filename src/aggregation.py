@@ -0,0 +1,266 @@
+"""
+Local rollups of the data an endpoint provides in its finest granularity.
+
+The service aggregates the rows of the finest granularity of an endpoint into the coarser ones: the row of an HR,
+QH or DY bucket is labeled by the start of the bucket in Europe/Prague time and holds the average (sum, minimum or
+maximum) of the finer rows in the bucket. The buckets are the wall clock hours, quarters and days of the row
+dates, which carry their UTC offset, so the two 02:00 hours of the autumn DST change are separate buckets and the
+DST days have 23 or 25 hours. As with the service, the bucket of the end of an interval covers the whole bucket.
+
+Values are rounded as the service rounds them: to one decimal for the generation endpoints and to 7 significant
+digits for the others. The service aggregates values that are more precise than the ones it returns, so locally
+computed averages may differ from its own in the last digit, and sums by up to half of the last digit of the native
+values for each summed row. Minimums and maximums are the same.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from ceps import CepsClientException
+
+# finest granularity with data of the endpoints the service aggregates by the function parameter
+NATIVE_GRANULARITY = {
+    "AktualniSystemovaOdchylkaCR": "MI",
+    "CrossborderPowerFlows": "QH",
+    "Generation": "QH",
+    "GenerationPlan": "QH",
+    "GenerationRES": "MI",
+    "Load": "MI",
+}
+GRANULARITY_ORDER = ["MI", "QH", "HR", "DY"]
+BUCKET_LENGTH = {
+    "MI": timedelta(minutes=1),
+    "QH": timedelta(minutes=15),
+    "HR": timedelta(hours=1),
+    "DY": timedelta(days=1),
+}
+AGGREGATE_FUNCTIONS = ["AVG", "SUM", "MIN", "MAX"]
+NATIVE_FUNCTION = "AVG"
+# decimals of the values of the endpoints the service rounds to a fixed number of decimals
+VALUE_DECIMALS = {
+    "Generation": 1,
+    "GenerationRES": 1,
+}
+VALUE_SIGNIFICANT_DIGITS = 7
+INTERVAL_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def can_aggregate(endpoint_name, granularity, function):
+    """
+    Returns True if the rows of the endpoint in the granularity and function can be computed from its native rows.
+    """
+    native = NATIVE_GRANULARITY.get(endpoint_name)
+    if native is None or granularity not in GRANULARITY_ORDER or function not in AGGREGATE_FUNCTIONS:
+        return False
+    if granularity == native:
+        return function == NATIVE_FUNCTION
+    return GRANULARITY_ORDER.index(granularity) > GRANULARITY_ORDER.index(native)
+
+
+def get_bucket_start(date, granularity):
+    """
+    Returns the start of the bucket of the ISO formatted local date, with the UTC offset of the date if it has one.
+    """
+    if granularity == "DY":
+        return date[:10] + "T00:00:00" + date[19:]
+    if granularity == "HR":
+        return date[:13] + ":00:00" + date[19:]
+    if granularity == "QH":
+        return f"{date[:14]}{int(date[14:16]) // 15 * 15:02d}:00{date[19:]}"
+    return date
+
+
+def aggregate_rows(rows, granularity, function, date_start, date_end, decimals=None):
+    """
+    Returns the rows of the buckets from the one containing date_start to the one starting at date_end (inclusive)
+    aggregated from the native rows, which have to cover the whole buckets.
+
+    :param rows: native rows of the endpoint in the order of their dates
+    :param date_start: start of the interval as local time in INTERVAL_DATE_FORMAT
+    :param date_end: end of the interval as local time in INTERVAL_DATE_FORMAT
+    :param decimals: decimals the values are rounded to, VALUE_SIGNIFICANT_DIGITS significant digits if None
+    """
+    # numpy is imported only by the runs that aggregate locally
+    import numpy as np
+
+    first_bucket = get_bucket_start(date_start, granularity)
+    keys = []
+    bucket_rows = []
+    seen_dates = set()
+    for row in rows:
+        date = row.get("date") or ""
+        if date in seen_dates:
+            # the service occasionally repeats an item, it is counted once
+            continue
+        seen_dates.add(date)
+        bucket = get_bucket_start(date, granularity)
+        if first_bucket <= bucket[:19] <= date_end:
+            # days are one bucket even when the offset changes during the day
+            keys.append(bucket[:19] if granularity == "DY" else bucket)
+            bucket_rows.append(row)
+    if not bucket_rows:
+        return []
+
+    columns = [
+        column
+        for column in dict.fromkeys(key for row in bucket_rows for key in row)
+        if column not in ("date", "granularity")
+    ]
+    values = np.array(
+        [[row.get(column) or "nan" for column in columns] for row in bucket_rows], dtype=np.float64
+    ).reshape(len(bucket_rows), len(columns))
+
+    bucket_ids = {}
+    inverse = np.array([bucket_ids.setdefault(key, len(bucket_ids)) for key in keys])
+    order = np.argsort(inverse, kind="stable")
+    values = values[order]
+    starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+
+    present = ~np.isnan(values)
+    if function in ("AVG", "SUM"):
+        sums = np.add.reduceat(np.where(present, values, 0.0), starts, axis=0)
+        counts = np.add.reduceat(present, starts, axis=0)
+        result = np.where(counts > 0, sums, np.nan)
+        if function == "AVG":
+            result = result / np.maximum(counts, 1)
+    elif function == "MIN":
+        result = np.fmin.reduceat(values, starts, axis=0)
+    else:
+        result = np.fmax.reduceat(values, starts, axis=0)
+    if decimals is not None:
+        result = np.round(result, decimals)
+
+    first_dates = [bucket_rows[index]["date"] for index in order[starts]]
+    return [
+        {
+            "date": get_bucket_start(first_date, granularity),
+            **{column: format_value(value, decimals) for column, value in zip(columns, bucket_values)},
+            "granularity": granularity,
+        }
+        for first_date, bucket_values in zip(first_dates, result)
+    ]
+
+
+def format_value(value, decimals=None):
+    # as the service formats the values: without trailing zeros, integers without the decimal point
+    import numpy as np
+
+    if np.isnan(value):
+        return ""
+    # adding zero turns -0.0 into 0.0
+    if decimals is not None:
+        return np.format_float_positional(value + 0.0, trim="-")
+    value = float(np.format_float_positional(value, precision=VALUE_SIGNIFICANT_DIGITS, fractional=False)) + 0.0
+    return np.format_float_positional(value, trim="-")
+
+
+class LocalAggregationClient:
+    """
+    Wraps CepsClient and computes the configured granularities and functions of an endpoint locally from one fetch
+    of its native granularity. Other requests are passed to the wrapped client.
+
+    The first request of an interval fetches the native rows of the interval, extended to the end of the coarsest
+    configured bucket, and computes the rows of all the configured targets of the endpoint. The rows of the other
+    targets are kept until they are requested for the same interval. The intervals of all targets of an endpoint
+    therefore have to be the same, and the native target should be requested first, so its rows are not kept.
+
+    The rows are kept only for the targets that still have to request the interval, and are removed with the lock of
+    the interval once all of them did. The halves of a failed interval are requested only by the targets it failed
+    for, so the rows of its halves are kept only for them.
+    """
+
+    def __init__(self, client, targets, split_interval=None):
+        """
+
+        :param client: CepsClient used to fetch the native rows
+        :param targets: (endpoint, granularity, function) tuples computed locally, see can_aggregate
+        :param split_interval: function returning the halves of a failed interval that are requested next, or None,
+        see Component.split_interval; None if failed intervals are not split
+        """
+        self.client = client
+        self.split_interval = split_interval
+        self.targets = {}
+        for endpoint, granularity, function in targets:
+            self.targets.setdefault(endpoint, []).append((granularity, function))
+        self._results = {}
+        self._interval_locks = {}
+        # the targets that have not requested the interval yet, by the interval
+        self._pending_targets = {}
+        self._lock = threading.Lock()
+
+    def get_data(self, endpoint, date_start, date_end, granularity="HR", function="AVG", version="RT"):
+        targets = self.targets.get(endpoint, [])
+        target = (granularity, function)
+        if target not in targets:
+            return self.client.get_data(
+                endpoint, date_start, date_end, granularity=granularity, function=function, version=version
+            )
+
+        interval_key = (endpoint, date_start, date_end, version)
+        with self._lock:
+            # intervals that are not halves of a failed interval are requested by all targets
+            pending_targets = self._pending_targets.setdefault(interval_key, set(targets))
+            interval_lock = self._interval_locks.setdefault(interval_key, threading.Lock())
+        with interval_lock:
+            result = self._results.pop((interval_key, target), None)
+            if result is None:
+                results = self._compute_targets(endpoint, date_start, date_end, version, targets)
+                result = results.pop(target)
+                for other_target, target_result in results.items():
+                    if other_target in pending_targets:
+                        self._results[(interval_key, other_target)] = target_result
+            else:
+                logging.debug(f"{endpoint} {granularity} {function} for {date_start} - {date_end} computed locally")
+
+        with self._lock:
+            pending_targets.discard(target)
+            if not pending_targets:
+                del self._pending_targets[interval_key]
+                del self._interval_locks[interval_key]
+            if isinstance(result, CepsClientException) and self.split_interval:
+                for half in self.split_interval({"start_date": date_start, "end_date": date_end}) or ():
+                    half_key = (endpoint, half["start_date"], half["end_date"], version)
+                    self._pending_targets.setdefault(half_key, set()).add(target)
+
+        if isinstance(result, CepsClientException):
+            raise result
+        return result
+
+    def iter_data(self, endpoint, date_start, date_end, **kwargs):
+        if endpoint not in self.targets:
+            return self.client.iter_data(endpoint, date_start, date_end, **kwargs)
+        return iter(self.get_data(endpoint, date_start, date_end, **kwargs))
+
+    def _compute_targets(self, endpoint, date_start, date_end, version, targets):
+        """
+        Returns the rows, or the exception to raise, of each (granularity, function) target of the interval.
+        """
+        native = NATIVE_GRANULARITY[endpoint]
+        coarsest = max((granularity for granularity, _ in targets), key=GRANULARITY_ORDER.index)
+        fetch_start = get_bucket_start(date_start, coarsest)
+        fetch_end = datetime.strptime(date_end, INTERVAL_DATE_FORMAT) + BUCKET_LENGTH[coarsest] - BUCKET_LENGTH[native]
+        try:
+            native_rows = self.client.get_data(
+                endpoint,
+                fetch_start,
+                fetch_end.strftime(INTERVAL_DATE_FORMAT),
+                granularity=native,
+                function=NATIVE_FUNCTION,
+                version=version,
+            )
+        except CepsClientException as ceps_exc:
+            return dict.fromkeys(targets, ceps_exc)
+
+        results = {}
+        for granularity, function in targets:
+            if granularity == native:
+                rows = [row for row in native_rows if date_start <= (row.get("date") or "")[:19] <= date_end]
+            else:
+                rows = aggregate_rows(
+                    native_rows, granularity, function, date_start, date_end, VALUE_DECIMALS.get(endpoint)
+                )
+            results[(granularity, function)] = rows or CepsClientException(
+                f"No data returned for {endpoint} {granularity} {function} from {date_start} to {date_end}"
+            )
+        return results
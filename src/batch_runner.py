@@ -0,0 +1,155 @@
+"""
+Runs several configurations in one process, one after another.
+
+Each configuration is given by its data folder (config.json, in/state.json) and gets its own output tables and
+state there, as when it runs in its own container. The imports, the WSDL and the connections to the service are
+shared, and a request made by one configuration is not sent again by the next ones while its rows are kept (see
+SharedFetchClient).
+
+    python src/batch_runner.py DATA_FOLDER [DATA_FOLDER ...] [--max-shared-rows 500000]
+
+The exit code is the highest one of the runs: 1 when a configuration failed on a user error, 2 on another error.
+"""
+
+import argparse
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from keboola.component.exceptions import UserException
+
+from component import MAX_WORKERS_LIMIT, Component
+
+# rows of the responses kept for the next configurations, about 1 kB each unless they are columnar
+DEFAULT_MAX_SHARED_ROWS = 500_000
+
+
+class SharedFetchClient:
+    """
+    Wraps CepsClient shared by the configurations of a batch. Identical requests (endpoint, interval, granularity,
+    function and version) are sent once: requests made at the same time wait for the first one, later ones get the
+    kept rows. Up to max_shared_rows rows are kept, the rows of the least recently made requests are released first.
+    Failed requests are not kept, the next configuration sends them again.
+
+    Streamed requests are passed to the client and their rows are not kept, unless the request was already made.
+    """
+
+    def __init__(self, client, max_shared_rows=DEFAULT_MAX_SHARED_ROWS):
+        """
+
+        :param client: CepsClient used to fetch the data
+        :param max_shared_rows: rows kept for the next requests
+        """
+        self.client = client
+        self.max_shared_rows = max_shared_rows
+        self.requests = 0
+        self.shared_requests = 0
+        self._results = OrderedDict()
+        self._kept_rows = 0
+        self._lock = threading.Lock()
+
+    def configure_run(self, **kwargs):
+        self.client.configure_run(**kwargs)
+
+    def get_data(self, endpoint, date_start, date_end, granularity="HR", function="AVG", version="RT"):
+        key = (endpoint, date_start, date_end, granularity, function, version)
+        with self._lock:
+            self.requests += 1
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+            else:
+                self.shared_requests += 1
+                self._results.move_to_end(key)
+        if not owner:
+            return future.result()
+
+        try:
+            rows = self.client.get_data(
+                endpoint, date_start, date_end, granularity=granularity, function=function, version=version
+            )
+        except BaseException as fetch_exc:
+            with self._lock:
+                self._results.pop(key, None)
+            future.set_exception(fetch_exc)
+            raise
+        future.set_result(rows)
+        with self._lock:
+            self._keep(key, rows)
+        return rows
+
+    def iter_data(self, endpoint, date_start, date_end, granularity="HR", function="AVG", version="RT"):
+        key = (endpoint, date_start, date_end, granularity, function, version)
+        with self._lock:
+            if key in self._results:
+                shared = True
+            else:
+                shared = False
+                self.requests += 1
+        if shared:
+            return iter(self.get_data(endpoint, date_start, date_end, granularity, function, version))
+        return self.client.iter_data(
+            endpoint, date_start, date_end, granularity=granularity, function=function, version=version
+        )
+
+    def log_statistics(self):
+        logging.info(
+            f"Batch: {self.shared_requests} of {self.requests} requests served by the requests of other configurations"
+        )
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._kept_rows = 0
+
+    def _keep(self, key, rows):
+        if key not in self._results:
+            # released while the request was made
+            return
+        self._kept_rows += len(rows)
+        while self._kept_rows > self.max_shared_rows and self._results:
+            released_key, released = next(iter(self._results.items()))
+            if not released.done():
+                # the oldest request is still in flight, the rows are released once it is done
+                break
+            del self._results[released_key]
+            self._kept_rows -= len(released.result())
+
+
+def run_batch(data_folders, max_shared_rows=DEFAULT_MAX_SHARED_ROWS):
+    """
+    Runs the configurations of the data folders with a shared client, returns the highest exit code of the runs.
+    """
+    # imported once for all the configurations
+    from ceps import CepsClient, WsdlCache
+
+    # connections are opened when they are needed, so the pool is sized for the highest concurrency allowed
+    client = SharedFetchClient(CepsClient(wsdl_cache=WsdlCache(), pool_size=MAX_WORKERS_LIMIT), max_shared_rows)
+    exit_code = 0
+    for data_folder in data_folders:
+        logging.info(f"Running the configuration of {data_folder}")
+        try:
+            Component(data_path_override=data_folder, shared_client=client).execute_action()
+        except UserException as exc:
+            logging.exception(f"Configuration of {data_folder} failed: {exc}")
+            exit_code = max(exit_code, 1)
+        except Exception as exc:
+            logging.exception(f"Configuration of {data_folder} failed: {exc}")
+            exit_code = 2
+    client.log_statistics()
+    client.clear()
+    return exit_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_folders", nargs="+", metavar="DATA_FOLDER")
+    parser.add_argument("--max-shared-rows", type=int, default=DEFAULT_MAX_SHARED_ROWS)
+    args = parser.parse_args()
+    exit(run_batch(args.data_folders, args.max_shared_rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,23 @@
-from .client import CepsClient, CepsClientException  # noqa
+import importlib
+
+from .exceptions import CepsClientException, CepsClientTimeoutException  # noqa
+
+# the clients import zeep, requests and lxml, so they are imported when they are first used
+_LAZY_ATTRIBUTES = {
+    "CepsClient": ".client",
+    "ResponseCache": ".response_cache",
+    "WsdlCache": ".wsdl_cache",
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *_LAZY_ATTRIBUTES])
@@ -0,0 +1,273 @@
+import logging
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError, RequestException, RetryError, Timeout
+from requests.exceptions import ConnectionError as RequestConnectionError
+from requests.packages.urllib3.util.retry import RequestHistory, Retry
+
+# responses that mean the service is overloaded or failing, they are retried and reduce the concurrency
+RETRY_STATUSES = (500, 501, 502, 503, 504)
+# retries of the whole run, once spent failed requests are not retried anymore
+DEFAULT_RETRY_BUDGET = 100
+# consecutive failed requests that open the circuit
+DEFAULT_FAILURE_THRESHOLD = 10
+# seconds the circuit stays open before a trial request is let through
+DEFAULT_RESET_TIMEOUT = 30
+DEFAULT_INITIAL_CONCURRENCY = 2
+DEFAULT_DECREASE_FACTOR = 0.5
+# longest pause between two attempts of a request
+MAX_BACKOFF_SECONDS = 10
+
+
+class CircuitOpenError(RequestException):
+    """
+    Raised instead of sending a request while the circuit is open.
+    """
+
+
+class AimdLimiter:
+    """
+    Limits the number of requests in flight. The limit grows by one for each limit requests that succeed (additive
+    increase) and is multiplied by decrease_factor when a request fails or is slower than latency_target
+    (multiplicative decrease). Requests that were already in flight when the limit decreased do not decrease it
+    again, so one burst of failures halves the limit only once.
+    """
+
+    def __init__(
+        self,
+        max_concurrency,
+        min_concurrency=1,
+        initial_concurrency=DEFAULT_INITIAL_CONCURRENCY,
+        latency_target=None,
+        decrease_factor=DEFAULT_DECREASE_FACTOR,
+    ):
+        """
+
+        :param max_concurrency: highest limit, the number of threads sending the requests
+        :param latency_target: seconds, slower successful requests decrease the limit too, not used by default
+        """
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.peak_limit = self._limit = float(min(max(initial_concurrency, self.min_concurrency), max_concurrency))
+        self.decreases = 0
+        self._in_flight = 0
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self):
+        """
+        Waits until the request can be sent, returns the time it was sent at.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, failed=None):
+        """
+        Ends the request sent at started. The limit is not changed when failed is None (the request was not sent).
+        """
+        now = time.monotonic()
+        with self._condition:
+            self._in_flight -= 1
+            if failed is not None:
+                slow = self.latency_target is not None and now - started > self.latency_target
+                if failed or slow:
+                    if started > self._last_decrease:
+                        self._limit = max(self._limit * self.decrease_factor, self.min_concurrency)
+                        self._last_decrease = now
+                        self.decreases += 1
+                else:
+                    self._limit = min(self._limit + 1 / self._limit, self.max_concurrency)
+                    self.peak_limit = max(self.peak_limit, self._limit)
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failed requests, so the following requests fail right away instead of
+    loading a service that is down. After reset_timeout seconds a single trial request is let through: the circuit
+    closes when it succeeds and opens again when it fails.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.times_opened = 0
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns True if a request can be sent.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # a trial that did not report its result in time is replaced by another one
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record(self, failed):
+        """
+        Records the result of a request, None if it has none (e.g. it failed before it was sent).
+        """
+        if failed is None:
+            return
+        with self._lock:
+            if not failed:
+                self._failures = 0
+                self.state = self.CLOSED
+                return
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logging.warning(f"{self._failures} requests to the service failed in a row, pausing requests")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class RequestController:
+    """
+    Shared by all the requests of a run: limits their concurrency with AimdLimiter, stops them with CircuitBreaker
+    while the service keeps failing and limits the retries of the whole run to retry_budget.
+    """
+
+    def __init__(
+        self,
+        max_concurrency,
+        initial_concurrency=DEFAULT_INITIAL_CONCURRENCY,
+        latency_target=None,
+        retry_budget=DEFAULT_RETRY_BUDGET,
+        failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout=DEFAULT_RESET_TIMEOUT,
+    ):
+        self.limiter = AimdLimiter(
+            max_concurrency, initial_concurrency=initial_concurrency, latency_target=latency_target
+        )
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.retry_budget = retry_budget
+        self.retries = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def start(self, url):
+        """
+        Waits for a free slot and returns the time the request was sent at. Raises CircuitOpenError if the request
+        cannot be sent.
+        """
+        started = self.limiter.acquire()
+        if not self.breaker.allow():
+            self.limiter.release(started)
+            raise CircuitOpenError(f"Requests to {url} are paused after repeated failures")
+        with self._lock:
+            self.requests += 1
+        return started
+
+    def finish(self, started, failed=None):
+        self.limiter.release(started, failed)
+        self.breaker.record(failed)
+
+    def spend_retry(self):
+        """
+        Returns True if the retry budget allows one more retry.
+        """
+        with self._lock:
+            if self.retries >= self.retry_budget:
+                return False
+            self.retries += 1
+            return True
+
+    def log_statistics(self):
+        logging.info(
+            f"Adaptive concurrency: {self.requests} requests, {self.retries}/{self.retry_budget} retries used, "
+            f"concurrency {self.limiter.limit} (peak {int(self.limiter.peak_limit)}, "
+            f"{self.limiter.decreases} decreases), circuit opened {self.breaker.times_opened} times"
+        )
+
+
+class ControlledHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter that sends the requests through a RequestController and retries failed ones itself instead of
+    urllib3, at most max_retries times per request and within the retry budget of the run. A request does not hold
+    its slot while it waits for the retry, so the other requests can use it.
+
+    When a request is not retried anymore, timeouts and connection errors are raised as they are and failed
+    responses as RetryError, as urllib3 does when its retries are exhausted. The retries are recorded to the
+    history of response.raw.retries like those of urllib3.
+    """
+
+    def __init__(self, controller, max_retries, backoff_factor, **kwargs):
+        # each attempt is a single request, responses with an error status are returned to be retried here
+        super().__init__(max_retries=Retry(0, read=False, redirect=False), **kwargs)
+        self.controller = controller
+        self.retries_per_request = max_retries
+        self.backoff_factor = backoff_factor
+
+    def send(self, request, stream=False, **kwargs):
+        history = []
+        while True:
+            started = self.controller.start(request.url)
+            try:
+                response = super().send(request, stream=stream, **kwargs)
+                if not stream:
+                    # the body is read here, while the request holds its slot, so its latency includes the body and
+                    # the connection is released to the pool before the slot is
+                    _ = response.content
+            except (Timeout, RequestConnectionError, ChunkedEncodingError) as request_error:
+                self.controller.finish(started, failed=True)
+                if not self._retry(request, history, error=request_error):
+                    raise
+                continue
+            except BaseException:
+                self.controller.finish(started)
+                raise
+
+            failed = response.status_code in RETRY_STATUSES
+            self.controller.finish(started, failed)
+            if failed:
+                response.close()
+                if not self._retry(request, history, status=response.status_code):
+                    raise RetryError(
+                        f"{request.method} {request.url} failed with status {response.status_code} "
+                        f"after {len(history)} retries",
+                        request=request,
+                        response=response,
+                    )
+                continue
+            if history:
+                response.raw.retries = Retry(0, history=tuple(history))
+            return response
+
+    def _retry(self, request, history, error=None, status=None):
+        if len(history) >= self.retries_per_request or not self.controller.spend_retry():
+            return False
+        history.append(RequestHistory(request.method, request.url, error, status, None))
+        logging.debug(f"Retrying {request.method} {request.url} ({len(history)}), failed with {error or status}")
+        time.sleep(self.get_backoff_time(len(history)))
+        return True
+
+    def get_backoff_time(self, retry):
+        return min(self.backoff_factor * 2 ** (retry - 1), MAX_BACKOFF_SECONDS)
@@ -0,0 +1,170 @@
+"""
+Columnar batches of the rows of one response.
+
+A row dict keeps a str object for each of its columns, so a row of an endpoint with ten MW columns takes about
+a kilobyte. RowBatch keeps the rows of a response column by column instead: the dates as a datetime64 array with
+the codes of their UTC offsets, the values as float64 arrays and the granularity once. The columns are formatted
+back to text a whole column at a time when the batch is written.
+
+A column is stored typed only when formatting it gives back exactly the text returned by the service, otherwise
+it keeps the text, so the written rows do not depend on the representation. The floats are therefore formatted
+twice (checked when parsed and formatted when written), which makes batches slower to map and write than row dicts:
+they save memory, not time.
+"""
+
+from collections.abc import Sequence
+from itertools import repeat
+
+import numpy as np
+
+TIMESTAMP_COLUMN = "date"
+# length of the local date and time of the dates, the rest is the UTC offset
+LOCAL_TIME_LENGTH = len("2026-01-01T00:00:00")
+
+
+def join_floats(values):
+    """
+    Returns the values formatted as the service formats them, each followed by a newline: in their shortest
+    representation, integral values without the decimal point. The values are joined to one string, so the ".0" of
+    the integral ones is removed by a single replace.
+    """
+    return ("\n".join(map(repr, values.tolist())) + "\n").replace(".0\n", "\n")
+
+
+def format_floats(values):
+    formatted = join_floats(values).split("\n")
+    formatted.pop()
+    return formatted
+
+
+class FloatColumn:
+    def __init__(self, values):
+        self.values = values
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Returns the column of the text values, None if they cannot be parsed or are formatted differently.
+        """
+        try:
+            column = cls(np.array(text, dtype=np.float64))
+        except ValueError:
+            return None
+        # a value with a newline would add a line to the text, so the whole lines are compared
+        return column if join_floats(column.values) == "\n".join(text) + "\n" else None
+
+    def format(self, start=None, stop=None):
+        return format_floats(self.values[start:stop])
+
+
+class TimestampColumn:
+    """
+    Local dates and times with the codes of their UTC offsets, the offsets (one or two per response) are stored
+    once.
+    """
+
+    def __init__(self, local_times, offset_codes, offsets):
+        self.local_times = local_times
+        self.offset_codes = offset_codes
+        self.offsets = offsets
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Returns the column of the ISO formatted dates, None if they cannot be parsed or are formatted differently.
+        """
+        try:
+            local_times = np.array([value[:LOCAL_TIME_LENGTH] for value in text], dtype="datetime64[s]")
+        except ValueError:
+            return None
+        offsets, offset_codes = np.unique([value[LOCAL_TIME_LENGTH:] for value in text], return_inverse=True)
+        column = cls(local_times, offset_codes.astype(np.min_scalar_type(len(offsets))), offsets)
+        return column if column.format() == text else None
+
+    def format(self, start=None, stop=None):
+        local_times = np.datetime_as_string(self.local_times[start:stop], unit="s")
+        return np.char.add(local_times, self.offsets[self.offset_codes[start:stop]]).tolist()
+
+
+class TextColumn:
+    def __init__(self, values):
+        self.values = values
+
+    def format(self, start=None, stop=None):
+        return self.values[start:stop]
+
+
+class ConstantColumn:
+    def __init__(self, value, length):
+        self.value = value
+        self.length = length
+
+    def format(self, start=None, stop=None):
+        return [self.value] * len(range(self.length)[start:stop])
+
+
+class IndexColumn:
+    """
+    Position of the row in the response, as the ordered_index column.
+    """
+
+    def __init__(self, length):
+        self.length = length
+
+    def format(self, start=None, stop=None):
+        return range(self.length)[start:stop]
+
+
+def parse_column(name, text):
+    """
+    Returns the most compact column that formats back to the text: timestamps for the date column, floats for
+    the others and the text itself when they do not.
+
+    :param text: list of the values of the column as returned by the service
+    """
+    column_type = TimestampColumn if name == TIMESTAMP_COLUMN else FloatColumn
+    column = column_type.parse(text)
+    return TextColumn(text) if column is None else column
+
+
+class RowBatch(Sequence):
+    """
+    Rows of one response stored column by column. Iterating or indexing the batch gives the same row dicts as
+    RowMapper.map_items, the writers of csv_tools write it a column at a time with format_rows.
+    """
+
+    def __init__(self, columns, length):
+        """
+
+        :param columns: dict of the columns of the rows by their names, in the order of the row keys
+        :param length: number of rows
+        """
+        self.columns = columns
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def keys(self):
+        return self.columns.keys()
+
+    def __iter__(self):
+        names = tuple(self.columns)
+        for values in zip(*(column.format() for column in self.columns.values())):
+            yield dict(zip(names, values))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(self._length)[index]]
+        position = range(self._length)[index]
+        return {name: column.format(position, position + 1)[0] for name, column in self.columns.items()}
+
+    def format_rows(self, fieldnames, restval=""):
+        """
+        Returns iterator of the rows as tuples of the values of fieldnames, restval for the columns the batch does
+        not have. Each column is formatted at once.
+        """
+        columns = self.columns
+        return zip(
+            *(columns[name].format() if name in columns else repeat(restval, self._length) for name in fieldnames)
+        )
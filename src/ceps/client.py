@@ -1,31 +1,66 @@
 import logging.config
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
 
 import xmltodict
 import zeep
+import zeep.exceptions
 import zeep.transports
 import zeep.wsdl.utils
 from keboola.utils.header_normalizer import DefaultHeaderNormalizer
 from requests import Session
 from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError, Timeout
+from requests.exceptions import ConnectionError as RequestConnectionError
+from requests.packages.urllib3.exceptions import ReadTimeoutError
 from requests.packages.urllib3.util.retry import Retry
 
+from .adaptive import CircuitOpenError, ControlledHTTPAdapter, RequestController
+from .endpoints import ENDPOINT_COLUMNS, get_request_options
+from .envelope import EnvelopeBuilder, EnvelopeException
+from .exceptions import CepsClientException, CepsClientTimeoutException
+from .parser import RowMapper, get_series, has_items
+from .response_cache import ResponseCache
+from .wsdl_cache import WsdlCache
+
 WSDL_URL = "https://www.ceps.cz/_layouts/CepsData.asmx?wsdl"
 
 MAX_RETRIES = 10
+ROW_MAPPER_CACHE_SIZE = 256
+# matches the requests default, raised when more requests run concurrently
+DEFAULT_POOL_SIZE = 10
+# bytes of the response body parsed at once by iter_data
+STREAM_CHUNK_SIZE = 64 * 1024
+SOAP_CONTENT_TYPE = "text/xml; charset=utf-8"
+# the SOAP responses are verbose XML, which compresses to a fraction of its size
+ACCEPT_ENCODING = "gzip, deflate"
 
 # Custom column name mappings to override header normalizer output
 # The header normalizer drops diacritics incorrectly (e.g., 'í' -> '' instead of 'i')
 COLUMN_NAME_OVERRIDES = {"aktuln_odchylka_mw": "aktualni_odchylka_mw"}
 
-
-class CepsClientException(Exception):
-    pass
+_HEADER_NORMALIZER = DefaultHeaderNormalizer()
 
 
-class CepsClient:
-    def __init__(self, debug=False, max_retries=MAX_RETRIES, backoff_factor=0.3):
-        self._set_logger(debug)
-        session = Session()
+def create_session(
+    max_retries=MAX_RETRIES,
+    backoff_factor=0.3,
+    pool_size=DEFAULT_POOL_SIZE,
+    controller: RequestController = None,
+    compression=True,
+):
+    """
+    Returns requests session that retries failed requests, with a connection pool of pool_size. With
+    controller, the concurrency and the retries of the requests are controlled by it. With compression, gzip and
+    deflate compressed responses are accepted, otherwise the responses are requested uncompressed.
+    """
+    session = Session()
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING if compression else "identity"
+    if controller:
+        adapter = ControlledHTTPAdapter(controller, max_retries, backoff_factor, pool_maxsize=pool_size)
+    else:
         retry = Retry(
             total=max_retries,
             read=max_retries,
@@ -34,11 +69,140 @@ class CepsClient:
             status_forcelist=(500, 501, 502, 503, 504),
             method_whitelist=("GET", "POST", "PATCH", "UPDATE"),
         )
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        transport = zeep.transports.Transport(session=session)
-        self.client = zeep.Client(WSDL_URL, transport=transport)
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_wire_bytes(response):
+    """
+    Returns the bytes of the read body of the response as they were received, before they were decompressed.
+    """
+    try:
+        return response.raw.tell()
+    except (AttributeError, OSError):
+        return 0
+
+
+class MeteredTransport(zeep.transports.Transport):
+    """
+    zeep transport that keeps the latency, size, retry count, bytes received and content encoding of the last SOAP
+    call made by each thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._last_call = threading.local()
+
+    def post(self, address, message, headers):
+        start = time.perf_counter()
+        response = super().post(address, message, headers)
+        retries = getattr(response.raw, "retries", None)
+        self._last_call.stats = (
+            time.perf_counter() - start,
+            len(response.content),
+            len(retries.history) if retries else 0,
+            get_wire_bytes(response),
+            response.headers.get("Content-Encoding"),
+        )
+        return response
+
+    def pop_last_call(self):
+        """
+        Returns (latency, response bytes, retries, wire bytes, content encoding) of the last call of the current
+        thread.
+        """
+        stats = getattr(self._last_call, "stats", (None, 0, 0, 0, None))
+        self._last_call.stats = (None, 0, 0, 0, None)
+        return stats
+
+
+class CepsClient:
+    def __init__(
+        self,
+        debug=False,
+        max_retries=MAX_RETRIES,
+        backoff_factor=0.3,
+        wsdl_cache: WsdlCache = None,
+        pool_size=DEFAULT_POOL_SIZE,
+        response_cache: ResponseCache = None,
+        operation_timeout=None,
+        metrics=None,
+        service_url=None,
+        request_controller: RequestController = None,
+        columnar_rows=False,
+        compression=True,
+        stream_responses=False,
+    ):
+        """
+
+        :param operation_timeout: timeout of a request in seconds, no timeout by default
+        :param metrics: optional RunMetrics the requests are recorded to
+        :param service_url: URL the requests sent without zeep (iter_data, stream_responses) go to, the address from the
+            bundled WSDL by default
+        :param request_controller: optional RequestController adapting the concurrency and retries of the requests
+        :param columnar_rows: return the rows of endpoints with a known schema as RowBatch (see parse_response)
+        :param compression: request gzip or deflate compressed responses
+        :param stream_responses: build the response tree of get_data from the body while it is received instead of
+            reading the whole body first, the requests are then sent without zeep (see iter_data)
+        """
+        self._set_logger(debug)
+        session = create_session(max_retries, backoff_factor, pool_size, request_controller, compression)
+        self.transport = MeteredTransport(session=session, operation_timeout=operation_timeout)
+        self.metrics = metrics
+        self.wsdl_cache = wsdl_cache
+        self.response_cache = response_cache
+        self.columnar_rows = columnar_rows
+        self.compression = compression
+        self.stream_responses = stream_responses
+        self._uncompressed_logged = False
+        self._wsdl_from_cache = False
+        self.client = self._create_client()
+        self._service_url = service_url
+        self._envelope_builder = None
+
+    def configure_run(
+        self, response_cache=None, operation_timeout=None, metrics=None, columnar_rows=False, stream_responses=False
+    ):
+        """
+        Replaces the settings that do not depend on the connection pool, so runs of several configurations done one
+        after another can share the client (and its connections and loaded WSDL).
+        """
+        self.response_cache = response_cache
+        self.transport.operation_timeout = operation_timeout
+        self.metrics = metrics
+        self.columnar_rows = columnar_rows
+        self.stream_responses = stream_responses
+
+    def _create_client(self):
+        if self.wsdl_cache:
+            wsdl_location = self.wsdl_cache.get_location(self._fetch_wsdl)
+            if wsdl_location:
+                try:
+                    client = zeep.Client(wsdl_location, transport=self.transport)
+                    self._wsdl_from_cache = True
+                    return client
+                except (zeep.exceptions.Error, ValueError) as wsdl_exc:
+                    logging.warning(f"Failed to load cached WSDL, falling back to {WSDL_URL}: {wsdl_exc}")
+        self._wsdl_from_cache = False
+        return zeep.Client(WSDL_URL, transport=self.transport)
+
+    def _fetch_wsdl(self):
+        return self.transport.load(WSDL_URL)
+
+    def _get_operation(self, endpoint):
+        try:
+            return getattr(self.client.service, endpoint)
+        except AttributeError:
+            if not self._wsdl_from_cache:
+                raise
+            # the cached WSDL may be outdated, reload it from the service and try again
+            logging.info(f"Operation {endpoint} not found in cached WSDL, reloading WSDL from {WSDL_URL}")
+            wsdl_location = self.wsdl_cache.refresh(self._fetch_wsdl) or WSDL_URL
+            self._wsdl_from_cache = False
+            self.client = zeep.Client(wsdl_location, transport=self.transport)
+            return getattr(self.client.service, endpoint)
 
     def _set_logger(self, debug):
         if debug:
@@ -70,30 +234,42 @@ class CepsClient:
     def get_data(self, endpoint, date_start, date_end, granularity="HR", function="AVG", version="RT"):
         if endpoint == "DataVersion":
             return self.get_data_version(endpoint)
-        elif endpoint in ["NepredvidatelneOdmitnuteNabidky", "OdhadovanaCenaOdchylky", "OfferPrices"]:
-            return self.get_timeseries_data(endpoint, date_start, date_end, add_para1=False)
-        elif endpoint in ["AktualniSystemovaOdchylkaCR"]:
-            return self.get_timeseries_data(
-                endpoint, date_start, date_end, granularity=granularity, function=function, add_para1=False
-            )
-        elif endpoint in ["RegulationEnergy", "RegulationEnergyB", "CrossborderPowerFlows", "GenerationPlan", "Load"]:
-            return self.get_timeseries_data(
-                endpoint,
-                date_start,
-                date_end,
-                granularity=granularity,
-                function=function,
-                version=version,
-                add_para1=False,
-            )
-        else:
-            return self.get_timeseries_data(
-                endpoint, date_start, date_end, granularity=granularity, function=function, version=version
-            )
+        return self.get_timeseries_data(
+            endpoint, date_start, date_end, **self.get_request_options(endpoint, granularity, function, version)
+        )
 
-    def get_timeseries_data(
-        self, endpoint, date_start, date_end, granularity=None, function=None, version=None, add_para1=True
-    ):
+    def iter_data(self, endpoint, date_start, date_end, granularity="HR", function="AVG", version="RT"):
+        """
+        Returns an iterator of the same rows as get_data. The response body is parsed as it is received and each
+        item is mapped to a row and released right away, so the memory used does not depend on the size of the
+        interval. The request is sent when the first row is requested.
+
+        Responses of the response cache are stored whole, so with the cache configured the rows come from get_data.
+        """
+        if endpoint == "DataVersion":
+            raise CepsClientException("DataVersion is not a time series, use get_data")
+        if self.response_cache:
+            return iter(self.get_data(endpoint, date_start, date_end, granularity, function, version))
+        request_data = self.build_request_data(
+            date_start, date_end, **self.get_request_options(endpoint, granularity, function, version)
+        )
+        return self._stream_timeseries_data(endpoint, request_data)
+
+    @property
+    def envelope_builder(self):
+        if self._envelope_builder is None:
+            self._envelope_builder = EnvelopeBuilder()
+        return self._envelope_builder
+
+    @staticmethod
+    def get_request_options(endpoint, granularity="HR", function="AVG", version="RT"):
+        """
+        Returns the get_timeseries_data options the endpoint accepts.
+        """
+        return get_request_options(endpoint, granularity, function, version)
+
+    @staticmethod
+    def build_request_data(date_start, date_end, granularity=None, function=None, version=None, add_para1=True):
         request_data = {"dateFrom": date_start, "dateTo": date_end}
         if add_para1:
             request_data["para1"] = "all"
@@ -103,69 +279,302 @@ class CepsClient:
             request_data["function"] = function
         if granularity:
             request_data["agregation"] = granularity
+        return request_data
 
-        method_to_call = getattr(self.client.service, endpoint)
+    def get_timeseries_data(
+        self, endpoint, date_start, date_end, granularity=None, function=None, version=None, add_para1=True
+    ):
+        request_data = self.build_request_data(date_start, date_end, granularity, function, version, add_para1)
+        requested_at = time.perf_counter()
+        cached = False
+        call_stats = (None, 0, 0, 0, None)
+        parse_start = None
+        rows = None
         try:
-            response = method_to_call(**request_data)
+            response = self.response_cache.get(endpoint, request_data) if self.response_cache else None
+            cached = response is not None
+            if response is None:
+                if self.stream_responses:
+                    response, call_stats = self._read_streamed_response(endpoint, request_data)
+                else:
+                    try:
+                        response = self._call_operation(endpoint, request_data)
+                    finally:
+                        call_stats = self.transport.pop_last_call()
+                self._check_compression(call_stats[4])
+                if self.response_cache and response is not None:
+                    self.response_cache.put(endpoint, request_data, response)
+
+            parse_start = time.perf_counter()
+            rows = self.parse_response(endpoint, request_data, response, self.columnar_rows)
+            return rows
+        finally:
+            # failed requests are recorded too, including those that failed before a response was received
+            if self.metrics is not None:
+                finished_at = time.perf_counter()
+                latency, response_bytes, retries, wire_bytes, content_encoding = call_stats
+                if latency is None and not cached:
+                    latency = (parse_start or finished_at) - requested_at
+                self.metrics.add_request(
+                    endpoint,
+                    request_data,
+                    latency,
+                    response_bytes,
+                    retries,
+                    0.0 if parse_start is None else finished_at - parse_start,
+                    None if rows is None else len(rows),
+                    cached=cached,
+                    wire_bytes=wire_bytes,
+                    content_encoding=content_encoding,
+                    # the rows are returned together, so the first one is ready when all of them are
+                    first_row_time=finished_at - requested_at if rows else None,
+                )
+
+    def _read_streamed_response(self, endpoint, request_data):
+        """
+        Returns the root element of the response built while its body is received and the stats of the call as
+        MeteredTransport.pop_last_call returns them. The latency includes building the tree.
+        """
+        start = time.perf_counter()
+        response = self._post_envelope(endpoint, request_data)
+        retries = getattr(response.raw, "retries", None)
+        response_bytes = 0
+
+        def counted(chunks):
+            nonlocal response_bytes
+            for chunk in chunks:
+                response_bytes += len(chunk)
+                yield chunk
+
+        with self._reading_response(endpoint, request_data), response:
+            self._check_streamed_response(endpoint, request_data, response)
+            root = self.envelope_builder.parse_chunks(endpoint, counted(response.iter_content(STREAM_CHUNK_SIZE)))
+        call_stats = (
+            time.perf_counter() - start,
+            response_bytes,
+            len(retries.history) if retries else 0,
+            get_wire_bytes(response),
+            response.headers.get("Content-Encoding"),
+        )
+        return root, call_stats
+
+    def _check_compression(self, content_encoding):
+        if self.compression and not content_encoding and not self._uncompressed_logged:
+            self._uncompressed_logged = True
+            logging.info("The service returned an uncompressed response, compression was not negotiated")
+
+    def _stream_timeseries_data(self, endpoint, request_data):
+        start = time.perf_counter()
+        try:
+            response = self._post_envelope(endpoint, request_data)
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.add_request(endpoint, request_data, time.perf_counter() - start, 0, 0, 0.0, None)
+            raise
+        latency = time.perf_counter() - start
+        retries = getattr(response.raw, "retries", None)
+        response_bytes = 0
+        parse_time = 0.0
+        first_row_time = None
+        rows = None
+
+        def counted(chunks):
+            nonlocal response_bytes
+            for chunk in chunks:
+                response_bytes += len(chunk)
+                yield chunk
+
+        try:
+            with self._reading_response(endpoint, request_data), response:
+                self._check_streamed_response(endpoint, request_data, response)
+                self._check_compression(response.headers.get("Content-Encoding"))
+                busy_since = time.perf_counter()
+                series, items = self.envelope_builder.stream_result(
+                    endpoint, counted(response.iter_content(STREAM_CHUNK_SIZE))
+                )
+                if not series:
+                    raise self._no_data_exception(endpoint, request_data)
+                row_mapper = self.get_row_mapper(endpoint, series, request_data.get("agregation"))
+                row_count = 0
+                for row in row_mapper.map_items(items):
+                    row_count += 1
+                    parse_time += time.perf_counter() - busy_since
+                    if first_row_time is None:
+                        first_row_time = time.perf_counter() - start
+                    yield row
+                    busy_since = time.perf_counter()
+                parse_time += time.perf_counter() - busy_since
+                if not row_count:
+                    raise self._no_data_exception(endpoint, request_data)
+                rows = row_count
+        finally:
+            if self.metrics is not None:
+                self.metrics.add_request(
+                    endpoint,
+                    request_data,
+                    latency,
+                    response_bytes,
+                    len(retries.history) if retries else 0,
+                    parse_time,
+                    rows,
+                    wire_bytes=get_wire_bytes(response),
+                    content_encoding=response.headers.get("Content-Encoding"),
+                    first_row_time=first_row_time,
+                )
+
+    @contextmanager
+    def _reading_response(self, endpoint, request_data):
+        """
+        Raises the errors of reading a streamed response as CepsClientException.
+        """
+        try:
+            yield
+        except EnvelopeException as envelope_exc:
+            raise CepsClientException(
+                f"Request for {endpoint} with request {request_data} failed. {envelope_exc}"
+            ) from envelope_exc
+        except (Timeout, RequestConnectionError, ChunkedEncodingError) as request_error:
+            if not self._is_timeout(request_error):
+                raise
+            raise CepsClientTimeoutException(
+                f"Reading the response for {endpoint} with request {request_data} timed out. {request_error}"
+            ) from request_error
+
+    def _post_envelope(self, endpoint, request_data):
+        """
+        Sends the request built without zeep and returns the response with the body not read yet.
+        """
+        try:
+            envelope = self.envelope_builder.build(endpoint, request_data)
+        except EnvelopeException as envelope_exc:
+            raise CepsClientException(
+                f"Invalid request for {endpoint} with request {request_data}. {envelope_exc}"
+            ) from envelope_exc
+        headers = {
+            "Content-Type": SOAP_CONTENT_TYPE,
+            "SOAPAction": f'"{self.envelope_builder.soap_actions[endpoint]}"',
+        }
+        try:
+            return self.transport.session.post(
+                self._service_url or self.envelope_builder.service_url,
+                data=envelope,
+                headers=headers,
+                timeout=self.transport.operation_timeout,
+                stream=True,
+            )
+        except CircuitOpenError as request_error:
+            # requests paused by the controller fail as failed intervals, exhausted retries fail the run
+            raise CepsClientException(
+                f"Request for {endpoint} with request {request_data} failed. {request_error}"
+            ) from request_error
+        except (Timeout, RequestConnectionError) as request_error:
+            if not self._is_timeout(request_error):
+                raise
+            raise CepsClientTimeoutException(
+                f"Request for {endpoint} with request {request_data} timed out. {request_error}"
+            ) from request_error
+
+    def _check_streamed_response(self, endpoint, request_data, response):
+        if response.status_code == 200:
+            return
+        # faults are returned with status 500 and are small, other errors are raised as they are
+        if response.status_code == 500:
+            self.envelope_builder.parse_result(endpoint, response.content)
+        response.raise_for_status()
+
+    def _call_operation(self, endpoint, request_data):
+        method_to_call = self._get_operation(endpoint)
+        try:
+            return method_to_call(**request_data)
         except TypeError as type_error:
             raise CepsClientException(
                 f"Invalid request for {endpoint} with request {request_data}. {type_error}"
             ) from type_error
-        xml = zeep.wsdl.utils.etree_to_string(response).decode()
-        response_data = xmltodict.parse(xml)
-        try:
-            data = response_data.get("root").get("data").get("item")
-            field_names = response_data.get("root").get("series").get("serie")
-            add_date = True
-            if endpoint == "OfferPrices":
-                add_date = False
-            data = self.replace_fieldnames(data, field_names, add_date)
-            data = self.add_granularity(granularity, data)
-            if endpoint == "OdhadovanaCenaOdchylky":
-                data = self.add_index(data)
-        except AttributeError as att_exc:
+        except CircuitOpenError as request_error:
+            # requests paused by the controller fail as failed intervals, exhausted retries fail the run
             raise CepsClientException(
-                f"No data returned for {endpoint} with request {request_data}. Try a different aggregation period"
-            ) from att_exc
+                f"Request for {endpoint} with request {request_data} failed. {request_error}"
+            ) from request_error
+        except (Timeout, RequestConnectionError) as request_error:
+            if not self._is_timeout(request_error):
+                raise
+            raise CepsClientTimeoutException(
+                f"Request for {endpoint} with request {request_data} timed out. {request_error}"
+            ) from request_error
+
+    @staticmethod
+    def _is_timeout(request_error):
+        """
+        Read timeouts are retried, so when the retries run out they are raised as a ConnectionError. A read timeout
+        of a streamed body is raised as a ConnectionError too.
+        """
+        if isinstance(request_error, Timeout):
+            return True
+        cause = request_error.args[0] if request_error.args else None
+        return isinstance(cause, ReadTimeoutError) or isinstance(getattr(cause, "reason", None), ReadTimeoutError)
+
+    @staticmethod
+    def parse_response(endpoint, request_data, response, columnar=False):
+        """
+        Returns list of rows with normalized column names and the granularity (and index) columns added.
 
-        return data
+        :param endpoint: name of the called endpoint
+        :param request_data: parameters of the request
+        :param response: root element of the response
+        :param columnar: return the rows as RowBatch, a sequence of the same rows stored column by column, when all
+            their columns are in the schema of the endpoint
+        """
+        series = get_series(response) if response is not None else None
+        if not series or not has_items(response):
+            raise CepsClient._no_data_exception(endpoint, request_data)
+        row_mapper = CepsClient.get_row_mapper(endpoint, series, request_data.get("agregation"))
+        if columnar and endpoint in ENDPOINT_COLUMNS:
+            row_batch = row_mapper.get_batch(response, ENDPOINT_COLUMNS[endpoint])
+            if row_batch is not None:
+                return row_batch
+        return list(row_mapper.iter_rows(response))
+
+    @staticmethod
+    def _no_data_exception(endpoint, request_data):
+        return CepsClientException(
+            f"No data returned for {endpoint} with request {request_data}. Try a different aggregation period"
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=ROW_MAPPER_CACHE_SIZE)
+    def get_row_mapper(endpoint, series, granularity):
+        """
+        Returns row mapper for the endpoint and series header, mappers are cached across intervals.
+
+        :param series: tuple of (id, name) tuples of the response series
+        """
+        field_names_dict = CepsClient.process_fieldnames(series, add_date=endpoint != "OfferPrices")
+        return RowMapper(field_names_dict, granularity, add_index=endpoint == "OdhadovanaCenaOdchylky")
 
     def get_data_version(self, endpoint):
-        method_to_call = getattr(self.client.service, endpoint)
+        method_to_call = self._get_operation(endpoint)
         response = method_to_call()
         xml = zeep.wsdl.utils.etree_to_string(response).decode()
         response_data = xmltodict.parse(xml)
         return response_data
 
-    def replace_fieldnames(self, data, field_names, add_date):
-        field_names_dict = self.process_fieldnames(field_names, add_date)
-        for i, datum in enumerate(data):
-            for field_name in field_names_dict:
-                if field_name in data[i]:
-                    data[i][field_names_dict[field_name]] = data[i].pop(field_name)
-        return data
-
     @staticmethod
-    def process_fieldnames(field_names, add_date):
+    def process_fieldnames(series, add_date):
+        """
+        Returns mapping of item attribute names to normalized column names.
+
+        :param series: list of (id, name) tuples of the response series
+        :param add_date: map the date attribute to the date column
+        """
         field_names_dict = {}
-        header_normalizer = DefaultHeaderNormalizer()
-        if not isinstance(field_names, list):
-            field_names = [field_names]
         if add_date:
-            field_names_dict["@date"] = "date"
-        for field_name in field_names:
-            normalized_name = header_normalizer._normalize_column_name(field_name["@name"]).lower()
-            normalized_name = COLUMN_NAME_OVERRIDES.get(normalized_name, normalized_name)
-            field_names_dict["@" + field_name["@id"]] = normalized_name
+            field_names_dict["date"] = "date"
+        for serie_id, serie_name in series:
+            field_names_dict[serie_id] = normalize_column_name(serie_name)
         return field_names_dict
 
-    @staticmethod
-    def add_granularity(granularity, data):
-        for i, d in enumerate(data):
-            data[i]["granularity"] = granularity
-        return data
-
-    def add_index(self, data):
-        for i, d in enumerate(data):
-            data[i]["ordered_index"] = i
-        return data
+
+@lru_cache(maxsize=1024)
+def normalize_column_name(name):
+    normalized_name = _HEADER_NORMALIZER._normalize_column_name(name).lower()
+    return COLUMN_NAME_OVERRIDES.get(normalized_name, normalized_name)
@@ -0,0 +1,115 @@
+"""
+Metadata of the CepsData endpoints, kept as Python literals so they are compiled with the package instead of being
+parsed on each start.
+"""
+
+# columns of the output table of each endpoint, the manifest schema and the minimal header of the CSV
+ENDPOINT_COLUMNS = {
+    "OfferPrices": (
+        "date",
+        "hour",
+        "unit",
+        "1",
+        "2",
+        "3",
+        "4",
+        "5",
+        "6",
+        "7",
+        "8",
+        "9",
+        "10",
+        "11",
+        "12",
+        "13",
+        "14",
+        "15",
+        "16",
+        "17",
+        "18",
+        "19",
+        "20",
+        "granularity",
+    ),
+    "Generation": (
+        "date",
+        "wpp_mw",
+        "npp_mw",
+        "pvpp_mw",
+        "ccgt_mw",
+        "altpp_mw",
+        "pspp_mw",
+        "hpp_mw",
+        "appp_mw",
+        "tpp_mw",
+        "granularity",
+    ),
+    "GenerationPlan": ("date", "generation_plan_mw", "granularity"),
+    "GenerationRES": ("date", "wpp_mw", "pvpp_mw", "granularity"),
+    "Load": ("date", "load_including_pumping_mw", "load_mw", "granularity"),
+    "OdhadovanaCenaOdchylky": ("date", "interval", "ordered_index", "estimated_price_kmwh", "granularity"),
+    "RegulationEnergy": (
+        "date",
+        "sc_gcc_sc_mw",
+        "mr5_mr15_mr30_mw",
+        "bm_mw",
+        "mr15_ru30_mw",
+        "international_re_mw",
+        "granularity",
+    ),
+    "RegulationEnergyB": ("date", "ostatn_operativn_vmny_mw", "granularity"),
+    "CrossborderPowerFlows": (
+        "date",
+        "pse_actual_mw",
+        "50hzt_planned_mw",
+        "ceps_actual_mw",
+        "apg_actual_mw",
+        "tennet_actual_mw",
+        "pse_planned_mw",
+        "50hzt_actual_mw",
+        "tennet_planned_mw",
+        "ceps_planned_mw",
+        "seps_actual_mw",
+        "seps_planned_mw",
+        "apg_planned_mw",
+        "granularity",
+    ),
+    "AktualniSystemovaOdchylkaCR": ("date", "aktualni_odchylka_mw", "granularity"),
+}
+
+PRIMARY_KEYS = {
+    "CrossborderPowerFlows": ("date",),
+    "Generation": ("date",),
+    "GenerationPlan": ("date",),
+    "Load": ("date",),
+    "RegulationEnergy": ("date",),
+    "RegulationEnergyB": ("date",),
+    "AktualniSystemovaOdchylkaCR": ("date",),
+    "OdhadovanaCenaOdchylky": ("interval", "date"),
+    "OfferPrices": ("hour", "date", "unit"),
+}
+
+# request parameters each endpoint accepts besides the dates, the other endpoints accept all of them
+REQUEST_PARAMETERS = {
+    "NepredvidatelneOdmitnuteNabidky": (),
+    "OdhadovanaCenaOdchylky": (),
+    "OfferPrices": (),
+    "AktualniSystemovaOdchylkaCR": ("granularity", "function"),
+    "RegulationEnergy": ("granularity", "function", "version"),
+    "RegulationEnergyB": ("granularity", "function", "version"),
+    "CrossborderPowerFlows": ("granularity", "function", "version"),
+    "GenerationPlan": ("granularity", "function", "version"),
+    "Load": ("granularity", "function", "version"),
+}
+DEFAULT_REQUEST_PARAMETERS = ("granularity", "function", "version", "para1")
+
+
+def get_request_options(endpoint, granularity="HR", function="AVG", version="RT"):
+    """
+    Returns the CepsClient.build_request_data options the endpoint accepts.
+    """
+    parameters = REQUEST_PARAMETERS.get(endpoint, DEFAULT_REQUEST_PARAMETERS)
+    values = {"granularity": granularity, "function": function, "version": version}
+    options = {parameter: values[parameter] for parameter in parameters if parameter in values}
+    options["add_para1"] = "para1" in parameters
+    return options
@@ -0,0 +1,176 @@
+"""
+SOAP envelopes of the CepsData operations built without zeep.
+
+The request element of every operation is a flat sequence of optional string parameters, so each envelope is
+precompiled from the WSDL into a prefix, a template per parameter (in the order of the sequence) and a suffix.
+The envelopes are byte for byte the same as the ones zeep sends.
+
+Responses are read either whole (parse_result), built from the chunks of the body as they are received
+(parse_chunks) or read incrementally item by item (stream_result).
+"""
+
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+from .parser import ITEM_TAG, SERIE_TAG, SERIES_TAG, STRUCTURED_DATA_NAMESPACE
+from .wsdl_cache import BUNDLED_WSDL_PATH, WSDL_NAMESPACE
+
+SOAP_ENVELOPE_NAMESPACE = "http://schemas.xmlsoap.org/soap/envelope/"
+SOAP_BINDING_NAMESPACE = "http://schemas.xmlsoap.org/wsdl/soap/"
+XML_SCHEMA_NAMESPACE = "http://www.w3.org/2001/XMLSchema"
+FAULT_TAG = f"{{{SOAP_ENVELOPE_NAMESPACE}}}Fault"
+
+ENVELOPE_PREFIX = (
+    "<?xml version='1.0' encoding='utf-8'?>\n"
+    f'<soap-env:Envelope xmlns:soap-env="{SOAP_ENVELOPE_NAMESPACE}"><soap-env:Body>'
+)
+ENVELOPE_SUFFIX = "</soap-env:Body></soap-env:Envelope>"
+
+# responses are read from the network, entities and DTDs are never resolved
+_RESPONSE_PARSER_OPTIONS = {"resolve_entities": False, "no_network": True, "huge_tree": True}
+_RESPONSE_PARSER = etree.XMLParser(**_RESPONSE_PARSER_OPTIONS)
+
+
+class EnvelopeException(Exception):
+    pass
+
+
+class EnvelopeBuilder:
+    """
+    Builds request envelopes and reads the result element of the responses for the operations of a CepsData WSDL.
+    """
+
+    def __init__(self, wsdl_path=BUNDLED_WSDL_PATH):
+        wsdl = etree.parse(wsdl_path, parser=etree.XMLParser(resolve_entities=False, no_network=True)).getroot()
+        self.target_namespace = wsdl.get("targetNamespace")
+        self.service_url = wsdl.find(f".//{{{SOAP_BINDING_NAMESPACE}}}address").get("location")
+        self.soap_actions = {
+            operation.getparent().get("name"): operation.get("soapAction")
+            for operation in wsdl.iterfind(f".//{{{WSDL_NAMESPACE}}}operation/{{{SOAP_BINDING_NAMESPACE}}}operation")
+        }
+        self._templates = {operation: self._compile_template(wsdl, operation) for operation in self.soap_actions}
+
+    def _compile_template(self, wsdl, operation):
+        """
+        Returns the envelope prefix, the templates of the parameters in the order of the sequence and the suffix.
+        """
+        schema_element = wsdl.find(
+            f".//{{{XML_SCHEMA_NAMESPACE}}}schema/{{{XML_SCHEMA_NAMESPACE}}}element[@name='{operation}']"
+        )
+        parameters = {}
+        if schema_element is not None:
+            for parameter in schema_element.iterfind(f".//{{{XML_SCHEMA_NAMESPACE}}}element"):
+                name = parameter.get("name")
+                parameters[name] = f"<ns0:{name}>{{}}</ns0:{name}>"
+        prefix = f'{ENVELOPE_PREFIX}<ns0:{operation} xmlns:ns0="{self.target_namespace}">'
+        suffix = f"</ns0:{operation}>{ENVELOPE_SUFFIX}"
+        return prefix, parameters, suffix
+
+    def build(self, operation, request_data):
+        """
+        Returns the utf-8 encoded envelope of the operation call with the request_data parameters.
+        """
+        try:
+            prefix, parameters, suffix = self._templates[operation]
+        except KeyError:
+            raise EnvelopeException(f"Unknown operation {operation}") from None
+        unknown = set(request_data).difference(parameters)
+        if unknown:
+            raise EnvelopeException(f"{operation} got unexpected parameters {sorted(unknown)}")
+
+        body = "".join(
+            template.format(escape(str(request_data[name])))
+            for name, template in parameters.items()
+            if request_data.get(name) is not None
+        )
+        return (prefix + body + suffix).encode("utf-8")
+
+    def parse_result(self, operation, content):
+        """
+        Returns the structured data root element of the response or None if the result is empty.
+        Raises EnvelopeException with the fault string if the response is a SOAP fault.
+        """
+        try:
+            envelope = etree.fromstring(content, parser=_RESPONSE_PARSER)
+        except etree.XMLSyntaxError as syntax_err:
+            raise EnvelopeException(f"Invalid {operation} response: {syntax_err}") from syntax_err
+        return self._find_result(operation, envelope)
+
+    def parse_chunks(self, operation, chunks):
+        """
+        Returns the same element as parse_result from an iterable of byte chunks of the response. The tree is built
+        while the chunks are received, so the body is never kept whole.
+        """
+        parser = etree.XMLParser(**_RESPONSE_PARSER_OPTIONS)
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+            envelope = parser.close()
+        except etree.XMLSyntaxError as syntax_err:
+            raise EnvelopeException(f"Invalid {operation} response: {syntax_err}") from syntax_err
+        return self._find_result(operation, envelope)
+
+    def _find_result(self, operation, envelope):
+        body = envelope.find(f"{{{SOAP_ENVELOPE_NAMESPACE}}}Body")
+        if body is None:
+            raise EnvelopeException(f"Invalid {operation} response: missing SOAP body")
+        fault = body.find(f"{{{SOAP_ENVELOPE_NAMESPACE}}}Fault")
+        if fault is not None:
+            raise EnvelopeException(f"{operation} failed: {fault.findtext('faultstring')}")
+
+        namespace = self.target_namespace
+        return body.find(
+            f"{{{namespace}}}{operation}Response/{{{namespace}}}{operation}Result/{{{STRUCTURED_DATA_NAMESPACE}}}root"
+        )
+
+    def stream_result(self, operation, chunks):
+        """
+        Reads the response from an iterable of byte chunks. Returns tuple of (id, name) tuples of the series and an
+        iterator of the data items. The body is parsed only as far as the items are consumed and each item is
+        released when the next one is read, so the memory used does not depend on the size of the response.
+        Raises EnvelopeException if the response is a SOAP fault or is not valid XML.
+        """
+        events = self._iter_events(operation, chunks)
+        series = []
+        for element in events:
+            if element.tag == SERIE_TAG:
+                series.append((element.get("id"), element.get("name")))
+            elif element.tag == SERIES_TAG:
+                break
+        return tuple(series), self._iter_items(events)
+
+    @staticmethod
+    def _iter_items(events):
+        for element in events:
+            if element.tag != ITEM_TAG:
+                continue
+            yield element
+            element.clear()
+            # drop the already mapped items from the data element
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    @staticmethod
+    def _iter_events(operation, chunks):
+        """
+        Yields the serie, series and item elements as they are closed while the chunks are parsed.
+        """
+        parser = etree.XMLPullParser(
+            events=("end",), tag=(SERIE_TAG, SERIES_TAG, ITEM_TAG, FAULT_TAG), **_RESPONSE_PARSER_OPTIONS
+        )
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+                yield from EnvelopeBuilder._read_elements(operation, parser)
+            parser.close()
+            yield from EnvelopeBuilder._read_elements(operation, parser)
+        except etree.XMLSyntaxError as syntax_err:
+            raise EnvelopeException(f"Invalid {operation} response: {syntax_err}") from syntax_err
+
+    @staticmethod
+    def _read_elements(operation, parser):
+        for _, element in parser.read_events():
+            if element.tag == FAULT_TAG:
+                raise EnvelopeException(f"{operation} failed: {element.findtext('faultstring')}")
+            yield element
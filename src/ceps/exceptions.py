@@ -0,0 +1,6 @@
+class CepsClientException(Exception):
+    pass
+
+
+class CepsClientTimeoutException(CepsClientException):
+    pass
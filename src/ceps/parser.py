@@ -0,0 +1,144 @@
+"""
+Parsing of the structured data returned by the CepsData service.
+
+Each response is a ``root`` element with a list of series (column definitions) and a list of data items:
+
+    <root xmlns="https://www.ceps.cz/CepsData/StructuredData/1.0">
+        <series><serie id="value1" name="TPP [MW]" />...</series>
+        <data><item date="2026-01-01T00:00:00+01:00" value1="2359" ... />...</data>
+    </root>
+
+The rows are read directly from the element tree zeep already built, no intermediate serialization is done. They are
+mapped to row dicts one by one, or for endpoints with a known schema to a columnar RowBatch (see ceps.batch).
+"""
+
+STRUCTURED_DATA_NAMESPACE = "https://www.ceps.cz/CepsData/StructuredData/1.0"
+
+SERIES_TAG = f"{{{STRUCTURED_DATA_NAMESPACE}}}series"
+SERIE_TAG = f"{{{STRUCTURED_DATA_NAMESPACE}}}serie"
+ITEM_TAG = f"{{{STRUCTURED_DATA_NAMESPACE}}}item"
+
+SERIES_PATH = f"{{{STRUCTURED_DATA_NAMESPACE}}}series/{{{STRUCTURED_DATA_NAMESPACE}}}serie"
+ITEMS_PATH = f"{{{STRUCTURED_DATA_NAMESPACE}}}data/{{{STRUCTURED_DATA_NAMESPACE}}}item"
+
+
+def get_series(root):
+    """
+    Returns tuple of (id, name) tuples of the series defined in the response.
+    """
+    return tuple((serie.get("id"), serie.get("name")) for serie in root.iterfind(SERIES_PATH))
+
+
+def has_items(root):
+    return root.find(ITEMS_PATH) is not None
+
+
+class RowMapper:
+    """
+    Maps response items to finished rows, meant to be compiled once per endpoint and series header.
+
+    Attributes listed in field_names_dict are renamed, the rest is kept with an "@" prefix (as xmltodict used to
+    name them). The attributes that are not renamed come first (in document order), followed by the renamed ones
+    in the order of field_names_dict. The granularity column (and the ordered_index column with the position of
+    the item in the response) is added to each row.
+
+    The layout of the row is resolved once for each distinct set of item attributes, in practice all items of
+    an endpoint share one, so each row is then built by a single dict(zip()) call.
+    """
+
+    def __init__(self, field_names_dict, granularity, add_index=False):
+        """
+
+        :param field_names_dict: mapping of item attribute names to column names
+        :param granularity: value of the granularity column
+        :param add_index: add ordered_index column with the position of the item in the response
+        """
+        self.field_names_dict = field_names_dict
+        self.granularity = granularity
+        self.add_index = add_index
+        self._layouts = {}
+
+    def iter_rows(self, root):
+        return self.map_items(root.iterfind(ITEMS_PATH))
+
+    def map_items(self, items):
+        """
+        Maps the items one by one, so they can be released as soon as their row is built.
+        """
+        granularity = self.granularity
+        add_index = self.add_index
+        layouts = self._layouts
+        for index, item in enumerate(items):
+            signature = tuple(item.keys())
+            layout = layouts.get(signature)
+            if layout is None:
+                layout = layouts[signature] = self._compile_layout(signature)
+            columns, positions = layout
+
+            values = item.values()
+            if positions is not None:
+                values = [values[position] for position in positions]
+            row = dict(zip(columns, values))
+            row["granularity"] = granularity
+            if add_index:
+                row["ordered_index"] = index
+            yield row
+
+    def get_batch(self, root, known_columns):
+        return self.map_batch(root.iterfind(ITEMS_PATH), known_columns)
+
+    def map_batch(self, items, known_columns):
+        """
+        Returns RowBatch of the rows of the items, or None when the items do not all have the same attributes or
+        a column of the rows is not in known_columns. The items are then mapped by map_items.
+
+        :param known_columns: columns of the schema of the endpoint
+        """
+        # numpy is imported only when the rows are stored in batches
+        from .batch import ConstantColumn, IndexColumn, RowBatch, parse_column
+
+        signature = None
+        # the values of all the items in one list, the values of a column are then a slice with the item width as step
+        values = []
+        for item in items:
+            if signature is None:
+                signature = item.keys()
+                layout = self._layouts.get(tuple(signature))
+                if layout is None:
+                    layout = self._layouts[tuple(signature)] = self._compile_layout(tuple(signature))
+                columns, positions = layout
+                row_columns = {*columns, "granularity", *(("ordered_index",) if self.add_index else ())}
+                if not row_columns.issubset(known_columns):
+                    return None
+            elif item.keys() != signature:
+                return None
+            values.extend(item.values())
+        if not signature:
+            return None
+
+        width = len(signature)
+        length = len(values) // width
+        batch_columns = {}
+        for column, position in zip(columns, positions or range(width)):
+            batch_columns[column] = parse_column(column, values[position::width])
+        batch_columns["granularity"] = ConstantColumn(self.granularity, length)
+        if self.add_index:
+            batch_columns["ordered_index"] = IndexColumn(length)
+        return RowBatch(batch_columns, length)
+
+    def _compile_layout(self, signature):
+        """
+        Returns column names and positions of their values in the item attributes, positions are None when the
+        values are already in the order of the columns.
+        """
+        layout = {"@" + name: position for position, name in enumerate(signature) if name not in self.field_names_dict}
+        attribute_positions = {name: position for position, name in enumerate(signature)}
+        for field_name, column_name in self.field_names_dict.items():
+            if field_name in attribute_positions:
+                layout[column_name] = attribute_positions[field_name]
+
+        columns = tuple(layout)
+        positions = tuple(layout.values())
+        if positions == tuple(range(len(signature))):
+            positions = None
+        return columns, positions
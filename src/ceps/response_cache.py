@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from lxml import etree
+
+from .parser import get_series, has_items
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(tempfile.gettempdir(), "ceps_response_cache")
+DEFAULT_MAX_SIZE_MB = 512
+DEFAULT_CLOSED_AFTER_DAYS = 7
+DEFAULT_RECENT_TTL_MINUTES = 15
+
+ENTRY_SUFFIX = ".xml.gz"
+
+
+class ResponseCache:
+    """
+    On-disk cache of CepsData responses keyed by the endpoint and the request parameters.
+
+    Intervals that ended more than ``closed_after_days`` before the fetch are closed: their data are not revised
+    anymore, so the cached response never expires. Responses of open or recent intervals, and responses without
+    data (which may be published late), expire after ``recent_ttl_minutes``. When the total size of the cache exceeds
+    ``max_size_mb``, the least recently used entries are evicted. Writes are best effort, a response that cannot be
+    written is not cached.
+
+    Each entry is a gzip file with a JSON metadata line followed by the XML of the response root element.
+    """
+
+    def __init__(
+        self,
+        cache_directory=DEFAULT_CACHE_DIRECTORY,
+        max_size_mb=DEFAULT_MAX_SIZE_MB,
+        closed_after_days=DEFAULT_CLOSED_AFTER_DAYS,
+        recent_ttl_minutes=DEFAULT_RECENT_TTL_MINUTES,
+    ):
+        self.cache_directory = cache_directory
+        self.max_size = max_size_mb * 1024 * 1024
+        self.closed_after = timedelta(days=closed_after_days)
+        self.recent_ttl = recent_ttl_minutes * 60
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        os.makedirs(cache_directory, exist_ok=True)
+        self._sizes = {
+            entry.path: entry.stat().st_size
+            for entry in os.scandir(cache_directory)
+            if entry.name.endswith(ENTRY_SUFFIX)
+        }
+
+    def get(self, endpoint, request_data):
+        """
+        Returns the cached response root element or None if it is not cached or expired.
+        """
+        path = self._get_entry_path(endpoint, request_data)
+        response = self._read_entry(path)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def put(self, endpoint, request_data, response):
+        path = self._get_entry_path(endpoint, request_data)
+        never_expires = self._is_closed(request_data) and self._has_data(response)
+        meta = {"expires_at": None if never_expires else time.time() + self.recent_ttl}
+        content = json.dumps(meta).encode("utf-8") + b"\n" + etree.tostring(response)
+
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_directory)
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(gzip.compress(content, compresslevel=1))
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as write_exc:
+            logging.warning(f"Failed to write the response of {endpoint} to the response cache: {write_exc}")
+            if tmp_path is not None:
+                self._delete_file(tmp_path)
+            return
+
+        with self._lock:
+            self._sizes[path] = size
+            self._evict()
+
+    def log_statistics(self):
+        logging.info(f"Response cache: {self.hits} hits, {self.misses} misses, {self.evictions} evicted entries")
+
+    def _read_entry(self, path):
+        try:
+            with gzip.open(path, "rb") as entry_file:
+                meta = json.loads(entry_file.readline())
+                expires_at = meta.get("expires_at")
+                if expires_at is not None and expires_at < time.time():
+                    self._remove(path)
+                    return None
+                response = etree.fromstring(entry_file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, etree.XMLSyntaxError) as read_exc:
+            logging.debug(f"Invalid response cache entry {path}: {read_exc}")
+            self._remove(path)
+            return None
+
+        try:
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        return response
+
+    @staticmethod
+    def _has_data(response):
+        return bool(get_series(response)) and has_items(response)
+
+    def _is_closed(self, request_data):
+        try:
+            date_to = datetime.fromisoformat(request_data.get("dateTo"))
+        except (TypeError, ValueError):
+            return False
+        return date_to < datetime.now() - self.closed_after
+
+    def _evict(self):
+        total_size = sum(self._sizes.values())
+        if total_size <= self.max_size:
+            return
+        for path in sorted(self._sizes, key=self._get_last_used):
+            total_size -= self._sizes.pop(path)
+            self._delete_file(path)
+            self.evictions += 1
+            if total_size <= self.max_size:
+                break
+
+    def _remove(self, path):
+        with self._lock:
+            self._sizes.pop(path, None)
+        self._delete_file(path)
+
+    @staticmethod
+    def _delete_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _get_last_used(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0
+
+    def _get_entry_path(self, endpoint, request_data):
+        key = json.dumps({"endpoint": endpoint, **request_data}, sort_keys=True, default=str)
+        return os.path.join(self.cache_directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ENTRY_SUFFIX)
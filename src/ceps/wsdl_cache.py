@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from lxml import etree
+
+WSDL_NAMESPACE = "http://schemas.xmlsoap.org/wsdl/"
+
+# bump when the layout of the cached entry changes, older entries are then treated as invalid
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_TTL = 7 * 24 * 60 * 60
+DEFAULT_CACHE_DIRECTORY = os.path.join(tempfile.gettempdir(), "ceps_wsdl_cache")
+BUNDLED_WSDL_PATH = os.path.join(os.path.dirname(__file__), "wsdl", "CepsData.wsdl")
+BUNDLED_SOURCE = "bundled"
+
+WSDL_FILE_NAME = "CepsData.wsdl"
+META_FILE_NAME = "CepsData.json"
+
+
+class WsdlCache:
+    """
+    Persistent, versioned on-disk cache of the CepsData WSDL document.
+
+    The cache directory holds a single WSDL entry together with a metadata file (format version, source,
+    time of fetch and sha256 of the content). An empty cache is seeded from the snapshot bundled with the
+    component, so a fresh container does not need to download the WSDL at all. The bundled snapshot does not
+    expire by its age, as the cache is empty in every fresh container: it is replaced when it lacks an operation
+    (see CepsClient._get_operation) or cannot be loaded. A fetched entry older than ``ttl`` seconds, or any entry
+    with a different format version or with content not matching its hash, is considered stale or invalid and is
+    replaced by a live fetch. When the live fetch fails, a stale entry is still used.
+    """
+
+    def __init__(self, cache_directory=DEFAULT_CACHE_DIRECTORY, ttl=DEFAULT_CACHE_TTL, bundled_path=BUNDLED_WSDL_PATH):
+        """
+
+        :param cache_directory: Directory where the cached WSDL is kept between runs
+        :param ttl: Max age of a fetched entry in seconds
+        :param bundled_path: Path to the WSDL snapshot used to seed an empty cache. None disables seeding.
+        """
+        self.cache_directory = cache_directory
+        self.ttl = ttl
+        self.bundled_path = bundled_path
+        self.wsdl_path = os.path.join(cache_directory, WSDL_FILE_NAME)
+        self.meta_path = os.path.join(cache_directory, META_FILE_NAME)
+
+    def get_location(self, fetch_wsdl):
+        """
+        Returns path to a valid cached WSDL. Stale or invalid entries are refreshed using fetch_wsdl.
+
+        :param fetch_wsdl: Callable returning the live WSDL content as bytes
+        :return: Path to the cached WSDL file or None if neither the cache nor the live fetch provide a valid WSDL
+        """
+        if not self._has_entry() and self.bundled_path:
+            self._seed_from_bundle()
+
+        if self.is_valid():
+            return self.wsdl_path
+
+        logging.debug("Cached WSDL is stale or invalid, fetching a fresh copy")
+        location = self.refresh(fetch_wsdl)
+        if location is None and self._is_intact():
+            logging.warning("Using the stale cached WSDL, a fresh copy could not be fetched")
+            return self.wsdl_path
+        return location
+
+    def refresh(self, fetch_wsdl):
+        """
+        Replaces the cached entry with a live copy of the WSDL.
+
+        :param fetch_wsdl: Callable returning the live WSDL content as bytes
+        :return: Path to the cached WSDL file or None if the live content could not be fetched or is invalid
+        """
+        try:
+            content = fetch_wsdl()
+        except Exception as fetch_exc:
+            logging.warning(f"Failed to fetch WSDL: {fetch_exc}")
+            return None
+
+        if not self._is_wsdl(content):
+            logging.warning("Fetched WSDL is not a valid WSDL document, it will not be cached")
+            return None
+
+        self._store(content, source="live")
+        return self.wsdl_path
+
+    def is_valid(self):
+        meta = self._read_meta()
+        if not meta:
+            return False
+        if meta.get("source") != BUNDLED_SOURCE and time.time() - meta.get("fetched_at", 0) > self.ttl:
+            return False
+        return self._is_intact(meta)
+
+    def _is_intact(self, meta=None):
+        """
+        Returns True when the entry has the current format and its content matches its hash, regardless of its age.
+        """
+        meta = meta or self._read_meta()
+        if not meta or meta.get("version") != CACHE_FORMAT_VERSION:
+            return False
+        try:
+            with open(self.wsdl_path, "rb") as wsdl_file:
+                content = wsdl_file.read()
+        except OSError:
+            return False
+        return hashlib.sha256(content).hexdigest() == meta.get("sha256")
+
+    def _has_entry(self):
+        return os.path.exists(self.meta_path)
+
+    def _seed_from_bundle(self):
+        try:
+            with open(self.bundled_path, "rb") as bundled_file:
+                content = bundled_file.read()
+        except OSError:
+            logging.debug(f"Bundled WSDL snapshot {self.bundled_path} is not available")
+            return
+        if self._is_wsdl(content):
+            self._store(content, source=BUNDLED_SOURCE)
+
+    def _store(self, content, source):
+        meta = {
+            "version": CACHE_FORMAT_VERSION,
+            "source": source,
+            "fetched_at": time.time(),
+            "sha256": hashlib.sha256(content).hexdigest(),
+        }
+        try:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            self._write_atomic(self.wsdl_path, content)
+            self._write_atomic(self.meta_path, json.dumps(meta).encode("utf-8"))
+        except OSError as write_exc:
+            logging.warning(f"Failed to write WSDL cache to {self.cache_directory}: {write_exc}")
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_atomic(self, path, content):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_directory)
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _is_wsdl(content):
+        try:
+            root = etree.fromstring(content)
+        except (etree.XMLSyntaxError, ValueError):
+            return False
+        return root.tag == f"{{{WSDL_NAMESPACE}}}definitions"
@@ -0,0 +1,203 @@
+"""
+Checkpoints of long backfills.
+
+The output tables of a run are written in the data folder of the job, which is discarded when the run fails, and
+the state is not saved either. A checkpoint therefore keeps the rows of each completed interval in a work directory
+outside of the data folder, so a run that failed is resumed by the next run of the same configuration: the
+completed intervals are written from the checkpoint instead of being fetched again.
+
+Each configuration (dates and endpoints) has its own directory:
+
+    <directory>/<fingerprint>/completed.jsonl      one line per completed interval
+    <directory>/<fingerprint>/parts/<id>.jsonl.gz  rows of the completed interval, one JSON object per line
+
+The part is complete before its interval is appended to completed.jsonl, so an interrupted write only loses that
+interval. The directory is removed when the run succeeds.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections.abc import Sequence
+
+DEFAULT_CHECKPOINT_DIRECTORY = os.path.join(tempfile.gettempdir(), "ceps_checkpoints")
+# checkpoints of configurations that did not run for this long are removed
+DEFAULT_MAX_AGE_DAYS = 7
+COMPLETED_FILE_NAME = "completed.jsonl"
+PARTS_DIRECTORY = "parts"
+PART_SUFFIX = ".jsonl.gz"
+# parts are written often and read at most once, so they are compressed fast
+PART_COMPRESSLEVEL = 1
+# names of the checkpoint directories, other entries of the directory are never removed
+FINGERPRINT_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+class Checkpoint:
+    """
+    Completed intervals of a configuration and their rows, by the key of the endpoint (name, granularity and
+    function) and the start and end of the interval. Safe to use from several threads.
+    """
+
+    def __init__(self, fingerprint, directory=DEFAULT_CHECKPOINT_DIRECTORY, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        """
+
+        :param fingerprint: identifies the configuration, see get_fingerprint
+        :param directory: directory kept between the runs, shared by the checkpoints of all configurations
+        :param max_age_days: checkpoints of other configurations not modified for this long are removed
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, fingerprint)
+        self.resumed_intervals = 0
+        self.resumed_rows = 0
+        self.recorded_intervals = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.path, PARTS_DIRECTORY), exist_ok=True)
+        # the age of a checkpoint is the time of the last run that used it
+        os.utime(self.path)
+        self._remove_expired(max_age_days)
+        self._completed = self._read_completed()
+        if self._completed:
+            logging.info(f"Resuming from the checkpoint of a previous run, {len(self._completed)} intervals completed")
+
+    @staticmethod
+    def get_fingerprint(parameters):
+        """
+        Returns the fingerprint of the parameters that decide the intervals of the run and their rows.
+        """
+        return hashlib.sha256(json.dumps(parameters, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+    def is_completed(self, key, interval):
+        return self._interval_id(key, interval) in self._completed
+
+    def read_rows(self, key, interval):
+        """
+        Returns list of the rows of the completed interval.
+        """
+        with gzip.open(self._part_path(self._interval_id(key, interval)), "rt", encoding="utf-8") as part_file:
+            rows = [json.loads(line) for line in part_file]
+        with self._lock:
+            self.resumed_intervals += 1
+            self.resumed_rows += len(rows)
+        return rows
+
+    def open_part(self, key, interval, writer):
+        """
+        Returns CheckpointPart recording the rows of the interval written through it to the writer, see its
+        documentation for how the interval is completed.
+        """
+        return CheckpointPart(self, self._interval_id(key, interval), writer)
+
+    def clear(self):
+        """
+        Removes the checkpoint, called when the run succeeded.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._completed = set()
+
+    def log_statistics(self):
+        logging.info(
+            f"Checkpoint: {self.resumed_intervals} intervals ({self.resumed_rows} rows) resumed from a previous run, "
+            f"{self.recorded_intervals} intervals recorded"
+        )
+
+    def _complete(self, interval_id):
+        with self._lock:
+            with open(os.path.join(self.path, COMPLETED_FILE_NAME), "a", encoding="utf-8") as completed_file:
+                completed_file.write(json.dumps(interval_id) + "\n")
+            self._completed.add(interval_id)
+            self.recorded_intervals += 1
+
+    def _read_completed(self):
+        completed = set()
+        try:
+            with open(os.path.join(self.path, COMPLETED_FILE_NAME), encoding="utf-8") as completed_file:
+                for line in completed_file:
+                    try:
+                        interval_id = json.loads(line)
+                    except ValueError:
+                        # the last line of a run that was killed while writing it
+                        continue
+                    if os.path.exists(self._part_path(interval_id)):
+                        completed.add(interval_id)
+        except FileNotFoundError:
+            pass
+        return completed
+
+    def _remove_expired(self, max_age_days):
+        """
+        Removes the expired checkpoints of other configurations, the directory may be shared with other data.
+        """
+        expire_before = time.time() - max_age_days * 24 * 60 * 60
+        for entry in os.scandir(self.directory):
+            if (
+                entry.path != self.path
+                and FINGERPRINT_PATTERN.fullmatch(entry.name)
+                and entry.is_dir(follow_symlinks=False)
+                and os.path.isdir(os.path.join(entry.path, PARTS_DIRECTORY))
+                and entry.stat().st_mtime < expire_before
+            ):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _part_path(self, interval_id):
+        part_name = hashlib.sha256(interval_id.encode("utf-8")).hexdigest()[:32] + PART_SUFFIX
+        return os.path.join(self.path, PARTS_DIRECTORY, part_name)
+
+    @staticmethod
+    def _interval_id(key, interval):
+        return f"{key}/{interval['start_date']}/{interval['end_date']}"
+
+
+class CheckpointPart:
+    """
+    Writer recording the rows written through it to the part of an interval, used as a context manager. The
+    interval is completed on exit when completed was set, otherwise (it failed or an exception was raised) the part
+    is discarded. Other attributes are those of the wrapped writer.
+    """
+
+    def __init__(self, checkpoint, interval_id, writer):
+        self.checkpoint = checkpoint
+        self.interval_id = interval_id
+        self.writer = writer
+        self.completed = False
+        self._part_path = checkpoint._part_path(interval_id)
+        self._part_file = gzip.open(self._part_path + ".tmp", "wt", compresslevel=PART_COMPRESSLEVEL, encoding="utf-8")
+
+    def writerow(self, row_dict: dict):
+        self.writerows((row_dict,))
+
+    def writerows(self, row_dicts):
+        if isinstance(row_dicts, Sequence):
+            # lists and row batches are recorded first, so the writer still gets them whole
+            self._record(row_dicts)
+            self.writer.writerows(row_dicts)
+        else:
+            self.writer.writerows(self._recorded(row_dicts))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._part_file.close()
+        if self.completed and exc_type is None:
+            os.replace(self._part_path + ".tmp", self._part_path)
+            self.checkpoint._complete(self.interval_id)
+        else:
+            os.remove(self._part_path + ".tmp")
+
+    def _record(self, row_dicts):
+        self._part_file.writelines(json.dumps(row_dict) + "\n" for row_dict in row_dicts)
+
+    def _recorded(self, row_dicts):
+        for row_dict in row_dicts:
+            self._part_file.write(json.dumps(row_dict) + "\n")
+            yield row_dict
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
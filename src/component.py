@@ -1,15 +1,25 @@
-import json
 import logging
 import os
+import shutil
 import tempfile
+import threading
 import warnings
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
 
-import keboola.utils.date as dutils
 from keboola.component.base import ComponentBase
 from keboola.component.exceptions import UserException
 
-from ceps import CepsClient, CepsClientException
-from csv_tools import CachedOrthogonalDictWriter
+from aggregation import NATIVE_GRANULARITY, LocalAggregationClient, can_aggregate
+from ceps import CepsClientException
+from ceps.endpoints import ENDPOINT_COLUMNS, PRIMARY_KEYS
+from checkpoint import Checkpoint
+from csv_tools import CachedOrthogonalDictWriter, SlicedCsvWriter
+from deduplication import DeduplicatingWriter
+from metrics import PROFILE_MODES, RunMetrics, profiled
+from offer_prices import OFFER_PRICES_ENDPOINT, BatchedOfferPricesClient
+from revisions import UnchangedDaysWriter
 
 KEY_DATE_FROM = "date_from"
 KEY_DATE_TO = "date_to"
@@ -18,8 +28,46 @@ KEY_ENDPOINTS = "endpoints"
 KEY_ENDPOINT_NAME = "endpoint_name"
 KEY_ENDPOINT_GRANULARITY = "granularity"
 KEY_CONTINUE_ON_FAIL = "continue_on_fail"
+KEY_MAX_WORKERS = "max_workers"
+KEY_INCREMENTAL_FETCH = "incremental_fetch"
+KEY_INCREMENTAL_OVERLAP_HOURS = "incremental_overlap_hours"
+KEY_SKIP_UNCHANGED_DAYS = "skip_unchanged_days"
+KEY_TARGET_ROWS_PER_REQUEST = "target_rows_per_request"
+KEY_SPLIT_FAILED_INTERVALS = "split_failed_intervals"
+KEY_REQUEST_TIMEOUT = "request_timeout"
+KEY_OFFER_PRICES_DAYS_PER_REQUEST = "offer_prices_days_per_request"
+KEY_WRITE_METRICS = "write_metrics"
+KEY_SLICED_OUTPUT = "sliced_output"
+KEY_SLICE_ROWS = "slice_rows"
+KEY_STREAM_ROWS = "stream_rows"
+KEY_DEDUPLICATE_ROWS = "deduplicate_rows"
+KEY_LOCAL_AGGREGATION = "local_aggregation"
+KEY_ADAPTIVE_CONCURRENCY = "adaptive_concurrency"
+KEY_RETRY_BUDGET = "retry_budget"
+KEY_CIRCUIT_BREAKER_FAILURES = "circuit_breaker_failures"
+KEY_COLUMNAR_ROWS = "columnar_rows"
+
+KEY_RESPONSE_CACHE = "response_cache"
+KEY_RESPONSE_CACHE_ENABLED = "enabled"
+KEY_RESPONSE_CACHE_DIRECTORY = "directory"
+KEY_RESPONSE_CACHE_MAX_SIZE_MB = "max_size_mb"
+KEY_RESPONSE_CACHE_CLOSED_AFTER_DAYS = "closed_after_days"
+KEY_RESPONSE_CACHE_RECENT_TTL_MINUTES = "recent_ttl_minutes"
+
+KEY_HTTP_TRANSPORT = "http_transport"
+KEY_HTTP_TRANSPORT_POOL_SIZE = "pool_size"
+KEY_HTTP_TRANSPORT_COMPRESSION = "compression"
+KEY_HTTP_TRANSPORT_STREAM_RESPONSES = "stream_responses"
+
+KEY_CHECKPOINT = "checkpoint"
+KEY_CHECKPOINT_ENABLED = "enabled"
+KEY_CHECKPOINT_DIRECTORY = "directory"
+# parameters deciding the intervals of a run and their rows, a checkpoint is resumed by runs with the same values
+CHECKPOINT_PARAMETERS = (KEY_DATE_FROM, KEY_DATE_TO, KEY_ENDPOINTS)
 
 KEY_STATE_ENDPOINT_COLUMNS = "endpoint_columns"
+KEY_STATE_WATERMARKS = "watermarks"
+KEY_STATE_DAY_HASHES = "day_hashes"
 
 # not implemented in UI, for case of further implementation
 KEY_ENDPOINT_FUNCTION = "function"
@@ -27,52 +75,261 @@ KEY_ENDPOINT_FUNCTION = "function"
 REQUIRED_PARAMETERS = [KEY_DATE_FROM, KEY_DATE_TO]
 REQUIRED_IMAGE_PARS = []
 
+# image parameter enabling profiling of the run, one of metrics.PROFILE_MODES
+KEY_PROFILE = "profile"
+METRICS_FILE_NAME = "metrics.json"
+
+MAX_WORKERS_LIMIT = 16
+# with adaptive concurrency, requests slower than this share of the request timeout reduce the concurrency
+ADAPTIVE_LATENCY_TARGET_RATIO = 0.5
+# RT data are revised for some time after publishing, so incremental fetch re-reads this many hours by default
+DEFAULT_INCREMENTAL_OVERLAP_HOURS = 24
+
+DEFAULT_CHUNK_DAYS = 30
+MAX_CHUNK_DAYS = 365
+# number of rows one series returns per day in the given granularity
+GRANULARITY_ROWS_PER_DAY = {"MI": 1440, "QH": 96, "HR": 24, "DY": 1}
+# failed intervals are split in halves until they are shorter than twice this
+MIN_SPLIT_INTERVAL = timedelta(days=1)
+MAX_OFFER_PRICES_DAYS_PER_REQUEST = 31
+
+INTERVAL_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+DAY_INTERVAL_DATE_FORMAT = "%Y-%m-%d"
+
 warnings.filterwarnings(
     "ignore",
     message="The localize method is no longer necessary, as this time zone supports the fold attribute",
 )
 
 
+class PartialIntervalException(CepsClientException):
+    """
+    Raised when only some parts of a split interval were fetched, rows holds the data of the fetched ones.
+    """
+
+    def __init__(self, message, rows):
+        super().__init__(message)
+        self.rows = rows
+
+
 class Component(ComponentBase):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, data_path_override=None, shared_client=None):
+        """
+
+        :param data_path_override: data folder of the configuration, see ComponentBase
+        :param shared_client: client shared with the runs of other configurations (see batch_runner), a client is
+            created for the run by default
+        """
+        super().__init__(data_path_override=data_path_override)
+        self._shared_client = shared_client
         self._writer_cache = dict()
         self.tables = []
+        self._watermarks = {}
+        self._split_failed_intervals = False
+        self._sliced_output = False
+        self._slice_rows = None
+        self._stream_rows = False
+        self._deduplicate_rows = False
+        self._checkpoint = None
+        # hashes of the days written by the previous run by the watermark key, None unless unchanged days are skipped
+        self._previous_day_hashes = None
+        self._unchanged_days_writers = {}
 
     def run(self):
         self.validate_configuration_parameters(REQUIRED_PARAMETERS)
         self.validate_image_parameters(REQUIRED_IMAGE_PARS)
-        params = self.configuration.parameters
-        endpoint_definition = self.get_endpoint_defintion()
+        profile_mode = self.get_profile_mode(self.configuration.image_parameters)
+        with profiled(profile_mode, self.artifacts_out_path):
+            self.extract(self.configuration.parameters)
 
-        continue_on_fail = params.get(KEY_CONTINUE_ON_FAIL, True)
+    def extract(self, params):
+        # zeep, requests and lxml are imported only when the configuration is valid and data are fetched
+        from ceps import CepsClient, WsdlCache
+
+        metrics = RunMetrics()
+        # each run gets its own lists, the writers extend them with new columns
+        endpoint_columns_by_name = {name: list(columns) for name, columns in ENDPOINT_COLUMNS.items()}
 
-        intervals = self.get_date_intervals(params)
-        day_intervals = self.get_date_intervals(params, day_intervals=True)
+        continue_on_fail = params.get(KEY_CONTINUE_ON_FAIL, True)
+        max_workers = self.get_max_workers(params)
+        target_rows = self.get_target_rows_per_request(params)
+        offer_prices_days = self.get_offer_prices_days_per_request(params)
+        self._split_failed_intervals = bool(params.get(KEY_SPLIT_FAILED_INTERVALS, False))
+        self._sliced_output = bool(params.get(KEY_SLICED_OUTPUT, False))
+        self._slice_rows = self.get_slice_rows(params)
+        self._stream_rows = self.get_stream_rows(params, max_workers)
+        self._deduplicate_rows = bool(params.get(KEY_DEDUPLICATE_ROWS, False))
+
+        start_date, end_date = self.get_date_range(params)
+        state = self.get_state_file()
+        self._watermarks = dict(state.get(KEY_STATE_WATERMARKS, {}))
+        if params.get(KEY_SKIP_UNCHANGED_DAYS, False):
+            self._previous_day_hashes = dict(state.get(KEY_STATE_DAY_HASHES) or {})
 
         endpoints_to_fetch = params.get(KEY_ENDPOINTS)
 
-        client = CepsClient()
+        response_cache = self.get_response_cache(params)
+        self._checkpoint = self.get_checkpoint(params)
+        request_timeout = self.get_request_timeout(params)
+        columnar_rows = bool(params.get(KEY_COLUMNAR_ROWS, False))
+        transport = self.get_http_transport(params, max_workers)
+        if self._shared_client:
+            # the connection pool is shared, so the concurrency of the requests is not controlled per configuration
+            if params.get(KEY_ADAPTIVE_CONCURRENCY, False):
+                logging.warning(f"Parameter {KEY_ADAPTIVE_CONCURRENCY} is ignored in batch runs")
+            for key in (KEY_HTTP_TRANSPORT_POOL_SIZE, KEY_HTTP_TRANSPORT_COMPRESSION):
+                if key in (params.get(KEY_HTTP_TRANSPORT) or {}):
+                    logging.warning(f"Parameter {KEY_HTTP_TRANSPORT}.{key} is ignored in batch runs")
+            request_controller = None
+            client = self._shared_client
+            client.configure_run(
+                response_cache=response_cache,
+                operation_timeout=request_timeout,
+                metrics=metrics,
+                columnar_rows=columnar_rows,
+                stream_responses=transport[KEY_HTTP_TRANSPORT_STREAM_RESPONSES],
+            )
+        else:
+            request_controller = self.get_request_controller(params, max_workers, request_timeout)
+            client = CepsClient(
+                wsdl_cache=WsdlCache(),
+                response_cache=response_cache,
+                operation_timeout=request_timeout,
+                metrics=metrics,
+                request_controller=request_controller,
+                columnar_rows=columnar_rows,
+                **transport,
+            )
+        if offer_prices_days > 1:
+            client = BatchedOfferPricesClient(client)
+
+        local_targets = []
+        if params.get(KEY_LOCAL_AGGREGATION, False):
+            local_targets = self.get_local_aggregation_targets(endpoints_to_fetch)
+        if local_targets:
+            client = LocalAggregationClient(
+                client, local_targets, self.split_interval if self._split_failed_intervals else None
+            )
+            # the native rows go to their own endpoint first, so they are never kept for it
+            endpoints_to_fetch = sorted(
+                endpoints_to_fetch,
+                key=lambda endpoint: (
+                    endpoint.get(KEY_ENDPOINT_GRANULARITY) != NATIVE_GRANULARITY.get(endpoint[KEY_ENDPOINT_NAME])
+                ),
+            )
+        endpoint_start_dates = self.get_endpoint_start_dates(
+            endpoints_to_fetch, start_date, end_date, params, local_targets
+        )
 
-        for endpoint in endpoints_to_fetch:
-            endpoint_columns = endpoint_definition.get("endpoint_columns").get(endpoint["endpoint_name"])
+        endpoint_jobs = []
+        for endpoint, endpoint_start_date in zip(endpoints_to_fetch, endpoint_start_dates):
+            endpoint_columns = endpoint_columns_by_name.get(endpoint["endpoint_name"])
             if not endpoint_columns:
                 logging.warning("Endpoint columns missing")
 
-            if endpoint["endpoint_name"] == "OfferPrices":
-                self.process_endpoint(endpoint, day_intervals, client, continue_on_fail, endpoint_columns)
-            else:
-                self.process_endpoint(endpoint, intervals, client, continue_on_fail, endpoint_columns)
+            day_intervals = endpoint["endpoint_name"] == OFFER_PRICES_ENDPOINT
+            chunk_days = offer_prices_days if day_intervals else self.get_chunk_days(endpoint, target_rows)
+            if self.get_local_target(endpoint) in local_targets:
+                native_endpoint = {KEY_ENDPOINT_GRANULARITY: NATIVE_GRANULARITY[endpoint[KEY_ENDPOINT_NAME]]}
+                chunk_days = self.get_chunk_days(native_endpoint, target_rows)
+            intervals = self.split_date_intervals(
+                endpoint_start_date, end_date, day_intervals=day_intervals, chunk_days=chunk_days
+            )
+            endpoint_jobs.append((endpoint, intervals, endpoint_columns))
 
-        self._close_writers()
+        try:
+            if max_workers > 1 and len(endpoint_jobs) > 1:
+                self.process_endpoints_pipeline(endpoint_jobs, client, continue_on_fail, max_workers)
+            else:
+                for endpoint, endpoint_intervals, endpoint_columns in endpoint_jobs:
+                    self.process_endpoint(
+                        endpoint, endpoint_intervals, client, continue_on_fail, endpoint_columns, max_workers
+                    )
+
+            self._close_writers()
+        except BaseException:
+            self._remove_writer_temp_directories()
+            raise
         self.write_manifests(self.tables)
+        if response_cache:
+            response_cache.log_statistics()
+        if request_controller:
+            request_controller.log_statistics()
+        self.write_state_file(self.update_state())
+        for watermark_key, unchanged_days_writer in self._unchanged_days_writers.items():
+            logging.info(
+                f"Skipped {unchanged_days_writer.skipped_rows} rows of {unchanged_days_writer.skipped_days} days of "
+                f"{watermark_key} unchanged since the previous run"
+            )
+        if self._checkpoint:
+            self._checkpoint.log_statistics()
+            # the run succeeded, the next one starts from its state
+            self._checkpoint.clear()
+
+        for writer in self._writer_cache.values():
+            metrics.add_table(
+                writer.table_name,
+                writer.rows_written,
+                writer.finalize_time,
+                writer.peak_disk_usage,
+                duplicates_dropped=getattr(writer, "duplicates_dropped", 0),
+            )
+        metrics.log_summary()
+        if params.get(KEY_WRITE_METRICS, False):
+            metrics.write(os.path.join(self.artifacts_out_path, METRICS_FILE_NAME))
+
+    @property
+    def artifacts_out_path(self):
+        return os.path.join(self.data_folder_path, "artifacts", "out", "current")
+
+    def process_endpoint(self, endpoint, intervals, client, continue_on_fail, endpoint_columns, max_workers=1):
+        writer = self.init_endpoint_output(endpoint, endpoint_columns)
+        self.process_intervals(endpoint, intervals, client, writer, continue_on_fail, max_workers)
+
+    def process_endpoints_pipeline(self, endpoint_jobs, client, continue_on_fail, max_workers):
+        """
+        Processes all endpoints at once. Fetch workers of all endpoints share one pool of max_workers threads,
+        while each output table gets a single writer thread that consumes the fetched intervals of its
+        endpoints in order. Writers are therefore never shared between threads and the content of each table
+        is the same as when the endpoints are processed one after another.
+        """
+        table_jobs = {}
+        for endpoint, intervals, endpoint_columns in endpoint_jobs:
+            writer = self.init_endpoint_output(endpoint, endpoint_columns)
+            table_jobs.setdefault(writer.table_name, []).append((endpoint, intervals, writer))
+
+        stop_event = threading.Event()
+        fetch_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+        write_executor = ThreadPoolExecutor(max_workers=len(table_jobs), thread_name_prefix="write")
+        try:
+            consumers = [
+                write_executor.submit(
+                    self._consume_table_jobs, jobs, client, continue_on_fail, max_workers, fetch_executor, stop_event
+                )
+                for jobs in table_jobs.values()
+            ]
+            done, _ = wait(consumers, return_when=FIRST_EXCEPTION)
+            for consumer in done:
+                # re-raises the first failure, the remaining consumers are stopped in finally
+                consumer.result()
+        finally:
+            stop_event.set()
+            fetch_executor.shutdown(wait=True, cancel_futures=True)
+            write_executor.shutdown(wait=True, cancel_futures=True)
+
+    def _consume_table_jobs(self, jobs, client, continue_on_fail, max_workers, fetch_executor, stop_event):
+        for endpoint, intervals, writer in jobs:
+            self.process_intervals(
+                endpoint, intervals, client, writer, continue_on_fail, max_workers, fetch_executor, stop_event
+            )
 
-    def process_endpoint(self, endpoint, intervals, client, continue_on_fail, endpoint_columns):
+    def init_endpoint_output(self, endpoint, endpoint_columns):
         endpoint_name = endpoint.get(KEY_ENDPOINT_NAME)
         logging.info(f"Fetching {endpoint_name} data")
 
         out_table = self.create_out_table_definition(
             f"{endpoint_name}.csv",
+            is_sliced=self._sliced_output,
             incremental=True,
             enclosure="",
             schema=endpoint_columns,
@@ -85,32 +342,116 @@ class Component(ComponentBase):
             writer = self._get_writer_from_cache(out_table, endpoint_columns)
         except TypeError as type_err:
             raise UserException(f"Endpoint '{endpoint_name}' is not implemented") from type_err
+        return writer
+
+    def process_intervals(
+        self, endpoint, intervals, client, writer, continue_on_fail, max_workers, executor=None, stop_event=None
+    ):
+        """
+        Fetches the intervals using a pool of max_workers threads. At most max_workers intervals are in flight at
+        a time and results are written in the order of the intervals, so the output does not depend on the
+        order in which the requests finish.
+
+        :param executor: Optional shared fetch executor, a private one is created by default
+        :param stop_event: Optional event that stops the processing when set
+        """
+        endpoint_name = endpoint.get(KEY_ENDPOINT_NAME)
+        watermark_key = self.get_watermark_key(endpoint)
+        # the watermark only moves over intervals written without a gap, failed intervals are fetched again
+        advance_watermark = True
 
-        for interval in intervals:
-            self.process_interval(endpoint_name, interval, endpoint, client, writer, continue_on_fail)
+        if self._previous_day_hashes is not None:
+            writer = self._unchanged_days_writers[watermark_key] = UnchangedDaysWriter(
+                writer, self._previous_day_hashes.get(watermark_key)
+            )
+        checkpoint = self._checkpoint
+
+        if self._stream_rows:
+            for interval in intervals:
+                if stop_event and stop_event.is_set():
+                    return
+                if checkpoint and checkpoint.is_completed(watermark_key, interval):
+                    rows = checkpoint.read_rows(watermark_key, interval)
+                    writer.writerows(rows)
+                    if advance_watermark and rows:
+                        self.update_watermark(watermark_key, rows[-1])
+                    continue
+                if checkpoint:
+                    with checkpoint.open_part(watermark_key, interval, writer) as part:
+                        last_row = self.stream_interval_result(
+                            endpoint_name, interval, endpoint, client, part, continue_on_fail
+                        )
+                        part.completed = last_row is not None
+                else:
+                    last_row = self.stream_interval_result(
+                        endpoint_name, interval, endpoint, client, writer, continue_on_fail
+                    )
+                if last_row is None:
+                    advance_watermark = False
+                elif advance_watermark:
+                    self.update_watermark(watermark_key, last_row)
+            return
+
+        def submit(interval):
+            """
+            Returns the future of the rows of the interval and the interval to record to the checkpoint, None when
+            its rows come from the checkpoint.
+            """
+            if checkpoint and checkpoint.is_completed(watermark_key, interval):
+                return executor.submit(checkpoint.read_rows, watermark_key, interval), None
+            future = executor.submit(
+                self.fetch_interval, endpoint_name, interval, endpoint, client, self._split_failed_intervals
+            )
+            return future, interval if checkpoint else None
+
+        def write_next_result():
+            nonlocal advance_watermark
+            future, interval = pending.popleft()
+            if interval is None:
+                rows = self.write_interval_result(future, writer, continue_on_fail)
+            else:
+                with checkpoint.open_part(watermark_key, interval, writer) as part:
+                    rows = self.write_interval_result(future, part, continue_on_fail)
+                    part.completed = rows is not None
+            if rows is None:
+                advance_watermark = False
+            elif advance_watermark and rows:
+                self.update_watermark(watermark_key, rows[-1])
+
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{endpoint_name}-fetch")
+        pending = deque()
+        try:
+            for interval in intervals:
+                if stop_event and stop_event.is_set():
+                    return
+                pending.append(submit(interval))
+                if len(pending) >= max_workers:
+                    write_next_result()
+            while pending:
+                write_next_result()
+        finally:
+            for future, _ in pending:
+                future.cancel()
+            if own_executor:
+                executor.shutdown(wait=True, cancel_futures=True)
 
     @staticmethod
     def get_endpoint_p_keys(endpoint_name):
-        if endpoint_name in [
-            "CrossborderPowerFlows",
-            "Generation",
-            "GenerationPlan",
-            "Load",
-            "RegulationEnergy",
-            "RegulationEnergyB",
-            "AktualniSystemovaOdchylkaCR",
-        ]:
-            return ["date"]
-        elif endpoint_name in ["OdhadovanaCenaOdchylky"]:
-            return ["interval", "date"]
-        elif endpoint_name in ["OfferPrices"]:
-            return ["hour", "date", "unit"]
-
-    @staticmethod
-    def process_interval(endpoint_name, interval, endpoint, client, writer, continue_on_fail):
+        primary_key = PRIMARY_KEYS.get(endpoint_name)
+        return list(primary_key) if primary_key else None
+
+    @staticmethod
+    def fetch_interval(endpoint_name, interval, endpoint, client, split_failed=False):
+        """
+        Fetches the interval. With split_failed, an interval that fails (e.g. times out or returns no data) is
+        split in halves that are fetched recursively, so the data of the parts that can be fetched are recovered.
+        PartialIntervalException with the recovered rows is raised when some of the parts still fail.
+        """
         logging.info(f"Fetching {endpoint_name} data for interval {interval['start_date']} to {interval['end_date']}")
         try:
-            result = client.get_data(
+            return client.get_data(
                 endpoint.get(KEY_ENDPOINT_NAME),
                 interval["start_date"],
                 interval["end_date"],
@@ -118,26 +459,232 @@ class Component(ComponentBase):
                 function=endpoint.get(KEY_ENDPOINT_FUNCTION, "AVG"),
                 version="RT",
             )
-            writer.writerows(result)
+        except CepsClientException as ceps_exc:
+            halves = Component.split_interval(interval) if split_failed else None
+            if not halves:
+                raise
+            logging.info(
+                f"Fetching {endpoint_name} data for interval {interval['start_date']} to {interval['end_date']} "
+                f"failed, splitting the interval: {ceps_exc}"
+            )
+
+        rows = []
+        errors = []
+        for half in halves:
+            try:
+                rows.extend(Component.fetch_interval(endpoint_name, half, endpoint, client, split_failed))
+            except PartialIntervalException as partial_exc:
+                rows.extend(partial_exc.rows)
+                errors.append(partial_exc)
+            except CepsClientException as half_exc:
+                errors.append(half_exc)
+        if not errors:
+            return rows
+        if not rows:
+            raise errors[0]
+        raise PartialIntervalException("; ".join(str(error) for error in errors), rows)
+
+    @staticmethod
+    def split_interval(interval):
+        """
+        Returns two halves of the interval, or None if it is too short to be split.
+        """
+        if "T" not in interval["start_date"]:
+            # day intervals are not split
+            return None
+        start = datetime.strptime(interval["start_date"], INTERVAL_DATE_FORMAT)
+        end = datetime.strptime(interval["end_date"], INTERVAL_DATE_FORMAT)
+        if end - start < 2 * MIN_SPLIT_INTERVAL:
+            return None
+        middle = (start + (end - start) / 2).replace(minute=0, second=0, microsecond=0)
+        middle = middle.strftime(INTERVAL_DATE_FORMAT)
+        return [
+            {"start_date": interval["start_date"], "end_date": middle},
+            {"start_date": middle, "end_date": interval["end_date"]},
+        ]
+
+    @staticmethod
+    def write_interval_result(future, writer, continue_on_fail):
+        """
+        Writes the fetched rows, returns them or None if the interval failed. Rows recovered from a partially
+        fetched interval are written too, but the interval counts as failed.
+        """
+        try:
+            rows = future.result()
+            writer.writerows(rows)
+            return rows
         except CepsClientException as ceps_exc:
             if continue_on_fail:
                 logging.warning(ceps_exc)
+                if isinstance(ceps_exc, PartialIntervalException):
+                    writer.writerows(ceps_exc.rows)
+                return None
             else:
                 raise UserException(ceps_exc) from ceps_exc
 
+    def stream_interval_result(self, endpoint_name, interval, endpoint, client, writer, continue_on_fail):
+        """
+        Streams the rows of the interval from the response to the writer, so they are never all in memory.
+        Returns the last written row or None if the interval failed. Rows written before a failure are kept, but
+        the interval counts as failed. With split failed intervals, an interval that fails before any of its rows
+        is read is split in halves that are streamed recursively.
+        """
+        logging.info(f"Fetching {endpoint_name} data for interval {interval['start_date']} to {interval['end_date']}")
+        last_row = None
+
+        def tracked(rows):
+            nonlocal last_row
+            for row in rows:
+                last_row = row
+                yield row
+
+        try:
+            writer.writerows(
+                tracked(
+                    client.iter_data(
+                        endpoint.get(KEY_ENDPOINT_NAME),
+                        interval["start_date"],
+                        interval["end_date"],
+                        granularity=endpoint.get(KEY_ENDPOINT_GRANULARITY),
+                        function=endpoint.get(KEY_ENDPOINT_FUNCTION, "AVG"),
+                        version="RT",
+                    )
+                )
+            )
+            return last_row
+        except CepsClientException as ceps_exc:
+            halves = self.split_interval(interval) if self._split_failed_intervals and last_row is None else None
+            if not halves:
+                if continue_on_fail:
+                    logging.warning(ceps_exc)
+                    return None
+                raise UserException(ceps_exc) from ceps_exc
+            logging.info(
+                f"Fetching {endpoint_name} data for interval {interval['start_date']} to {interval['end_date']} "
+                f"failed, splitting the interval: {ceps_exc}"
+            )
+
+        results = [
+            self.stream_interval_result(endpoint_name, half, endpoint, client, writer, continue_on_fail)
+            for half in halves
+        ]
+        return None if any(result is None for result in results) else results[-1]
+
+    @staticmethod
+    def get_watermark_key(endpoint):
+        return "/".join(
+            [
+                endpoint.get(KEY_ENDPOINT_NAME),
+                str(endpoint.get(KEY_ENDPOINT_GRANULARITY)),
+                endpoint.get(KEY_ENDPOINT_FUNCTION, "AVG"),
+            ]
+        )
+
+    def update_watermark(self, watermark_key, last_row):
+        """
+        Moves the watermark to the date of the last written row, if it is later than the current one.
+        """
+        try:
+            last_date = datetime.fromisoformat(last_row.get("date"))
+            current = self._watermarks.get(watermark_key)
+            if current is None or last_date > datetime.fromisoformat(current):
+                self._watermarks[watermark_key] = last_row.get("date")
+        except (TypeError, ValueError):
+            logging.debug(f"Row without a valid date, watermark of {watermark_key} not updated")
+
+    def get_endpoint_start_dates(self, endpoints, start_date, end_date, params, local_targets=()):
+        """
+        Returns the dates the endpoints should be fetched from. Endpoints aggregated locally share the intervals of
+        their native fetch, so they start at the earliest date of the endpoints with the same name.
+        """
+        start_dates = []
+        for endpoint in endpoints:
+            endpoint_start_date = start_date
+            if params.get(KEY_INCREMENTAL_FETCH, False):
+                endpoint_start_date = self.get_incremental_start_date(endpoint, start_date, end_date, params)
+            start_dates.append(endpoint_start_date)
+
+        local_start_dates = {}
+        for endpoint, endpoint_start_date in zip(endpoints, start_dates):
+            if self.get_local_target(endpoint) in local_targets:
+                name = endpoint[KEY_ENDPOINT_NAME]
+                local_start_dates[name] = min(local_start_dates.get(name, endpoint_start_date), endpoint_start_date)
+        return [
+            local_start_dates.get(endpoint[KEY_ENDPOINT_NAME], endpoint_start_date)
+            if self.get_local_target(endpoint) in local_targets
+            else endpoint_start_date
+            for endpoint, endpoint_start_date in zip(endpoints, start_dates)
+        ]
+
+    def get_incremental_start_date(self, endpoint, start_date, end_date, params):
+        """
+        Returns the date the endpoint should be fetched from: the stored watermark minus the overlap (from the start of
+        its day when unchanged days are skipped), but never earlier than start_date and never later than end_date.
+        """
+        watermark = self._watermarks.get(self.get_watermark_key(endpoint))
+        if not watermark:
+            return start_date
+
+        overlap_hours = params.get(KEY_INCREMENTAL_OVERLAP_HOURS, DEFAULT_INCREMENTAL_OVERLAP_HOURS)
+        if isinstance(overlap_hours, bool) or not isinstance(overlap_hours, (int, float)) or overlap_hours < 0:
+            raise UserException(f"Parameter {KEY_INCREMENTAL_OVERLAP_HOURS} must be a non-negative number")
+
+        # the watermark is in Prague local time with offset, requests use the local time without it
+        incremental_start = datetime.fromisoformat(watermark).replace(tzinfo=start_date.tzinfo)
+        incremental_start -= timedelta(hours=overlap_hours)
+        if params.get(KEY_SKIP_UNCHANGED_DAYS, False):
+            # whole days are fetched, so the days of the overlap hash the same as in the previous run
+            incremental_start = incremental_start.replace(hour=0, minute=0, second=0, microsecond=0)
+        endpoint_start = min(max(start_date, incremental_start), end_date)
+        if endpoint_start > start_date:
+            logging.info(
+                f"Fetching {endpoint.get(KEY_ENDPOINT_NAME)} incrementally from {endpoint_start}, "
+                f"last fetched data from {watermark}"
+            )
+        return endpoint_start
+
     def _get_writer_from_cache(self, out_table, fieldnames):
         if not self._writer_cache.get(out_table.name):
             # init writer if not in cache
-            self._writer_cache[out_table.name] = CachedOrthogonalDictWriter(
-                out_table.full_path, fieldnames, temp_directory=tempfile.mkdtemp(), table_name=out_table.name
-            )
-            self._writer_cache[out_table.name].writeheader()
+            if self._sliced_output:
+                # a directory of gzip slices, each released as soon as it is complete
+                writer = SlicedCsvWriter(
+                    out_table.full_path, fieldnames, rows_per_slice=self._slice_rows, table_name=out_table.name
+                )
+            else:
+                writer = CachedOrthogonalDictWriter(
+                    out_table.full_path,
+                    fieldnames,
+                    # next to the output tables, so the result is finalized by a rename but the temporary
+                    # partitions are never uploaded with the tables
+                    temp_directory=tempfile.mkdtemp(dir=os.path.dirname(self.tables_out_path), prefix=".csv_temp_"),
+                    table_name=out_table.name,
+                )
+            writer.writeheader()
+            if self._deduplicate_rows and out_table.primary_key:
+                # rows of overlapping intervals are dropped before they reach the file
+                writer = DeduplicatingWriter(writer, out_table.primary_key)
+            self._writer_cache[out_table.name] = writer
 
         return self._writer_cache[out_table.name]
 
     def _close_writers(self):
         for wr in self._writer_cache.values():
             wr.close()
+        if self._sliced_output:
+            # slices have no header, columns added during the run have to be in the manifest
+            for table in self.tables:
+                fieldnames = self._writer_cache[table.name].fieldnames
+                table.add_columns([column for column in fieldnames if column not in table.column_names])
+
+    def _remove_writer_temp_directories(self):
+        """
+        Removes the temporary partitions of the writers of a failed run, removed by close otherwise.
+        """
+        for writer in self._writer_cache.values():
+            temp_directory = getattr(writer, "temp_directory", None)
+            if temp_directory:
+                shutil.rmtree(temp_directory, ignore_errors=True)
 
     def update_state(self):
         new_state = {}
@@ -149,25 +696,208 @@ class Component(ComponentBase):
                 new_state[table_name] = set(current_fieldnames + fieldnames)
             else:
                 new_state[table_name] = fieldnames
-        return {KEY_STATE_ENDPOINT_COLUMNS: new_state}
+        state = {KEY_STATE_ENDPOINT_COLUMNS: new_state, KEY_STATE_WATERMARKS: self._watermarks}
+        if self._previous_day_hashes is not None:
+            # only the days fetched by this run are kept, the next incremental run fetches the same recent days
+            state[KEY_STATE_DAY_HASHES] = {
+                watermark_key: unchanged_days_writer.day_hashes
+                for watermark_key, unchanged_days_writer in self._unchanged_days_writers.items()
+            }
+        return state
+
+    @staticmethod
+    def get_response_cache(params):
+        cache_params = params.get(KEY_RESPONSE_CACHE) or {}
+        if not cache_params.get(KEY_RESPONSE_CACHE_ENABLED, False):
+            return None
+        from ceps import ResponseCache
+
+        cache_kwargs = {}
+        if KEY_RESPONSE_CACHE_DIRECTORY in cache_params:
+            cache_kwargs["cache_directory"] = cache_params[KEY_RESPONSE_CACHE_DIRECTORY]
+        try:
+            for key in (
+                KEY_RESPONSE_CACHE_MAX_SIZE_MB,
+                KEY_RESPONSE_CACHE_CLOSED_AFTER_DAYS,
+                KEY_RESPONSE_CACHE_RECENT_TTL_MINUTES,
+            ):
+                if key in cache_params:
+                    cache_kwargs[key] = float(cache_params[key])
+            return ResponseCache(**cache_kwargs)
+        except (TypeError, ValueError, OSError) as cache_err:
+            raise UserException(f"Invalid {KEY_RESPONSE_CACHE} configuration: {cache_err}") from cache_err
+
+    @staticmethod
+    def get_http_transport(params, max_workers):
+        """
+        Returns the pool_size, compression and stream_responses arguments of CepsClient. The pool keeps a connection
+        for each request in flight by default.
+        """
+        transport_params = params.get(KEY_HTTP_TRANSPORT) or {}
+        pool_size = transport_params.get(KEY_HTTP_TRANSPORT_POOL_SIZE, max_workers)
+        if type(pool_size) is not int or pool_size < 1:
+            raise UserException(
+                f"Parameter {KEY_HTTP_TRANSPORT}.{KEY_HTTP_TRANSPORT_POOL_SIZE} must be a positive integer"
+            )
+        return {
+            KEY_HTTP_TRANSPORT_POOL_SIZE: pool_size,
+            KEY_HTTP_TRANSPORT_COMPRESSION: bool(transport_params.get(KEY_HTTP_TRANSPORT_COMPRESSION, True)),
+            KEY_HTTP_TRANSPORT_STREAM_RESPONSES: bool(transport_params.get(KEY_HTTP_TRANSPORT_STREAM_RESPONSES, False)),
+        }
+
+    @staticmethod
+    def get_checkpoint(params):
+        """
+        Returns the Checkpoint of the configuration when checkpoints are enabled, None otherwise.
+        """
+        checkpoint_params = params.get(KEY_CHECKPOINT) or {}
+        if not checkpoint_params.get(KEY_CHECKPOINT_ENABLED, False):
+            return None
+
+        checkpoint_kwargs = {}
+        if KEY_CHECKPOINT_DIRECTORY in checkpoint_params:
+            checkpoint_kwargs["directory"] = checkpoint_params[KEY_CHECKPOINT_DIRECTORY]
+        else:
+            logging.warning(
+                f"No {KEY_CHECKPOINT}.{KEY_CHECKPOINT_DIRECTORY} configured, the checkpoint is kept in the temporary "
+                f"directory, which usually does not outlive a failed run"
+            )
+        fingerprint = Checkpoint.get_fingerprint({key: params.get(key) for key in CHECKPOINT_PARAMETERS})
+        try:
+            return Checkpoint(fingerprint, **checkpoint_kwargs)
+        except (TypeError, OSError) as checkpoint_err:
+            raise UserException(f"Invalid {KEY_CHECKPOINT} configuration: {checkpoint_err}") from checkpoint_err
+
+    @staticmethod
+    def get_request_controller(params, max_workers, request_timeout=None):
+        """
+        Returns RequestController of the run with adaptive concurrency, None otherwise. max_workers is then the
+        highest concurrency the controller can reach.
+        """
+        if not params.get(KEY_ADAPTIVE_CONCURRENCY, False):
+            return None
+        from ceps.adaptive import DEFAULT_FAILURE_THRESHOLD, DEFAULT_RETRY_BUDGET, RequestController
+
+        retry_budget = params.get(KEY_RETRY_BUDGET, DEFAULT_RETRY_BUDGET)
+        if type(retry_budget) is not int or retry_budget < 0:
+            raise UserException(f"Parameter {KEY_RETRY_BUDGET} must be a non-negative integer")
+        failure_threshold = params.get(KEY_CIRCUIT_BREAKER_FAILURES, DEFAULT_FAILURE_THRESHOLD)
+        if type(failure_threshold) is not int or failure_threshold < 1:
+            raise UserException(f"Parameter {KEY_CIRCUIT_BREAKER_FAILURES} must be a positive integer")
+        return RequestController(
+            max_workers,
+            latency_target=request_timeout * ADAPTIVE_LATENCY_TARGET_RATIO if request_timeout else None,
+            retry_budget=retry_budget,
+            failure_threshold=failure_threshold,
+        )
+
+    @staticmethod
+    def get_local_target(endpoint):
+        return (
+            endpoint.get(KEY_ENDPOINT_NAME),
+            endpoint.get(KEY_ENDPOINT_GRANULARITY),
+            endpoint.get(KEY_ENDPOINT_FUNCTION, "AVG"),
+        )
+
+    @staticmethod
+    def get_local_aggregation_targets(endpoints):
+        """
+        Returns (endpoint, granularity, function) of the configured endpoints computed locally from one fetch of
+        the native granularity. Only endpoints configured with at least two such combinations are computed
+        locally, a single coarse one is cheaper to fetch directly.
+        """
+        targets = {}
+        for endpoint in endpoints:
+            target = Component.get_local_target(endpoint)
+            if can_aggregate(*target):
+                targets.setdefault(target[0], []).append(target)
+        return [target for name_targets in targets.values() if len(set(name_targets)) > 1 for target in name_targets]
+
+    @staticmethod
+    def get_stream_rows(params, max_workers):
+        if not params.get(KEY_STREAM_ROWS, False):
+            return False
+        if max_workers > 1:
+            # concurrently fetched intervals wait for their turn to be written, so their rows are kept anyway
+            logging.warning(f"Parameter {KEY_STREAM_ROWS} is ignored with {KEY_MAX_WORKERS} above 1")
+            return False
+        return True
+
+    @staticmethod
+    def get_slice_rows(params):
+        slice_rows = params.get(KEY_SLICE_ROWS)
+        if slice_rows is not None and (type(slice_rows) is not int or slice_rows < 1):
+            raise UserException(f"Parameter {KEY_SLICE_ROWS} must be a positive integer")
+        return slice_rows
+
+    @staticmethod
+    def get_profile_mode(image_parameters):
+        profile_mode = image_parameters.get(KEY_PROFILE)
+        if profile_mode and profile_mode not in PROFILE_MODES:
+            raise UserException(f"Image parameter {KEY_PROFILE} must be one of {PROFILE_MODES}")
+        return profile_mode
 
     @staticmethod
-    def get_date_intervals(params, day_intervals=False):
+    def get_max_workers(params):
+        max_workers = params.get(KEY_MAX_WORKERS, 1)
+        if type(max_workers) is not int or not 1 <= max_workers <= MAX_WORKERS_LIMIT:
+            raise UserException(f"Parameter {KEY_MAX_WORKERS} must be an integer between 1 and {MAX_WORKERS_LIMIT}")
+        return max_workers
+
+    @staticmethod
+    def get_date_range(params):
+        # dateparser takes a third of a second to import
+        import keboola.utils.date as dutils
+
         try:
-            start_date, end_date = dutils.parse_datetime_interval(params.get(KEY_DATE_FROM), params.get(KEY_DATE_TO))
+            return dutils.parse_datetime_interval(params.get(KEY_DATE_FROM), params.get(KEY_DATE_TO))
         except (TypeError, ValueError) as parse_err:
             raise UserException("Failed to parse date to and from. Make sure the input is valid") from parse_err
 
-        if day_intervals:
-            return dutils.split_dates_to_chunks(start_date, end_date, intv=1, strformat="%Y-%m-%d")
-        return dutils.split_dates_to_chunks(start_date, end_date, intv=30, strformat="%Y-%m-%dT%H:%M:%S")
+    @staticmethod
+    def get_target_rows_per_request(params):
+        target_rows = params.get(KEY_TARGET_ROWS_PER_REQUEST)
+        if target_rows is not None and (type(target_rows) is not int or target_rows < 1):
+            raise UserException(f"Parameter {KEY_TARGET_ROWS_PER_REQUEST} must be a positive integer")
+        return target_rows
+
+    @staticmethod
+    def get_request_timeout(params):
+        timeout = params.get(KEY_REQUEST_TIMEOUT)
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise UserException(f"Parameter {KEY_REQUEST_TIMEOUT} must be a positive number of seconds")
+        return timeout
+
+    @staticmethod
+    def get_chunk_days(endpoint, target_rows=None):
+        """
+        Returns the number of days fetched by one request. With target_rows, the chunk is sized so that each
+        request returns about target_rows rows in the granularity of the endpoint.
+        """
+        rows_per_day = GRANULARITY_ROWS_PER_DAY.get(endpoint.get(KEY_ENDPOINT_GRANULARITY))
+        if not target_rows or not rows_per_day:
+            return DEFAULT_CHUNK_DAYS
+        return min(max(target_rows // rows_per_day, 1), MAX_CHUNK_DAYS)
 
     @staticmethod
-    def get_endpoint_defintion():
-        dirname = os.path.dirname(__file__)
-        filename = os.path.join(dirname, "ceps/endpoint_columns.json")
-        with open(filename) as json_file:
-            return json.load(json_file)
+    def get_offer_prices_days_per_request(params):
+        days = params.get(KEY_OFFER_PRICES_DAYS_PER_REQUEST, 1)
+        if type(days) is not int or not 1 <= days <= MAX_OFFER_PRICES_DAYS_PER_REQUEST:
+            raise UserException(
+                f"Parameter {KEY_OFFER_PRICES_DAYS_PER_REQUEST} must be an integer between 1 and "
+                f"{MAX_OFFER_PRICES_DAYS_PER_REQUEST}"
+            )
+        return days
+
+    @staticmethod
+    def split_date_intervals(start_date, end_date, day_intervals=False, chunk_days=DEFAULT_CHUNK_DAYS):
+        import keboola.utils.date as dutils
+
+        if day_intervals:
+            return dutils.split_dates_to_chunks(
+                start_date, end_date, intv=chunk_days, strformat=DAY_INTERVAL_DATE_FORMAT
+            )
+        return dutils.split_dates_to_chunks(start_date, end_date, intv=chunk_days, strformat=INTERVAL_DATE_FORMAT)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,22 @@
+import csv
+import gzip
 import hashlib
 import io
+import logging
+import math
 import os
 import shutil
+import time
 from collections.abc import Iterable
-from csv import DictReader, DictWriter
+from csv import DictWriter
+from itertools import islice
+from operator import itemgetter
+
+# number of rows passed to the underlying csv writer at once
+WRITE_BATCH_SIZE = 1000
+# gzip level of the slices, CSV of numbers compresses well already at the fastest level
+SLICE_COMPRESSLEVEL = 1
+SLICE_FILE_NAME = "part_{:05d}.csv.gz"
 
 
 class CachedOrthogonalDictWriter:
@@ -18,6 +31,9 @@ class CachedOrthogonalDictWriter:
 
      NOTE: If not using "with" statement, close() method must be called at the end of processing to get the result.
 
+     The result is finalized by renaming the cached file when all rows share the same columns, so the temp directory
+     should be on the same file system as the result file to avoid a copy.
+
      NOTE: Does not keep the order of rows added - the rows containing additional headers always come first:
     Example:
         wr = CachedDictWriter(file, ["a", "b" , "c"])
@@ -63,6 +79,8 @@ class CachedOrthogonalDictWriter:
 
         self.buffering = buffering
         self.encoding = kwds.get("encoding", "utf-8")
+        # cached files become the result without a copy, rows end with \n as the result files always did
+        self.kwds.setdefault("lineterminator", "\n")
 
         self._write_header = False
 
@@ -78,18 +96,77 @@ class CachedOrthogonalDictWriter:
         self._writer_cache = {}
         self._tmp_file_cache = {}
         self._get_or_add_cached_writer(fieldnames)
+        self.rows_written = 0
+        # finalization statistics, available after close()
+        self.finalize_time = None
+        self.peak_disk_usage = None
+        # key signature of the last written row and how rows with this signature are written
+        self._row_keys = None
+        self._row_writer = None
+        self._row_getter = None
+        self._row_fieldnames = None
+        self._row_restval = None
 
     def writeheader(self):
         self._write_header = True
 
     def writerow(self, row_dict: dict):
-        cols = list(row_dict.keys())
-        writer = self._get_or_add_cached_writer(cols)
-        writer.writerow(row_dict)
+        self.writerows((row_dict,))
 
     def writerows(self, row_dicts: Iterable[dict]):
-        for r in row_dicts:
-            self.writerow(r)
+        """
+        Writes the rows. Rows with the same keys as the previous one skip the writer lookup and are converted
+        to lists and written in batches directly through the underlying csv writer. The writer is looked up
+        (and the header possibly extended) only when the key signature changes.
+
+        Row batches (with keys() and format_rows(), as ceps.batch.RowBatch) are written column by column.
+        """
+        if hasattr(row_dicts, "format_rows"):
+            self._write_row_batch(row_dicts)
+            return
+        batch = []
+        try:
+            for row_dict in row_dicts:
+                if row_dict.keys() != self._row_keys:
+                    self._write_batch(batch)
+                    self._set_row_signature(row_dict.keys())
+                batch.append(self._row_getter(row_dict))
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    self._write_batch(batch)
+        finally:
+            # rows read before a streamed iterable failed are kept
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        if batch:
+            self._row_writer.writerows(batch)
+            self.rows_written += len(batch)
+            batch.clear()
+
+    def _write_row_batch(self, row_batch):
+        if not row_batch:
+            return
+        if row_batch.keys() != self._row_keys:
+            self._set_row_signature(row_batch.keys())
+        self._row_writer.writerows(row_batch.format_rows(self._row_fieldnames, self._row_restval))
+        self.rows_written += len(row_batch)
+
+    def _set_row_signature(self, keys):
+        dict_writer = self._get_or_add_cached_writer(list(keys))
+        fieldnames = list(dict_writer.fieldnames)
+        self._row_keys = set(keys)
+        self._row_writer = dict_writer.writer
+        self._row_fieldnames = fieldnames
+        self._row_restval = dict_writer.restval
+        if self._row_keys == set(fieldnames) and len(fieldnames) > 1:
+            self._row_getter = itemgetter(*fieldnames)
+        else:
+            restval = dict_writer.restval
+
+            def _row_getter(row_dict):
+                return [row_dict.get(key, restval) for key in fieldnames]
+
+            self._row_getter = _row_getter
 
     def _update_complete_header(self, columns):
         cols_to_add = set(columns).difference(set(self.fieldnames))
@@ -139,48 +216,269 @@ class CachedOrthogonalDictWriter:
 
         :return:
         """
+        start = time.perf_counter()
         final_header = list(self.fieldnames)
         final_writer = self._get_or_add_cached_writer(final_header)
         final_writer_key = self._build_writer_key(final_header)
-        if len(self._writer_cache) == 1:
-            # headers were the same
-            self._tmp_file_cache[final_writer_key].close()
-        else:
+        if len(self._writer_cache) > 1:
             self._writer_cache.pop(final_writer_key)
-            self._append_missing_rows_and_close(final_writer, self._writer_cache, final_writer_key)
+            self._append_missing_rows(final_writer, self._writer_cache)
+        self._tmp_file_cache[final_writer_key].close()
 
         src_file = os.path.join(self.temp_directory, final_writer_key)
+        temp_size = sum(entry.stat().st_size for entry in os.scandir(self.temp_directory))
 
-        # write the result and add header.
-        with (
-            open(src_file, encoding=self.encoding) as source_file,
-            open(self.result_path, "w", buffering=self.buffering, encoding=self.encoding) as target_file,
-        ):
-            if not self._write_header:
+        if self._write_header:
+            copied_size = self._move_file(src_file, self.result_path)
+        else:
+            # the header has to be dropped, so the content is copied
+            with (
+                open(src_file, encoding=self.encoding, newline="") as source_file,
+                open(
+                    self.result_path, "w", buffering=self.buffering, encoding=self.encoding, newline=""
+                ) as target_file,
+            ):
                 source_file.readline()
-            # this will truncate the file, so need to use a different file name:
-            shutil.copyfileobj(source_file, target_file)
+                shutil.copyfileobj(source_file, target_file)
+            copied_size = os.path.getsize(self.result_path)
 
         # cleanup
         shutil.rmtree(self.temp_directory)
 
-    def _append_missing_rows_and_close(self, final_writer, writers: dict, final_writer_key):
+        self.peak_disk_usage = temp_size + copied_size
+        self.finalize_time = time.perf_counter() - start
+        logging.info(
+            f"Finalized {self.table_name or self.result_path} in {self.finalize_time:.2f} s, "
+            f"peak disk usage {self.peak_disk_usage} B"
+        )
+
+    @staticmethod
+    def _move_file(src_file, target_path):
+        """
+        Moves the file by an atomic rename, falls back to a copy when the temp directory is on a different
+        file system. Returns number of bytes copied.
+        """
+        try:
+            os.replace(src_file, target_path)
+            return 0
+        except OSError:
+            shutil.copyfile(src_file, target_path)
+            return os.path.getsize(target_path)
+
+    def _append_missing_rows(self, final_writer, writers: dict):
         """
         Appends missing rows (with less columns) to a final writer
         :param final_writer: final writer with complete set of headers
         :param writers: writers with smaller header
         :return:
         """
-        # close all writers and writer headers
-        for wkey in writers:
+        for wkey, writer in writers.items():
             self._tmp_file_cache[wkey].close()
             file_path = os.path.join(self.temp_directory, wkey)
-            self._append_data(final_writer, file_path)
+            self._append_data(final_writer, file_path, writer.fieldnames)
 
-        self._tmp_file_cache[final_writer_key].close()
+    def _append_data(self, final_writer, partition_path, partition_fieldnames):
+        """
+        Appends raw csv rows of the partition to the final writer, columns are remapped by position.
+        Missing columns point to the restval appended to each row.
+        """
+        column_positions = {column: position for position, column in enumerate(partition_fieldnames)}
+        missing_position = len(partition_fieldnames)
+        positions = [column_positions.get(column, missing_position) for column in final_writer.fieldnames]
+        remap = itemgetter(*positions) if len(positions) > 1 else lambda row: [row[positions[0]]]
+        restval = final_writer.restval
+
+        def remapped_rows(reader):
+            for row in reader:
+                row.append(restval)
+                yield remap(row)
+
+        with open(partition_path, encoding=self.encoding, newline="") as in_file:
+            reader = csv.reader(in_file)
+            # skip header
+            next(reader, None)
+            final_writer.writer.writerows(remapped_rows(reader))
+
+
+class SlicedCsvWriter:
+    """
+    Writes rows to a sliced table: a directory of headerless gzip compressed CSV slices with columns defined by
+    fieldnames (to be put in the manifest). Unlike CachedOrthogonalDictWriter, the rows keep their order and
+    there is no merge on close: each slice is closed as soon as it is complete.
+
+    A new slice is started by each writerows() call, i.e. one slice per fetched interval, or, with rows_per_slice,
+    whenever the current slice holds rows_per_slice rows.
+
+    Columns missing in fieldnames are appended to it, as in CachedOrthogonalDictWriter. All slices must have
+    the same columns, so slices completed before the extension are padded with blanks on close.
+    """
+
+    def __init__(
+        self,
+        table_directory,
+        fieldnames,
+        rows_per_slice=None,
+        table_name="",
+        compresslevel=SLICE_COMPRESSLEVEL,
+        dialect="excel",
+        **kwds,
+    ):
+        """
+
+        :param table_directory: directory of the sliced table, created if it does not exist
+        :param fieldnames: Minimal column list
+        :param rows_per_slice: maximum rows in a slice, by default each writerows() call writes one slice
+        :param compresslevel: gzip compression level of the slices
+        :param dialect: As in csv package
+        :param kwds: As in csv package
+        """
+        self.table_directory = table_directory
+        self.fieldnames = list(fieldnames)
+        self.table_name = table_name
+        self.rows_per_slice = rows_per_slice
+        self.compresslevel = compresslevel
+        self.dialect = dialect
+        self.kwds = kwds
+        self.kwds.setdefault("lineterminator", "\n")
+        self.encoding = kwds.pop("encoding", "utf-8")
+        os.makedirs(table_directory, exist_ok=True)
+
+        self.rows_written = 0
+        self.finalize_time = None
+        self.peak_disk_usage = None
+        # number of columns of the first row of each slice, rows never have less columns than the previous ones
+        self._slice_widths = {}
+        self._slice_file = None
+        self._slice_path = None
+        self._slice_rows = 0
+        self._slice_writer = None
+        self._row_keys = None
+        self._row_getter = None
+        self._row_fieldnames = None
+
+    def writeheader(self):
+        # slices have no header, the columns are listed in the manifest
+        pass
+
+    def writerow(self, row_dict: dict):
+        self.writerows((row_dict,))
+
+    def writerows(self, row_dicts: Iterable[dict]):
+        if self.rows_per_slice is None:
+            self._close_slice()
+        slice_limit = self.rows_per_slice or math.inf
+        if hasattr(row_dicts, "format_rows"):
+            self._write_row_batch(row_dicts, slice_limit)
+            return
+        batch = []
+        try:
+            for row_dict in row_dicts:
+                if self._slice_file is None or self._slice_rows >= slice_limit:
+                    self._write_batch(batch)
+                    self._close_slice()
+                    self._open_slice()
+                if row_dict.keys() != self._row_keys:
+                    self._write_batch(batch)
+                    self._set_row_signature(row_dict.keys())
+                batch.append(self._row_getter(row_dict))
+                self._slice_rows += 1
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    self._write_batch(batch)
+        finally:
+            self._write_batch(batch)
+            if self.rows_per_slice is None:
+                self._close_slice()
+
+    def _write_batch(self, batch):
+        if batch:
+            self._slice_writer.writerows(batch)
+            self.rows_written += len(batch)
+            batch.clear()
+
+    def _write_row_batch(self, row_batch, slice_limit):
+        """
+        Writes the rows of the batch formatted column by column, split to slices as the rows of writerows.
+        """
+        rows = None
+        remaining = len(row_batch)
+        try:
+            while remaining:
+                if self._slice_file is None or self._slice_rows >= slice_limit:
+                    self._close_slice()
+                    self._open_slice()
+                if rows is None:
+                    if row_batch.keys() != self._row_keys:
+                        self._set_row_signature(row_batch.keys())
+                    rows = row_batch.format_rows(self._row_fieldnames)
+                count = min(remaining, slice_limit - self._slice_rows)
+                self._slice_writer.writerows(islice(rows, count))
+                self._slice_rows += count
+                self.rows_written += count
+                remaining -= count
+        finally:
+            if self.rows_per_slice is None:
+                self._close_slice()
+
+    def _set_row_signature(self, keys):
+        self.fieldnames.extend(key for key in keys if key not in self.fieldnames)
+        fieldnames = list(self.fieldnames)
+        self._row_keys = set(keys)
+        self._row_fieldnames = fieldnames
+        if self._row_keys == set(fieldnames) and len(fieldnames) > 1:
+            self._row_getter = itemgetter(*fieldnames)
+        else:
+
+            def _row_getter(row_dict):
+                return [row_dict.get(key, "") for key in fieldnames]
+
+            self._row_getter = _row_getter
+
+    def _open_slice(self):
+        self._slice_path = os.path.join(self.table_directory, SLICE_FILE_NAME.format(len(self._slice_widths) + 1))
+        self._slice_file = gzip.open(
+            self._slice_path, "wt", compresslevel=self.compresslevel, encoding=self.encoding, newline=""
+        )
+        self._slice_writer = csv.writer(self._slice_file, self.dialect, **self.kwds)
+        self._slice_widths[self._slice_path] = len(self.fieldnames)
+        self._slice_rows = 0
+
+    def _close_slice(self):
+        if self._slice_file is not None:
+            self._slice_file.close()
+            self._slice_file = None
+
+    def __enter__(self):
+        return self
 
-    def _append_data(self, final_writer, partition_path):
-        with open(partition_path, encoding="utf-8") as in_file:
-            reader = DictReader(in_file)
-            for r in reader:
-                final_writer.writerow(r)
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Closes the last slice and pads the slices written before new columns were added.
+        """
+        start = time.perf_counter()
+        self._close_slice()
+        width = len(self.fieldnames)
+        for slice_path, slice_width in self._slice_widths.items():
+            if slice_width < width:
+                self._pad_slice(slice_path, width)
+
+        self.peak_disk_usage = sum(entry.stat().st_size for entry in os.scandir(self.table_directory))
+        self.finalize_time = time.perf_counter() - start
+        logging.info(
+            f"Finalized {self.table_name or self.table_directory} in {len(self._slice_widths)} slices "
+            f"in {self.finalize_time:.2f} s, {self.peak_disk_usage} B"
+        )
+
+    def _pad_slice(self, slice_path, width):
+        padded_path = slice_path + ".tmp"
+        with (
+            gzip.open(slice_path, "rt", encoding=self.encoding, newline="") as in_file,
+            gzip.open(
+                padded_path, "wt", compresslevel=self.compresslevel, encoding=self.encoding, newline=""
+            ) as out_file,
+        ):
+            writer = csv.writer(out_file, self.dialect, **self.kwds)
+            writer.writerows(row + [""] * (width - len(row)) for row in csv.reader(in_file, self.dialect))
+        os.replace(padded_path, slice_path)
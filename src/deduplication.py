@@ -0,0 +1,124 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable
+from datetime import UTC, datetime
+
+DATE_COLUMN = "date"
+# bits of the packed key reserved for the id of the other primary key values
+SECONDARY_ID_BITS = 20
+
+
+class PrimaryKeyIndex:
+    """
+    Compact index of the primary keys seen so far.
+
+    Each key is packed into one 64-bit integer: the epoch seconds of the date column shifted left by
+    SECONDARY_ID_BITS, plus the id of the values of the other key columns (e.g. the interval or the hour and unit).
+    Those take only a few distinct values, so each gets a small sequential id. The packed keys are kept in a sorted
+    array('q'), 8 bytes per key. Rows mostly arrive in the order of their dates, so a new key is usually appended
+    and only duplicates and out of order keys need a binary search.
+
+    Keys that cannot be packed (missing or invalid date, too many distinct other values) are kept in a set.
+    """
+
+    def __init__(self, columns):
+        """
+
+        :param columns: primary key columns
+        """
+        self.columns = list(columns)
+        self.secondary_columns = [column for column in self.columns if column != DATE_COLUMN]
+        self.has_date = DATE_COLUMN in self.columns
+        self.duplicates = 0
+        self._keys = array("q")
+        self._secondary_ids = {}
+        self._unpacked_keys = set()
+
+    def __len__(self):
+        return len(self._keys) + len(self._unpacked_keys)
+
+    def add(self, row):
+        """
+        Adds the key of the row, returns False if the key was already in the index.
+        """
+        key = self._pack(row)
+        if key is None:
+            return self._add_unpacked(tuple(row.get(column) for column in self.columns))
+
+        keys = self._keys
+        if not keys or key > keys[-1]:
+            keys.append(key)
+            return True
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            self.duplicates += 1
+            return False
+        keys.insert(position, key)
+        return True
+
+    def _add_unpacked(self, key):
+        if key in self._unpacked_keys:
+            self.duplicates += 1
+            return False
+        self._unpacked_keys.add(key)
+        return True
+
+    def _pack(self, row):
+        if not self.has_date:
+            return None
+        try:
+            date = datetime.fromisoformat(row[DATE_COLUMN])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=UTC)
+        timestamp = date.timestamp()
+        seconds = int(timestamp)
+        if seconds != timestamp:
+            return None
+
+        secondary_id = 0
+        if self.secondary_columns:
+            values = tuple(row.get(column) for column in self.secondary_columns)
+            secondary_id = self._secondary_ids.get(values)
+            if secondary_id is None:
+                if len(self._secondary_ids) >= 1 << SECONDARY_ID_BITS:
+                    return None
+                secondary_id = self._secondary_ids[values] = len(self._secondary_ids)
+        return (seconds << SECONDARY_ID_BITS) | secondary_id
+
+
+class DeduplicatingWriter:
+    """
+    Wraps a writer and drops rows with a primary key that was already written, so the first occurrence is kept.
+    Works with iterables of rows, so streamed rows are filtered as they pass. Other attributes are those of the
+    wrapped writer.
+    """
+
+    def __init__(self, writer, primary_key):
+        """
+
+        :param writer: CachedOrthogonalDictWriter or SlicedCsvWriter the rows are written to
+        :param primary_key: primary key columns of the table
+        """
+        self.writer = writer
+        self.key_index = PrimaryKeyIndex(primary_key)
+
+    @property
+    def duplicates_dropped(self):
+        return self.key_index.duplicates
+
+    def writerow(self, row_dict: dict):
+        self.writerows((row_dict,))
+
+    def writerows(self, row_dicts: Iterable[dict]):
+        self.writer.writerows(filter(self.key_index.add, row_dicts))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
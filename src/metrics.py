@@ -0,0 +1,200 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+PROFILE_CPROFILE = "cprofile"
+PROFILE_TRACEMALLOC = "tracemalloc"
+PROFILE_MODES = [PROFILE_CPROFILE, PROFILE_TRACEMALLOC]
+
+PROFILE_STATS_FILE = "profile.prof"
+PROFILE_REPORT_FILE = "profile.txt"
+PROFILE_TOP_ENTRIES = 25
+
+
+class RunMetrics:
+    """
+    Thread safe collector of the run metrics: one record per request (latency, response size, bytes received,
+    retries, parse time, time to the first row and rows) and per output table (rows written, duplicates dropped,
+    finalize time and peak disk usage).
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.requests = []
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def add_request(
+        self,
+        endpoint,
+        request_data,
+        latency,
+        response_bytes,
+        retries,
+        parse_time,
+        rows,
+        cached=False,
+        wire_bytes=0,
+        content_encoding=None,
+        first_row_time=None,
+    ):
+        """
+
+        :param latency: seconds until the response was received, None if it was read from the cache
+        :param response_bytes: size of the (decompressed) response body
+        :param rows: number of rows produced, None if the response could not be mapped to rows
+        :param wire_bytes: bytes of the body as received, smaller than response_bytes when it was compressed
+        :param content_encoding: compression of the response body, None if it was not compressed
+        :param first_row_time: seconds from the start of the request until its first row was produced
+        """
+        record = {
+            "endpoint": endpoint,
+            "date_from": request_data.get("dateFrom"),
+            "date_to": request_data.get("dateTo"),
+            "granularity": request_data.get("agregation"),
+            "cached": cached,
+            "latency": latency,
+            "response_bytes": response_bytes,
+            "wire_bytes": wire_bytes,
+            "content_encoding": content_encoding,
+            "retries": retries,
+            "parse_time": parse_time,
+            "first_row_time": first_row_time,
+            "rows": rows,
+        }
+        with self._lock:
+            self.requests.append(record)
+
+    def add_table(self, table_name, rows_written, finalize_time, peak_disk_usage, duplicates_dropped=0):
+        with self._lock:
+            self.tables[table_name] = {
+                "rows_written": rows_written,
+                "duplicates_dropped": duplicates_dropped,
+                "finalize_time": finalize_time,
+                "peak_disk_usage": peak_disk_usage,
+            }
+
+    def get_summary(self):
+        with self._lock:
+            requests = list(self.requests)
+            tables = dict(self.tables)
+
+        endpoints = {}
+        for record in requests:
+            endpoints.setdefault(record["endpoint"], []).append(record)
+        return {
+            "run_time": time.perf_counter() - self.started_at,
+            "endpoints": {endpoint: self._summarize_requests(records) for endpoint, records in endpoints.items()},
+            "tables": tables,
+        }
+
+    @staticmethod
+    def _summarize_requests(records):
+        latencies = sorted(record["latency"] for record in records if record["latency"] is not None)
+        first_row_times = sorted(record["first_row_time"] for record in records if record["first_row_time"] is not None)
+        return {
+            "requests": len(records),
+            "cached": sum(record["cached"] for record in records),
+            "failed": sum(record["rows"] is None for record in records),
+            "retries": sum(record["retries"] for record in records),
+            "response_bytes": sum(record["response_bytes"] for record in records),
+            "wire_bytes": sum(record["wire_bytes"] for record in records),
+            "compressed": sum(bool(record["content_encoding"]) for record in records),
+            "rows": sum(record["rows"] or 0 for record in records),
+            "parse_time": sum(record["parse_time"] for record in records),
+            "latency_total": sum(latencies),
+            "latency_p50": get_percentile(latencies, 0.5),
+            "latency_p95": get_percentile(latencies, 0.95),
+            "latency_max": latencies[-1] if latencies else None,
+            "first_row_p50": get_percentile(first_row_times, 0.5),
+            "first_row_p95": get_percentile(first_row_times, 0.95),
+        }
+
+    def log_summary(self):
+        summary = self.get_summary()
+        for endpoint, stats in summary["endpoints"].items():
+            logging.info(
+                f"{endpoint}: {stats['requests']} requests ({stats['cached']} cached, {stats['failed']} failed, "
+                f"{stats['retries']} retries), {stats['response_bytes']} B received as {stats['wire_bytes']} B "
+                f"({stats['compressed']} responses compressed), latency total {stats['latency_total']:.2f} s "
+                f"p50 {format_seconds(stats['latency_p50'])} p95 {format_seconds(stats['latency_p95'])}, "
+                f"first row p50 {format_seconds(stats['first_row_p50'])} p95 {format_seconds(stats['first_row_p95'])}, "
+                f"parse {stats['parse_time']:.2f} s, {stats['rows']} rows"
+            )
+        for table_name, stats in summary["tables"].items():
+            logging.info(
+                f"{table_name}: {stats['rows_written']} rows written, {stats['duplicates_dropped']} duplicates "
+                f"dropped, finalized in {stats['finalize_time']:.2f} s"
+            )
+        logging.info(f"Run finished in {summary['run_time']:.2f} s")
+        return summary
+
+    def write(self, path):
+        """
+        Writes the summary together with the records of all requests to a JSON file.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            requests = list(self.requests)
+        with open(path, "w") as metrics_file:
+            json.dump({**self.get_summary(), "requests": requests}, metrics_file, indent=2)
+
+
+def get_percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.2f} s"
+
+
+@contextmanager
+def profiled(mode, output_directory):
+    """
+    Profiles the block with cProfile or tracemalloc, the top entries are logged and written to output_directory.
+    Does nothing when mode is empty.
+    """
+    if not mode:
+        yield
+        return
+
+    os.makedirs(output_directory, exist_ok=True)
+    if mode == PROFILE_CPROFILE:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(output_directory, PROFILE_STATS_FILE))
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP_ENTRIES)
+            _write_report(report.getvalue(), output_directory)
+    elif mode == PROFILE_TRACEMALLOC:
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            lines = [f"Peak traced memory {peak / 2**20:.1f} MiB"]
+            lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ENTRIES])
+            _write_report("\n".join(lines), output_directory)
+    else:
+        raise ValueError(f"Unknown profile mode {mode}, use one of {PROFILE_MODES}")
+
+
+def _write_report(report, output_directory):
+    with open(os.path.join(output_directory, PROFILE_REPORT_FILE), "w") as report_file:
+        report_file.write(report)
+    logging.info(f"Profile:\n{report}")
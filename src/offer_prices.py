@@ -0,0 +1,114 @@
+import logging
+import threading
+from datetime import date, timedelta
+
+from ceps import CepsClientException
+
+OFFER_PRICES_ENDPOINT = "OfferPrices"
+DAY_DATE_FORMAT = "%Y-%m-%d"
+
+
+class BatchedOfferPricesClient:
+    """
+    Wraps CepsClient and fetches OfferPrices for several days by one request. Other endpoints are passed
+    to the wrapped client.
+
+    Whether the service accepts multi-day ranges is not documented, so it is verified on the first intervals:
+    when a multi-day response does not reach the last day of the interval (or the request fails), the days are
+    fetched one by one. If the per-day responses contain days the multi-day
+    one was missing, multi-day requests are not used anymore and all further intervals are fetched per day. If they
+    do not (the last days have no data yet), or once a multi-day response reaching the last day was seen, multi-day
+    responses are trusted, so the days are fetched one by one at most once.
+    """
+
+    def __init__(self, client):
+        """
+
+        :param client: CepsClient used to fetch the data
+        """
+        self.client = client
+        # None until it is known whether the service returns the whole multi-day range
+        self.multi_day_accepted = None
+        self._lock = threading.Lock()
+
+    def get_data(self, endpoint, date_start, date_end, **kwargs):
+        if endpoint != OFFER_PRICES_ENDPOINT:
+            return self.client.get_data(endpoint, date_start, date_end, **kwargs)
+
+        days = self.split_days(date_start, date_end)
+        if len(days) <= 1 or self.multi_day_accepted is False:
+            return self._get_days(endpoint, days, **kwargs)
+
+        try:
+            rows = self.client.get_data(endpoint, date_start, date_end, **kwargs)
+        except CepsClientException as ceps_exc:
+            if self.multi_day_accepted:
+                raise
+            logging.info(f"Multi-day {endpoint} request failed, fetching the days one by one: {ceps_exc}")
+            rows = None
+
+        if self.multi_day_accepted or (rows and self._get_last_day(rows) >= days[-1][0]):
+            self._set_multi_day_accepted(True)
+            return rows
+
+        day_rows = self._get_days(endpoint, days, **kwargs)
+        if rows is None or len(day_rows) > len(rows):
+            logging.info(f"{endpoint} service does not return multi-day ranges, fetching the days one by one")
+            self._set_multi_day_accepted(False)
+        else:
+            # the multi-day response had all the data the days have, the last days are just not published yet
+            self._set_multi_day_accepted(True)
+        return day_rows
+
+    def iter_data(self, endpoint, date_start, date_end, **kwargs):
+        """
+        Streams the rows of the other endpoints, OfferPrices have to be verified before they are returned.
+        """
+        if endpoint != OFFER_PRICES_ENDPOINT:
+            return self.client.iter_data(endpoint, date_start, date_end, **kwargs)
+        return iter(self.get_data(endpoint, date_start, date_end, **kwargs))
+
+    def _get_days(self, endpoint, days, **kwargs):
+        """
+        Fetches the days one after another and returns their rows in the order of the days. Days without data
+        are skipped, CepsClientException is raised only when none of the days returned data.
+
+        The days are fetched by the worker of their interval, the intervals are already fetched max_workers at the
+        same time.
+        """
+        if len(days) == 1:
+            return self.client.get_data(endpoint, days[0][0], days[0][1], **kwargs)
+
+        rows = []
+        first_exc = None
+        for day_start, day_end in days:
+            try:
+                rows.extend(self.client.get_data(endpoint, day_start, day_end, **kwargs))
+            except CepsClientException as ceps_exc:
+                first_exc = first_exc or ceps_exc
+        if not rows:
+            raise first_exc
+        return rows
+
+    def _set_multi_day_accepted(self, accepted):
+        with self._lock:
+            if self.multi_day_accepted is None:
+                self.multi_day_accepted = accepted
+
+    @staticmethod
+    def split_days(date_start, date_end):
+        """
+        Returns (start, end) pairs of the days in the interval.
+        """
+        start, end = date.fromisoformat(date_start), date.fromisoformat(date_end)
+        days = []
+        while start < end:
+            next_day = start + timedelta(days=1)
+            days.append((start.strftime(DAY_DATE_FORMAT), next_day.strftime(DAY_DATE_FORMAT)))
+            start = next_day
+        return days or [(date_start, date_end)]
+
+    @staticmethod
+    def _get_last_day(rows):
+        # dates are ISO formatted, the day is compared as a string
+        return max(str(row.get("date") or "")[:10] for row in rows)
@@ -0,0 +1,115 @@
+"""
+Detection of the days whose rows did not change since the previous run.
+
+RT data are revised for some time after they are published, so incremental runs fetch the recent days again, but
+most of them come back unchanged. The service has no change token of the data of an interval (DataVersion lists the
+versions of the data, not their revisions), so the rows of each day are compared by a hash kept in the state: rows
+that hash to a value of the previous run were already loaded to the incremental output table and are not written
+again.
+
+Days are compared rather than intervals, as the intervals of incremental runs start at a different time each run.
+"""
+
+import hashlib
+import json
+from collections.abc import Iterable, Sequence
+
+DATE_COLUMN = "date"
+DAY_LENGTH = len("2026-01-01")
+HASH_BYTES = 8
+
+
+def hash_rows(rows):
+    """
+    Returns hex digest of the rows, which depends on their values and order.
+    """
+    digest = hashlib.blake2b(digest_size=HASH_BYTES)
+    for row in rows:
+        digest.update(json.dumps(row, default=str).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class UnchangedDaysWriter:
+    """
+    Wraps a writer and drops the rows of the days written unchanged by the previous run. The rows of each writerows
+    call (an interval) are grouped by the day of their date and each group is hashed, so a day split between two
+    intervals is compared by its parts. Rows without a date are always written. Other attributes are those of the
+    wrapped writer.
+
+    Lists and row batches are passed to the wrapped writer as they are when none of their days is dropped. Streamed
+    rows are held until their day is complete, so the rows of at most one day are kept. When the rows fail before
+    their day is complete, the held rows are written unchanged and the day is not hashed.
+    """
+
+    def __init__(self, writer, previous_hashes=None):
+        """
+
+        :param writer: writer the changed rows are written to
+        :param previous_hashes: dict of the lists of the hashes of the days written by the previous run, by the day
+        """
+        self.writer = writer
+        self.previous_hashes = previous_hashes or {}
+        # the hashes of the days of this run, the previous hashes of the next run
+        self.day_hashes = {}
+        self.skipped_days = 0
+        self.skipped_rows = 0
+
+    def writerow(self, row_dict: dict):
+        self.writerows((row_dict,))
+
+    def writerows(self, row_dicts: Iterable[dict]):
+        if not isinstance(row_dicts, Sequence):
+            self.writer.writerows(self._changed(row_dicts))
+            return
+        changed = list(self._changed(row_dicts))
+        if len(changed) == len(row_dicts):
+            self.writer.writerows(row_dicts)
+        elif changed:
+            self.writer.writerows(changed)
+
+    def _changed(self, row_dicts):
+        day = None
+        day_rows = []
+        try:
+            for row_dict in row_dicts:
+                row_day = self._get_day(row_dict)
+                if row_day != day:
+                    yield from self._compare_day(day, day_rows)
+                    day, day_rows = row_day, []
+                if row_day is None:
+                    yield row_dict
+                else:
+                    day_rows.append(row_dict)
+        except Exception:
+            # the rows received before the failure are written like the other streamed rows, the incomplete day is
+            # not hashed so the next run writes it whole
+            yield from day_rows
+            raise
+        yield from self._compare_day(day, day_rows)
+
+    def _compare_day(self, day, day_rows):
+        """
+        Returns the rows of the day, empty when the previous run wrote the same rows.
+        """
+        if not day_rows:
+            return ()
+        rows_hash = hash_rows(day_rows)
+        hashes = self.day_hashes.setdefault(day, [])
+        if rows_hash not in hashes:
+            hashes.append(rows_hash)
+        if rows_hash in self.previous_hashes.get(day, ()):
+            self.skipped_days += 1
+            self.skipped_rows += len(day_rows)
+            return ()
+        return day_rows
+
+    @staticmethod
+    def _get_day(row_dict):
+        date = row_dict.get(DATE_COLUMN)
+        if not isinstance(date, str) or len(date) < DAY_LENGTH:
+            return None
+        return date[:DAY_LENGTH]
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
@@ -0,0 +1,62 @@
+"""
+Benchmark of the fixed urllib3 retries against the adaptive RequestController on a local stub service that answers
+with 503 when more than --capacity requests are in flight.
+
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_adaptive [--requests 200] [--threads 8] [--capacity 4] [--latency 0.05]
+"""
+
+import argparse
+import statistics
+import time
+
+from ceps.adaptive import RequestController
+from ceps.client import create_session
+from tests.test_adaptive import FaultInjection, ServerTestCase
+
+
+def run(session, args):
+    """
+    Returns the elapsed time, the sorted latencies of the requests, the number of failed requests and the number
+    of requests rejected by the service.
+    """
+    fault = FaultInjection(latency=args.latency, capacity=args.capacity)
+    server_case = ServerTestCase()
+    url = server_case.serve(fault)
+    try:
+        start = time.perf_counter()
+        results = ServerTestCase.send_requests(session, url, args.requests, threads=args.threads)
+        elapsed = time.perf_counter() - start
+    finally:
+        server_case.doCleanups()
+    latencies = sorted(latency for latency, _ in results)
+    failed = sum(result != 200 for _, result in results)
+    return elapsed, latencies, failed, fault.rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    sessions = {
+        "fixed": lambda: create_session(pool_size=args.threads),
+        "adaptive": lambda: create_session(
+            pool_size=args.threads, controller=RequestController(args.threads, retry_budget=args.requests)
+        ),
+    }
+    for label, create in sessions.items():
+        elapsed, latencies, failed, rejected = run(create(), args)
+        print(
+            f"{label:<9} {args.requests / elapsed:6.1f} requests/s, latency median "
+            f"{statistics.median(latencies):.3f} s, p99 {latencies[int(len(latencies) * 0.99) - 1]:.3f} s, "
+            f"max {latencies[-1]:.3f} s, {rejected} rejected by the service, {failed} failed"
+        )
+
+
+if __name__ == "__main__":
+    main()
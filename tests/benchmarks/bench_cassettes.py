@@ -0,0 +1,248 @@
+"""
+Benchmark of the whole fetch pipeline replayed from the recorded VCR cassettes of the functional tests,
+plus synthetic one year MI datasets scaled up from the recorded HR responses.
+
+Each scenario runs in a fresh process, so the peak RSS is its own. The stages are timed separately:
+
+    wsdl_load      zeep client created from the bundled WSDL
+    soap_call      zeep request serialization and reply deserialization (no network, the reply is recorded)
+    xml_parse      parsing of the reply
+    field_mapping  rows built from the response (CepsClient.parse_response)
+    csv_write      rows written by CachedOrthogonalDictWriter
+    finalize       CachedOrthogonalDictWriter.close()
+
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_cassettes [--cases 02_generation_HR ...] [--scale-days 365]
+        [--save-baseline baseline.json] [--baseline baseline.json --tolerance 0.2]
+
+With --baseline, the exit code is 1 when the rows per second of a scenario drop, or its peak RSS grows, by more
+than the tolerance.
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import zeep
+import zeep.loader
+from lxml import etree
+
+from ceps import CepsClient, CepsClientException
+from ceps.endpoints import ENDPOINT_COLUMNS
+from ceps.wsdl_cache import BUNDLED_WSDL_PATH
+from component import Component
+from csv_tools import CachedOrthogonalDictWriter
+
+FUNCTIONAL_DIR = os.path.join(os.path.dirname(__file__), "..", "functional")
+CASSETTE_PATH = "source/data/cassettes/requests.json"
+STAGES = ["wsdl_load", "soap_call", "xml_parse", "field_mapping", "csv_write", "finalize"]
+
+# synthetic scenarios: name -> (functional test with the HR responses used as a template, endpoint)
+SCALED_SCENARIOS = {
+    "generation_MI": ("02_generation_HR", "Generation"),
+    "crossborder_MI": ("18_crossborder_HR", "CrossborderPowerFlows"),
+}
+SCALED_START = datetime(2025, 1, 1)
+ITEM_PATTERN = re.compile(r"<item [^>]*/>")
+DATE_PATTERN = re.compile(r'date="[^"]*"')
+
+
+def load_cassette_calls(case):
+    """
+    Returns (operation, request_data, reply content) of the recorded SOAP calls of the functional test.
+    """
+    with open(os.path.join(FUNCTIONAL_DIR, case, CASSETTE_PATH)) as cassette_file:
+        interactions = json.load(cassette_file)["interactions"]
+    calls = []
+    for interaction in interactions:
+        request = interaction["request"]
+        if request["method"] != "POST":
+            continue
+        operation = etree.fromstring(request["body"].encode("utf-8"))[0][0]
+        request_data = {etree.QName(parameter).localname: parameter.text for parameter in operation}
+        calls.append(
+            (etree.QName(operation).localname, request_data, interaction["response"]["body"]["string"].encode("utf-8"))
+        )
+    return calls
+
+
+def scale_calls(case, endpoint, days):
+    """
+    Yields calls of MI data over the given number of days, in 30 day intervals as the component requests them.
+    The items repeat the values of the recorded HR reply. Replies are generated one by one, so they do not add
+    up in the peak RSS.
+    """
+    _, _, content = load_cassette_calls(case)[0]
+    reply = content.decode("utf-8")
+    data_start, data_end = reply.index("<data>") + len("<data>"), reply.index("</data>")
+    items = [DATE_PATTERN.sub("{date}", item, count=1) for item in ITEM_PATTERN.findall(reply[data_start:data_end])]
+
+    options = CepsClient.get_request_options(endpoint, granularity="MI")
+    intervals = Component.split_date_intervals(SCALED_START, SCALED_START + timedelta(days=days))
+    for interval in intervals:
+        start = datetime.fromisoformat(interval["start_date"])
+        minutes = int((datetime.fromisoformat(interval["end_date"]) - start).total_seconds() // 60)
+        data = "".join(
+            items[minute % len(items)].format(date=f'date="{(start + timedelta(minutes=minute)).isoformat()}+01:00"')
+            for minute in range(minutes)
+        )
+        request_data = CepsClient.build_request_data(interval["start_date"], interval["end_date"], **options)
+        yield endpoint, request_data, (reply[:data_start] + data + reply[data_end:]).encode("utf-8")
+
+
+def run_scenario(name, calls):
+    """
+    Replays the calls through the pipeline and returns the stage times, row count and peak RSS.
+    """
+    timings = dict.fromkeys(STAGES, 0.0)
+    columns = {name: list(endpoint_columns) for name, endpoint_columns in ENDPOINT_COLUMNS.items()}
+
+    start = time.perf_counter()
+    client = zeep.Client(BUNDLED_WSDL_PATH)
+    binding = client.service._binding
+    timings["wsdl_load"] = time.perf_counter() - start
+
+    request_count = row_count = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writers = {}
+        for operation_name, request_data, content in calls:
+            if operation_name not in writers:
+                writers[operation_name] = CachedOrthogonalDictWriter(
+                    os.path.join(tmp_dir, f"{operation_name}.csv"),
+                    list(columns.get(operation_name, [])),
+                    temp_directory=os.path.join(tmp_dir, f".csv_temp_{operation_name}"),
+                )
+                writers[operation_name].writeheader()
+            operation = binding._operations[operation_name]
+
+            start = time.perf_counter()
+            binding._create(operation_name, (), request_data, client=client)
+            timings["soap_call"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            document = zeep.loader.parse_xml(content, client.transport, settings=client.settings)
+            timings["xml_parse"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            response = operation.process_reply(document)
+            timings["soap_call"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            try:
+                rows = CepsClient.parse_response(operation_name, request_data, response)
+            except CepsClientException:
+                rows = []
+            timings["field_mapping"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            writers[operation_name].writerows(rows)
+            timings["csv_write"] += time.perf_counter() - start
+            row_count += len(rows)
+            request_count += 1
+
+        start = time.perf_counter()
+        for writer in writers.values():
+            writer.close()
+        timings["finalize"] = time.perf_counter() - start
+
+    total_time = sum(timings.values())
+    # the WSDL is loaded once per run, the throughput is of the per-request stages
+    processing_time = total_time - timings["wsdl_load"]
+    return {
+        "scenario": name,
+        "requests": request_count,
+        "rows": row_count,
+        "stages": timings,
+        "total_time": total_time,
+        "rows_per_second": row_count / processing_time if processing_time else 0.0,
+        # kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_case(case):
+    return run_scenario(case, load_cassette_calls(case))
+
+
+def run_scaled(name, days):
+    case, endpoint = SCALED_SCENARIOS[name]
+    return run_scenario(f"{name}_{days}d", scale_calls(case, endpoint, days))
+
+
+def run_isolated(function, *args):
+    # a fresh process for each scenario, so the peak RSS of one does not hide the others
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(function, *args).result()
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for result in results:
+        expected = baseline.get(result["scenario"])
+        if not expected:
+            continue
+        if result["rows_per_second"] < expected["rows_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{result['scenario']}: {result['rows_per_second']:,.0f} rows/s, "
+                f"baseline {expected['rows_per_second']:,.0f} rows/s"
+            )
+        if result["peak_rss_mb"] > expected["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{result['scenario']}: peak RSS {result['peak_rss_mb']:.0f} MiB, "
+                f"baseline {expected['peak_rss_mb']:.0f} MiB"
+            )
+    return regressions
+
+
+def print_result(result):
+    stages = " ".join(f"{stage} {result['stages'][stage]:.3f}" for stage in STAGES)
+    print(
+        f"{result['scenario']:<36} {result['requests']:>4} req {result['rows']:>8} rows "
+        f"{result['rows_per_second']:>10,.0f} rows/s peak RSS {result['peak_rss_mb']:>6.0f} MiB | {stages}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="*", help="functional tests to replay, all with recorded calls by default")
+    parser.add_argument("--scale-days", type=int, default=365, help="days of the synthetic MI scenarios, 0 skips them")
+    parser.add_argument("--baseline", help="JSON file with the results to compare with")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default 0.2)")
+    args = parser.parse_args()
+
+    cases = args.cases or sorted(
+        os.path.basename(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(path)))))
+        for path in glob.glob(os.path.join(FUNCTIONAL_DIR, "*", CASSETTE_PATH))
+    )
+    results = [run_isolated(run_case, case) for case in cases]
+    if args.scale_days > 0:
+        results += [run_isolated(run_scaled, name, args.scale_days) for name in SCALED_SCENARIOS]
+    for result in results:
+        print_result(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump({result["scenario"]: result for result in results}, baseline_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark of CachedOrthogonalDictWriter on a synthetic stream of homogeneous CEPS-like rows, against the
+reference per-row path it replaced: a writer lookup and DictWriter.writerow for each row.
+
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_csv_writer [--rows 1000000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from csv_tools import CachedOrthogonalDictWriter
+
+COLUMNS = ["date", "wpp_mw", "npp_mw", "pvpp_mw", "ccgt_mw", "altpp_mw", "pspp_mw", "hpp_mw", "appp_mw", "tpp_mw"]
+
+
+def generate_rows(row_count):
+    # same key order as produced by the client, which differs from the order of the output columns
+    value_columns = list(reversed(COLUMNS[1:]))
+    for i in range(row_count):
+        row = {"date": f"2026-01-01T00:{i % 60:02d}:00+01:00"}
+        for position, column in enumerate(value_columns):
+            row[column] = f"{i % 5000}.{position}"
+        row["granularity"] = "MI"
+        yield row
+
+
+def write_per_row(writer, rows):
+    """
+    Writes the rows as the writer did before the fast path for homogeneous rows.
+    """
+    for row in rows:
+        writer._get_or_add_cached_writer(list(row.keys())).writerow(row)
+
+
+def run(row_count, mode="writerows"):
+    rows = list(generate_rows(row_count))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writer = CachedOrthogonalDictWriter(
+            os.path.join(tmp_dir, "Generation.csv"),
+            COLUMNS + ["granularity"],
+            temp_directory=os.path.join(tmp_dir, "temp"),
+        )
+        writer.writeheader()
+        start = time.perf_counter()
+        if mode == "writerows":
+            writer.writerows(rows)
+        elif mode == "writerow":
+            for row in rows:
+                writer.writerow(row)
+        else:
+            write_per_row(writer, rows)
+        write_time = time.perf_counter() - start
+        writer.close()
+    return write_time, writer.finalize_time, writer.peak_disk_usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    for label in ("reference", "writerows", "writerow"):
+        write_time, finalize_time, peak_disk_usage = run(args.rows, label)
+        print(
+            f"{label:<10} {args.rows} rows in {write_time:.2f} s, {args.rows / write_time:,.0f} rows/s, "
+            f"finalize {finalize_time:.3f} s, peak disk usage {peak_disk_usage / 2**20:.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Import time of the component, measured with ``python -X importtime`` in fresh interpreters. Fails when the median
+import time of the component module exceeds the target.
+
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_import_time [--runs 7] [--target-ms 250] [--top 10]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "src")
+# the start of the component on a sync action or an invalid configuration, and of a run that fetches data
+SCENARIOS = {
+    "start": "import component",
+    "run": "import component, ceps.client, keboola.utils.date",
+}
+TARGET_MS = 250
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)")
+
+
+def measure(statement):
+    """
+    Returns the import time of the statement in microseconds and the cumulative times of the modules it imports
+    directly or one level below, without the modules the interpreter imports on start.
+    """
+    startup_modules = {name for _, name, _ in run_importtime("pass")}
+    entries = [entry for entry in run_importtime(statement) if entry[1] not in startup_modules]
+    total = sum(cumulative for depth, _, cumulative in entries if depth == 0)
+    return total, {name: cumulative for depth, name, cumulative in entries if depth <= 1}
+
+
+def run_importtime(statement):
+    """
+    Returns (depth, module, cumulative microseconds) of each module imported by the statement in a new interpreter.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            entries.append((len(match.group(2)) // 2, match.group(3), int(match.group(1))))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--target-ms", type=float, default=TARGET_MS)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    start_time = None
+    for scenario, statement in SCENARIOS.items():
+        totals = []
+        module_times = {}
+        for _ in range(args.runs):
+            total, modules = measure(statement)
+            totals.append(total)
+            for module, cumulative in modules.items():
+                module_times.setdefault(module, []).append(cumulative)
+        median_ms = statistics.median(totals) / 1000
+        if scenario == "start":
+            start_time = median_ms
+        print(f"{scenario:<6} {statement!r}: median {median_ms:.1f} ms, min {min(totals) / 1000:.1f} ms")
+        slowest = sorted(module_times.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+        for module, times in slowest[: args.top]:
+            print(f"    {statistics.median(times) / 1000:8.1f} ms  {module}")
+
+    if start_time > args.target_ms:
+        print(f"Import of the component takes {start_time:.1f} ms, above the target of {args.target_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
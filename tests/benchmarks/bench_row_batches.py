@@ -0,0 +1,130 @@
+"""
+Benchmark of the columnar RowBatch against a dict per row on a generated Generation response: the memory taken by
+the mapped rows (per 100k rows, measured with tracemalloc) and the rows per second of mapping them and writing them
+with CachedOrthogonalDictWriter. The written tables are compared, they have to be identical.
+
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_row_batches [--rows 100000] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import UTC, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from lxml import etree
+
+from ceps import CepsClient
+from ceps.batch import RowBatch
+from ceps.endpoints import ENDPOINT_COLUMNS
+from ceps.parser import STRUCTURED_DATA_NAMESPACE
+from csv_tools import CachedOrthogonalDictWriter
+
+ENDPOINT = "Generation"
+SERIES = (
+    ("value1", "TPP [MW]"),
+    ("value2", "CCGT [MW]"),
+    ("value3", "NPP [MW]"),
+    ("value4", "HPP [MW]"),
+    ("value5", "PsPP [MW]"),
+    ("value6", "AltPP [MW]"),
+    ("value7", "ApPP [MW]"),
+    ("value8", "WPP [MW]"),
+    ("value9", "PVPP [MW]"),
+)
+REQUEST_DATA = {"agregation": "QH"}
+
+
+def generate_response(rows):
+    """
+    Returns the root element of a response with rows quarter hours of values, integral and with up to three decimals
+    as the service returns them.
+    """
+    series = "".join(f'<serie id="{serie_id}" name="{name}" />' for serie_id, name in SERIES)
+    random.seed(rows)
+    start = datetime(2026, 1, 1, tzinfo=UTC)
+    items = []
+    for index in range(rows):
+        date = (start + timedelta(minutes=15 * index)).astimezone(ZoneInfo("Europe/Prague")).isoformat()
+        values = []
+        for position in range(len(SERIES)):
+            value = random.uniform(0, 4000)
+            if position % 2:
+                values.append(str(round(value)))
+            else:
+                values.append(f"{value:.3f}".rstrip("0").rstrip("."))
+        attributes = " ".join(f'{serie_id}="{value}"' for (serie_id, _), value in zip(SERIES, values))
+        items.append(f'<item date="{date}" {attributes} />')
+    return etree.fromstring(
+        f'<root xmlns="{STRUCTURED_DATA_NAMESPACE}"><series>{series}</series><data>{"".join(items)}</data></root>'
+    )
+
+
+def measure_memory(response, columnar):
+    """
+    Returns the bytes allocated by the rows mapped from the response.
+    """
+    tracemalloc.start()
+    start_size = tracemalloc.get_traced_memory()[0]
+    rows = CepsClient.parse_response(ENDPOINT, REQUEST_DATA, response, columnar)
+    size = tracemalloc.get_traced_memory()[0] - start_size
+    tracemalloc.stop()
+    del rows
+    return size
+
+
+def measure_throughput(response, columnar, result_path):
+    """
+    Returns the seconds spent mapping the rows and writing them.
+    """
+    start = time.perf_counter()
+    rows = CepsClient.parse_response(ENDPOINT, REQUEST_DATA, response, columnar)
+    map_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    writer = CachedOrthogonalDictWriter(
+        result_path, list(ENDPOINT_COLUMNS[ENDPOINT]), temp_directory=result_path + "_temp"
+    )
+    writer.writeheader()
+    writer.writerows(rows)
+    writer.close()
+    return map_time, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    response = generate_response(args.rows)
+    # the row mapper is compiled before the measurements
+    if not isinstance(CepsClient.parse_response(ENDPOINT, REQUEST_DATA, response, True), RowBatch):
+        raise SystemExit("The rows of the response do not fit the schema of the endpoint")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = {}
+        for label, columnar in (("dict", False), ("columnar", True)):
+            result_path = os.path.join(tmp_dir, f"{label}.csv")
+            memory = measure_memory(response, columnar)
+            map_time, write_time = min(
+                (measure_throughput(response, columnar, result_path) for _ in range(args.repeat)), key=sum
+            )
+            with open(result_path, "rb") as result_file:
+                results[label] = result_file.read()
+            print(
+                f"{label:<9} {memory / args.rows * 100_000 / 2**20:7.1f} MiB per 100k rows, "
+                f"{args.rows / (map_time + write_time):9.0f} rows/s (map {map_time:.3f} s, write {write_time:.3f} s)"
+            )
+
+    if results["dict"] != results["columnar"]:
+        raise SystemExit("The columnar rows were written differently")
+
+
+if __name__ == "__main__":
+    main()
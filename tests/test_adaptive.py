@@ -0,0 +1,282 @@
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from requests.exceptions import RetryError
+
+from ceps import CepsClient, CepsClientException, CepsClientTimeoutException, WsdlCache
+from ceps.adaptive import AimdLimiter, CircuitBreaker, CircuitOpenError, RequestController
+from ceps.client import create_session
+from component import Component
+from metrics import RunMetrics
+from tests.test_component import ListWriter
+from tests.test_envelope import EMPTY_RESPONSE
+
+
+class FaultInjection:
+    """
+    Behavior of the stub service: answers after latency seconds, or with 503 when it is down or when more than
+    capacity requests are in flight. The first slow_requests requests take slow_latency seconds.
+    """
+
+    def __init__(self, latency=0.0, capacity=None, down=False, slow_requests=0, slow_latency=0.0):
+        self.latency = latency
+        self.capacity = capacity
+        self.down = down
+        self.slow_requests = slow_requests
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+
+class FaultInjectingHandler(BaseHTTPRequestHandler):
+    fault = None
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        fault = self.fault
+        with fault.lock:
+            fault.requests += 1
+            number = fault.requests
+            fault.in_flight += 1
+            rejected = fault.down or (fault.capacity is not None and fault.in_flight > fault.capacity)
+            fault.rejected += rejected
+        try:
+            if rejected:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            time.sleep(fault.slow_latency if number <= fault.slow_requests else fault.latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml; charset=utf-8")
+            self.send_header("Content-Length", str(len(EMPTY_RESPONSE)))
+            self.end_headers()
+            self.wfile.write(EMPTY_RESPONSE)
+        except ConnectionError:
+            # the client timed out
+            pass
+        finally:
+            with fault.lock:
+                fault.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    request_queue_size = 64
+    daemon_threads = True
+
+
+class ServerTestCase(unittest.TestCase):
+    def serve(self, fault):
+        handler = type("Handler", (FaultInjectingHandler,), {"fault": fault})
+        server = StubServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_port}/_layouts/CepsData.asmx"
+
+    @staticmethod
+    def send_requests(session, url, count, threads=8, timeout=None):
+        """
+        Returns the (latency, status or exception) of each of count requests sent from threads threads.
+        """
+
+        def send(_):
+            start = time.perf_counter()
+            try:
+                result = session.post(url, data=b"<Envelope />", timeout=timeout).status_code
+            except Exception as request_exc:
+                result = request_exc
+            return time.perf_counter() - start, result
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(send, range(count)))
+
+
+class TestAimdLimiter(unittest.TestCase):
+    def test_additive_increase(self):
+        limiter = AimdLimiter(4, initial_concurrency=1)
+        for _ in range(12):
+            limiter.release(limiter.acquire(), failed=False)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_burst_of_failures_decreases_once(self):
+        limiter = AimdLimiter(8, initial_concurrency=8)
+        started = [limiter.acquire() for _ in range(8)]
+        for request_start in started:
+            limiter.release(request_start, failed=True)
+        self.assertEqual((limiter.limit, limiter.decreases), (4, 1))
+
+        limiter.release(limiter.acquire(), failed=True)
+        limiter.release(limiter.acquire(), failed=True)
+        limiter.release(limiter.acquire(), failed=True)
+        self.assertEqual(limiter.limit, 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_slow_requests_decrease(self):
+        limiter = AimdLimiter(8, initial_concurrency=4, latency_target=0.01)
+        started = limiter.acquire()
+        time.sleep(0.02)
+        limiter.release(started, failed=False)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_requests_wait_for_slot(self):
+        limiter = AimdLimiter(2, initial_concurrency=1)
+        started = limiter.acquire()
+        second = threading.Thread(target=lambda: limiter.release(limiter.acquire(), failed=False))
+        second.start()
+        second.join(0.05)
+        self.assertTrue(second.is_alive())
+        limiter.release(started, failed=False)
+        second.join(1)
+        self.assertFalse(second.is_alive())
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_and_closes(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+        for _ in range(2):
+            breaker.record(failed=True)
+        breaker.record(failed=False)
+        for _ in range(3):
+            self.assertTrue(breaker.allow())
+            breaker.record(failed=True)
+        self.assertEqual((breaker.state, breaker.allow()), (CircuitBreaker.OPEN, False))
+
+        time.sleep(0.06)
+        # a single trial, it fails and opens the circuit again
+        self.assertEqual((breaker.allow(), breaker.allow()), (True, False))
+        breaker.record(failed=True)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record(failed=False)
+        self.assertEqual((breaker.state, breaker.allow(), breaker.times_opened), (CircuitBreaker.CLOSED, True, 2))
+
+
+class TestControlledSession(ServerTestCase):
+    def test_throughput_grows_while_healthy(self):
+        latency = 0.05
+        url = self.serve(FaultInjection(latency=latency))
+        controller = RequestController(8, initial_concurrency=1)
+        start = time.perf_counter()
+        results = self.send_requests(create_session(controller=controller), url, 80)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual({status for _, status in results}, {200})
+        self.assertEqual(controller.limiter.limit, 8)
+        # serially the requests would take 80 * latency
+        self.assertLess(elapsed, 80 * latency / 3)
+
+    def test_worst_case_latency_under_overload(self):
+        fault = FaultInjection(latency=0.05, capacity=3)
+        url = self.serve(fault)
+        controller = RequestController(8, initial_concurrency=8)
+        results = self.send_requests(create_session(backoff_factor=0.05, controller=controller), url, 48)
+
+        self.assertEqual({status for _, status in results}, {200})
+        self.assertTrue(fault.rejected)
+        self.assertEqual(controller.retries, fault.rejected)
+        self.assertLess(controller.limiter.limit, 8)
+        self.assertLess(max(latency for latency, _ in results), 2)
+
+    def test_timeouts_are_retried(self):
+        url = self.serve(FaultInjection(slow_requests=1, slow_latency=0.5))
+        controller = RequestController(1, initial_concurrency=1)
+        response = create_session(backoff_factor=0, controller=controller).post(url, timeout=0.2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.raw.retries.history), 1)
+        self.assertEqual((controller.retries, controller.limiter.decreases), (1, 1))
+
+    def test_retry_budget_is_shared(self):
+        fault = FaultInjection(down=True)
+        url = self.serve(fault)
+        controller = RequestController(1, retry_budget=5, failure_threshold=100)
+        session = create_session(max_retries=10, backoff_factor=0, controller=controller)
+        for _ in range(4):
+            with self.assertRaises(RetryError):
+                session.post(url)
+        self.assertEqual((fault.requests, controller.retries), (9, 5))
+
+    def test_circuit_opens_while_service_is_down(self):
+        fault = FaultInjection(down=True)
+        url = self.serve(fault)
+        controller = RequestController(4, failure_threshold=3, reset_timeout=60)
+        session = create_session(max_retries=2, backoff_factor=0, controller=controller)
+        with self.assertRaises(RetryError):
+            session.post(url)
+
+        results = self.send_requests(session, url, 20, threads=4)
+        self.assertTrue(all(isinstance(result, CircuitOpenError) for _, result in results))
+        self.assertLess(max(latency for latency, _ in results), 0.5)
+        self.assertEqual(fault.requests, 3)
+
+    def test_exhausted_retries_fail_the_run_by_default(self):
+        url = self.serve(FaultInjection(down=True))
+        client = CepsClient(
+            wsdl_cache=WsdlCache(cache_directory=tempfile.mkdtemp()), max_retries=1, backoff_factor=0, service_url=url
+        )
+        component = Component.__new__(Component)
+        component._watermarks = {}
+        component._split_failed_intervals = False
+        component._stream_rows = True
+        component._checkpoint = None
+        component._previous_day_hashes = None
+        interval = {"start_date": "2026-01-01T00:00:00", "end_date": "2026-01-02T00:00:00"}
+        # continue_on_fail skips intervals without data, not an outage of the service
+        with self.assertRaises(RetryError):
+            component.process_intervals({"endpoint_name": "Load"}, [interval], client, ListWriter(), True, 1)
+
+    def test_client_raises_ceps_exception(self):
+        url = self.serve(FaultInjection(down=True))
+        client = CepsClient(
+            wsdl_cache=WsdlCache(cache_directory=tempfile.mkdtemp()),
+            max_retries=1,
+            backoff_factor=0,
+            service_url=url,
+            request_controller=RequestController(1, failure_threshold=2, reset_timeout=60),
+        )
+        with self.assertRaisesRegex(RetryError, "status 503 after 1 retries"):
+            list(client.iter_data("Load", "2026-01-01T00:00:00", "2026-01-02T00:00:00"))
+        with self.assertRaisesRegex(CepsClientException, "paused after repeated failures"):
+            list(client.iter_data("Load", "2026-01-01T00:00:00", "2026-01-02T00:00:00"))
+
+    def test_requests_failed_without_response_are_recorded(self):
+        url = self.serve(FaultInjection(down=True))
+        metrics = RunMetrics()
+        client = CepsClient(
+            wsdl_cache=WsdlCache(cache_directory=tempfile.mkdtemp()),
+            max_retries=1,
+            backoff_factor=0,
+            service_url=url,
+            metrics=metrics,
+            stream_responses=True,
+        )
+        args = ("Load", "2026-01-01T00:00:00", "2026-01-02T00:00:00")
+        with self.assertRaises(RetryError):
+            client.get_data(*args)
+        with self.assertRaises(RetryError):
+            list(client.iter_data(*args))
+        client.stream_responses = False
+        with mock.patch.object(client, "_call_operation", side_effect=CepsClientTimeoutException("timed out")):
+            with self.assertRaises(CepsClientTimeoutException):
+                client.get_data(*args)
+
+        self.assertEqual([record["rows"] for record in metrics.requests], [None] * 3)
+        self.assertTrue(all(record["latency"] is not None for record in metrics.requests))
+        self.assertEqual(metrics.get_summary()["endpoints"]["Load"]["failed"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import csv
+import os
+import unittest
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from aggregation import LocalAggregationClient, aggregate_rows, can_aggregate
+from ceps import CepsClientException
+from component import Component
+
+FUNCTIONAL_DIR = os.path.join(os.path.dirname(__file__), "functional")
+PRAGUE = ZoneInfo("Europe/Prague")
+
+
+def load_expected(test_name, table, date_end):
+    """Returns the rows of the expected output up to date_end, without the repeated rows of the chunk boundaries."""
+    with open(os.path.join(FUNCTIONAL_DIR, test_name, "expected/data/out/tables", table), newline="") as table_file:
+        rows = {row["date"]: row for row in csv.DictReader(table_file) if row["date"][:19] <= date_end}
+    return list(rows.values())
+
+
+class NativeClient:
+    """Returns QH rows of the interval (end inclusive) with the value of the minute of the day."""
+
+    def __init__(self, failing=False, published=None):
+        self.failing = failing
+        self.published = published
+        self.requests = []
+
+    def get_data(self, endpoint, date_start, date_end, **kwargs):
+        self.requests.append((endpoint, date_start, date_end, kwargs))
+        if self.failing:
+            raise CepsClientException("Request timed out")
+        date = datetime.fromisoformat(date_start)
+        rows = []
+        end = datetime.fromisoformat(date_end)
+        if self.published:
+            end = min(end, datetime.fromisoformat(self.published))
+        while date <= end:
+            rows.append({"date": f"{date.isoformat()}+01:00", "value": str(date.hour * 60 + date.minute)})
+            date += timedelta(minutes=15)
+        return rows
+
+
+class TestAggregateRows(unittest.TestCase):
+    def test_rollups_match_service(self):
+        interval = ("2026-01-01T00:00:00", "2026-02-26T23:00:00")
+        native_rows = load_expected("03_generation_QH", "Generation.csv", "2026-02-26T23:45:00")
+        for test_name, function in [("29_generation_HR_MIN", "MIN"), ("30_generation_HR_MAX", "MAX")]:
+            expected = load_expected(test_name, "Generation.csv", interval[1])
+            self.assertEqual(aggregate_rows(native_rows, "HR", function, *interval), expected)
+
+        expected = load_expected("27_generation_HR_AVG", "Generation.csv", interval[1])
+        rows = aggregate_rows(native_rows, "HR", "AVG", *interval)
+        self.assertEqual([row["date"] for row in rows], [row["date"] for row in expected])
+        for row, expected_row in zip(rows, expected):
+            for column in ("tpp_mw", "npp_mw", "wpp_mw"):
+                self.assertAlmostEqual(float(row[column]), float(expected_row[column]), delta=0.1)
+
+    def test_dst_hours_and_days(self):
+        # 2026-10-25 has 25 hours, 02:00 comes twice
+        start = datetime.fromisoformat("2026-10-24T22:00:00+00:00")
+        rows = [
+            {"date": (start + timedelta(minutes=15 * quarter)).astimezone(PRAGUE).isoformat(), "value": "1"}
+            for quarter in range(4 * 26)
+        ]
+
+        hours = aggregate_rows(rows, "HR", "SUM", "2026-10-25T00:00:00", "2026-10-26T00:00:00")
+        self.assertEqual(
+            [row["date"] for row in hours[:4]],
+            [
+                "2026-10-25T00:00:00+02:00",
+                "2026-10-25T01:00:00+02:00",
+                "2026-10-25T02:00:00+02:00",
+                "2026-10-25T02:00:00+01:00",
+            ],
+        )
+        self.assertEqual({row["value"] for row in hours}, {"4"})
+        days = aggregate_rows(rows, "DY", "SUM", "2026-10-25T00:00:00", "2026-10-25T00:00:00")
+        self.assertEqual(days, [{"date": "2026-10-25T00:00:00+02:00", "value": "100", "granularity": "DY"}])
+
+    def test_supported_combinations(self):
+        self.assertTrue(can_aggregate("Load", "HR", "MAX"))
+        self.assertTrue(can_aggregate("Load", "MI", "AVG"))
+        self.assertFalse(can_aggregate("Load", "MI", "MAX"))
+        self.assertFalse(can_aggregate("Generation", "MI", "AVG"))
+        self.assertFalse(can_aggregate("RegulationEnergy", "HR", "AVG"))
+
+
+class TestLocalAggregationClient(unittest.TestCase):
+    TARGETS = [("Generation", "QH", "AVG"), ("Generation", "HR", "SUM"), ("Generation", "DY", "MAX")]
+
+    def test_targets_share_one_fetch(self):
+        native_client = NativeClient()
+        client = LocalAggregationClient(native_client, self.TARGETS)
+        interval = ("2026-01-01T00:00:00", "2026-01-03T00:00:00")
+
+        quarters = client.get_data("Generation", *interval, granularity="QH", function="AVG")
+        hours = client.get_data("Generation", *interval, granularity="HR", function="SUM")
+        days = client.get_data("Generation", *interval, granularity="DY", function="MAX")
+
+        # extended to the end of the last day
+        self.assertEqual(
+            native_client.requests,
+            [
+                (
+                    "Generation",
+                    "2026-01-01T00:00:00",
+                    "2026-01-03T23:45:00",
+                    {"granularity": "QH", "function": "AVG", "version": "RT"},
+                )
+            ],
+        )
+        self.assertEqual((len(quarters), quarters[-1]["date"]), (193, "2026-01-03T00:00:00+01:00"))
+        self.assertEqual(hours[1], {"date": "2026-01-01T01:00:00+01:00", "value": "330", "granularity": "HR"})
+        self.assertEqual([row["value"] for row in days], ["1425", "1425", "1425"])
+
+        client.get_data("Load", *interval, granularity="HR", function="AVG")
+        self.assertEqual(len(native_client.requests), 2)
+
+    def test_failed_fetch_fails_all_targets(self):
+        native_client = NativeClient(failing=True)
+        client = LocalAggregationClient(native_client, self.TARGETS)
+        for granularity, function in [("HR", "SUM"), ("DY", "MAX")]:
+            with self.assertRaises(CepsClientException):
+                client.get_data("Generation", "2026-01-01T00:00:00", "2026-01-03T00:00:00", granularity, function)
+        self.assertEqual(len(native_client.requests), 1)
+
+    def test_kept_rows_are_removed_with_split_intervals(self):
+        native_client = NativeClient(published="2026-01-02T06:00:00")
+        targets = [("Generation", "QH", "AVG"), ("Generation", "DY", "MAX")]
+        client = LocalAggregationClient(native_client, targets, Component.split_interval)
+        interval = {"start_date": "2026-01-02T12:00:00", "end_date": "2026-01-05T12:00:00"}
+
+        # no quarters are published in the interval, so only QH is split, but the day it starts has rows
+        with self.assertRaises(CepsClientException):
+            Component.fetch_interval(
+                "Generation", interval, {"endpoint_name": "Generation", "granularity": "QH"}, client, True
+            )
+        days = Component.fetch_interval(
+            "Generation",
+            interval,
+            {"endpoint_name": "Generation", "granularity": "DY", "function": "MAX"},
+            client,
+            True,
+        )
+
+        self.assertEqual([row["date"] for row in days], ["2026-01-02T00:00:00+01:00"])
+        self.assertEqual(len(native_client.requests), 3)
+        self.assertEqual((client._results, client._interval_locks, client._pending_targets), ({}, {}, {}))
+
+    def test_only_repeated_endpoints_are_aggregated(self):
+        endpoints = [
+            {"endpoint_name": "Generation", "granularity": "HR", "function": "AVG"},
+            {"endpoint_name": "Generation", "granularity": "HR", "function": "MAX"},
+            {"endpoint_name": "Load", "granularity": "HR"},
+            {"endpoint_name": "RegulationEnergy", "granularity": "HR"},
+            {"endpoint_name": "RegulationEnergy", "granularity": "DY"},
+        ]
+        self.assertEqual(
+            Component.get_local_aggregation_targets(endpoints),
+            [("Generation", "HR", "AVG"), ("Generation", "HR", "MAX")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from batch_runner import SharedFetchClient, run_batch
+from ceps import CepsClientException
+
+
+class DailyClient:
+    """Returns a row dated by the start of each requested interval, requests of failing_endpoints fail."""
+
+    def __init__(self, failing_endpoints=(), delay=0):
+        self.failing_endpoints = failing_endpoints
+        self.delay = delay
+        self.requests = []
+        self.runs = []
+
+    def configure_run(self, **kwargs):
+        self.runs.append(kwargs)
+
+    def get_data(self, endpoint, date_start, date_end, **kwargs):
+        self.requests.append((endpoint, date_start, kwargs.get("granularity")))
+        time.sleep(self.delay)
+        if endpoint in self.failing_endpoints:
+            raise CepsClientException(f"No data for {endpoint}")
+        return [{"date": date_start + "+01:00"}]
+
+    def iter_data(self, endpoint, date_start, date_end, **kwargs):
+        return iter(self.get_data(endpoint, date_start, date_end, **kwargs))
+
+
+class TestSharedFetchClient(unittest.TestCase):
+    def test_identical_requests_are_sent_once(self):
+        client = DailyClient()
+        shared = SharedFetchClient(client)
+        first = shared.get_data("Load", "2026-01-01", "2026-01-02", granularity="HR")
+        self.assertIs(shared.get_data("Load", "2026-01-01", "2026-01-02", granularity="HR"), first)
+        shared.get_data("Load", "2026-01-01", "2026-01-02", granularity="QH")
+        self.assertEqual(len(client.requests), 2)
+        self.assertEqual((shared.requests, shared.shared_requests), (3, 1))
+
+    def test_concurrent_requests_wait_for_the_first_one(self):
+        client = DailyClient(delay=0.05)
+        shared = SharedFetchClient(client)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(shared.get_data("Load", "2026-01-01", "2026-01-02")))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual(len(results), 4)
+
+    def test_failed_requests_are_not_kept(self):
+        client = DailyClient(failing_endpoints=("Load",))
+        shared = SharedFetchClient(client)
+        for _ in range(2):
+            with self.assertRaises(CepsClientException):
+                shared.get_data("Load", "2026-01-01", "2026-01-02")
+        self.assertEqual(len(client.requests), 2)
+
+    def test_least_recently_requested_rows_are_released(self):
+        client = DailyClient()
+        shared = SharedFetchClient(client, max_shared_rows=2)
+        for day in ("01", "02", "01", "03", "01", "02"):
+            shared.get_data("Load", f"2026-01-{day}", "2026-01-04")
+        # 02 was released when 03 was kept
+        self.assertEqual(
+            [request[1] for request in client.requests], ["2026-01-01", "2026-01-02", "2026-01-03", "2026-01-02"]
+        )
+
+    def test_streamed_rows_are_not_kept(self):
+        client = DailyClient()
+        shared = SharedFetchClient(client)
+        list(shared.iter_data("Load", "2026-01-01", "2026-01-02"))
+        list(shared.iter_data("Load", "2026-01-01", "2026-01-02"))
+        shared.get_data("Load", "2026-01-01", "2026-01-02")
+        list(shared.iter_data("Load", "2026-01-01", "2026-01-02"))
+        self.assertEqual(len(client.requests), 3)
+
+
+class TestRunBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def _data_folder(self, name, endpoints, **parameters):
+        data_folder = os.path.join(self.directory, name)
+        os.makedirs(os.path.join(data_folder, "out", "tables"))
+        config = {
+            "parameters": {"date_from": "2026-01-01", "date_to": "2026-03-01", "endpoints": endpoints, **parameters},
+            "action": "run",
+        }
+        with open(os.path.join(data_folder, "config.json"), "w") as config_file:
+            json.dump(config, config_file)
+        return data_folder
+
+    def _run(self, client, data_folders):
+        with mock.patch("ceps.CepsClient", return_value=client), mock.patch("ceps.WsdlCache"):
+            return run_batch(data_folders)
+
+    @staticmethod
+    def _read_table(data_folder, table_name):
+        with open(os.path.join(data_folder, "out", "tables", table_name)) as table_file:
+            return [row["date"] for row in csv.DictReader(table_file)]
+
+    def test_configurations_share_requests_and_keep_own_outputs(self):
+        load = {"endpoint_name": "Load", "granularity": "HR"}
+        generation = {"endpoint_name": "Generation", "granularity": "HR"}
+        first = self._data_folder("first", [load], request_timeout=30)
+        second = self._data_folder("second", [load, generation], incremental_fetch=True)
+        client = DailyClient()
+
+        self.assertEqual(self._run(client, [first, second]), 0)
+        # the Load intervals of the second configuration were fetched by the first one
+        self.assertEqual([request[0] for request in client.requests], ["Load", "Load", "Generation", "Generation"])
+        self.assertEqual(client.runs[0]["operation_timeout"], 30)
+        self.assertIsNone(client.runs[1]["operation_timeout"])
+
+        self.assertEqual(sorted(os.listdir(os.path.join(first, "out", "tables"))), ["Load.csv", "Load.csv.manifest"])
+        self.assertEqual(self._read_table(first, "Load.csv"), self._read_table(second, "Load.csv"))
+        self.assertEqual(len(self._read_table(second, "Generation.csv")), 2)
+        for data_folder, watermark_keys in ((first, ["Load/HR/AVG"]), (second, ["Load/HR/AVG", "Generation/HR/AVG"])):
+            with open(os.path.join(data_folder, "out", "state.json")) as state_file:
+                self.assertEqual(sorted(json.load(state_file)["watermarks"]), sorted(watermark_keys))
+
+    def test_transport_of_the_batch_is_used(self):
+        data_folder = self._data_folder(
+            "transport",
+            [{"endpoint_name": "Load", "granularity": "HR"}],
+            http_transport={"pool_size": 2, "compression": False, "stream_responses": True},
+        )
+        client = DailyClient()
+        with self.assertLogs(level="WARNING") as logs:
+            self.assertEqual(self._run(client, [data_folder]), 0)
+        self.assertEqual(len([line for line in logs.output if "ignored in batch runs" in line]), 2)
+        self.assertTrue(client.runs[0]["stream_responses"])
+
+    def test_failed_configuration_does_not_stop_the_batch(self):
+        failing = self._data_folder("failing", [{"endpoint_name": "Load", "granularity": "HR"}], continue_on_fail=False)
+        invalid = self._data_folder("invalid", [], max_workers=100)
+        succeeding = self._data_folder("succeeding", [{"endpoint_name": "Generation", "granularity": "HR"}])
+
+        self.assertEqual(self._run(DailyClient(failing_endpoints=("Load",)), [failing, invalid, succeeding]), 1)
+        self.assertFalse(os.path.exists(os.path.join(failing, "out", "state.json")))
+        # the temporary partitions of the failed configuration are neither uploaded nor left behind
+        self.assertEqual(os.listdir(os.path.join(failing, "out")), ["tables"])
+        self.assertEqual(os.listdir(os.path.join(failing, "out", "tables")), [])
+        self.assertEqual(len(self._read_table(succeeding, "Generation.csv")), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from keboola.component.exceptions import UserException
+
+from checkpoint import COMPLETED_FILE_NAME, Checkpoint
+from component import Component
+from tests.test_component import FakeClient, ListWriter, StreamingClient
+
+KEY = "Generation/HR/AVG"
+
+
+class RecordingClient(FakeClient):
+    def __init__(self, failing_starts=()):
+        super().__init__(failing_starts)
+        self.requests = []
+
+    def get_data(self, endpoint, date_start, date_end, **kwargs):
+        self.requests.append(date_start)
+        return super().get_data(endpoint, date_start, date_end, **kwargs)
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fingerprint = Checkpoint.get_fingerprint({"date_from": "2026-01-01", "endpoints": [{"a": 1}]})
+
+    def _process(self, client, intervals, continue_on_fail=False, max_workers=2, stream_rows=False):
+        component = Component.__new__(Component)
+        component._watermarks = {}
+        component._split_failed_intervals = False
+        component._stream_rows = stream_rows
+        component._checkpoint = Checkpoint(self.fingerprint, self.directory)
+        component._previous_day_hashes = None
+        writer = ListWriter()
+        try:
+            component.process_intervals(
+                {"endpoint_name": "Generation", "granularity": "HR"},
+                intervals,
+                client,
+                writer,
+                continue_on_fail,
+                max_workers,
+            )
+        finally:
+            self.checkpoint = component._checkpoint
+        return [row["date"] for row in writer.rows]
+
+    def test_failed_run_is_resumed_from_first_incomplete_interval(self):
+        intervals = [{"start_date": str(i), "end_date": str(i + 1)} for i in range(8)]
+        with self.assertRaises(UserException):
+            self._process(RecordingClient(failing_starts=("3",)), intervals)
+        self.assertEqual(self.checkpoint.recorded_intervals, 3)
+
+        client = RecordingClient()
+        written = self._process(client, intervals)
+        self.assertEqual(written, [str(i) for i in range(8)])
+        self.assertEqual(sorted(client.requests), ["3", "4", "5", "6", "7"])
+        self.assertEqual((self.checkpoint.resumed_intervals, self.checkpoint.resumed_rows), (3, 3))
+
+    def test_streamed_intervals_are_recorded_when_complete(self):
+        intervals = [{"start_date": f"2026-01-0{day}", "end_date": f"2026-01-0{day + 1}"} for day in range(1, 5)]
+        # the second interval fails after its first row was written
+        self._process(StreamingClient(max_days=10, broken_starts=("2026-01-02",)), intervals, True, 1, True)
+        self.assertEqual(self.checkpoint.recorded_intervals, 3)
+        self.assertEqual(len(os.listdir(os.path.join(self.checkpoint.path, "parts"))), 3)
+
+        client = StreamingClient(max_days=10)
+        written = self._process(client, intervals, True, 1, True)
+        self.assertEqual(client.requests, [("2026-01-02", "2026-01-03")])
+        self.assertEqual(written, [f"2026-01-0{day + offset}" for day in range(1, 5) for offset in (0, 1)])
+
+    def test_incomplete_records_are_ignored(self):
+        checkpoint = Checkpoint(self.fingerprint, self.directory)
+        interval = {"start_date": "0", "end_date": "1"}
+        with checkpoint.open_part(KEY, interval, ListWriter()) as part:
+            part.writerows(iter([{"date": "0", "granularity": None, "ordered_index": 0}]))
+            part.completed = True
+        with self.assertRaises(ValueError):
+            with checkpoint.open_part(KEY, {"start_date": "1", "end_date": "2"}, ListWriter()) as part:
+                part.writerows([{"date": "1"}])
+                part.completed = True
+                raise ValueError("Writing failed")
+        with open(os.path.join(checkpoint.path, COMPLETED_FILE_NAME), "a") as completed_file:
+            completed_file.write('"Generation/HR/AVG/2/')
+
+        resumed = Checkpoint(self.fingerprint, self.directory)
+        self.assertTrue(resumed.is_completed(KEY, interval))
+        self.assertFalse(resumed.is_completed(KEY, {"start_date": "1", "end_date": "2"}))
+        self.assertEqual(resumed.read_rows(KEY, interval), [{"date": "0", "granularity": None, "ordered_index": 0}])
+        self.assertEqual(len(os.listdir(os.path.join(checkpoint.path, "parts"))), 1)
+
+        resumed.clear()
+        self.assertFalse(os.path.exists(resumed.path))
+
+    def test_expired_checkpoints_are_removed(self):
+        expired = Checkpoint("e" * 32, self.directory)
+        recent = Checkpoint("a" * 32, self.directory)
+        # other data in a shared directory are kept however old they are
+        unrelated = [os.path.join(self.directory, "exports"), os.path.join(self.directory, "f" * 32)]
+        for path in unrelated:
+            os.makedirs(path)
+        old = time.time() - 8 * 24 * 60 * 60
+        for path in [expired.path, *unrelated]:
+            os.utime(path, (old, old))
+
+        Checkpoint(self.fingerprint, self.directory)
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(["a" * 32, "exports", "f" * 32, self.fingerprint]))
+        self.assertTrue(os.path.exists(recent.path))
+
+    def test_checkpoint_configuration(self):
+        self.assertIsNone(Component.get_checkpoint({}))
+        params = {"date_from": "2026-01-01", "date_to": "2026-02-01", "endpoints": [], "max_workers": 2}
+        checkpoint = Component.get_checkpoint({**params, "checkpoint": {"enabled": True, "directory": self.directory}})
+        # only the dates and endpoints decide the checkpoint
+        other = Component.get_checkpoint(
+            {**params, "max_workers": 4, "checkpoint": {"enabled": True, "directory": self.directory}}
+        )
+        self.assertEqual(checkpoint.path, other.path)
+        with self.assertRaises(UserException):
+            Component.get_checkpoint({"checkpoint": {"enabled": True, "directory": os.devnull}})
+
+    def test_default_directory_is_warned_about(self):
+        with mock.patch("component.Checkpoint"), self.assertLogs(level="WARNING") as logs:
+            Component.get_checkpoint({"checkpoint": {"enabled": True}})
+        self.assertIn("directory", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,12 +5,86 @@ Created on 12. 11. 2018
 """
 
 import os
+import subprocess
+import sys
+import time
 import unittest
+from datetime import datetime
 from unittest import mock
 
 from freezegun import freeze_time
+from keboola.component.exceptions import UserException
 
-from component import Component
+from ceps import CepsClient, CepsClientException, CepsClientTimeoutException
+from component import Component, PartialIntervalException
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "src")
+# imported only when data are fetched, see tests/benchmarks/bench_import_time.py
+LAZY_MODULES = ["dateparser", "lxml", "numpy", "requests", "xmltodict", "zeep"]
+
+
+class FakeClient:
+    """Returns one row per interval, later intervals respond faster so the responses finish out of order."""
+
+    def __init__(self, failing_starts=()):
+        self.failing_starts = failing_starts
+
+    def get_data(self, endpoint, date_start, date_end, **kwargs):
+        time.sleep(0.05 / (int(date_start) + 1))
+        if date_start in self.failing_starts:
+            raise CepsClientException(f"No data for {date_start}")
+        return [{"date": date_start}]
+
+
+class DatedClient(FakeClient):
+    """Returns hourly rows for the day given by the interval start."""
+
+    def get_data(self, endpoint, date_start, date_end, **kwargs):
+        super().get_data(endpoint, date_start, date_end, **kwargs)
+        day = int(date_start) + 1
+        return [{"date": f"2026-01-{day:02d}T{hour:02d}:00:00+01:00"} for hour in range(24)]
+
+
+class SplittingClient:
+    """Fails intervals longer than max_days and intervals starting at failing_starts."""
+
+    def __init__(self, max_days, failing_starts=()):
+        self.max_days = max_days
+        self.failing_starts = failing_starts
+        self.requests = []
+
+    def get_data(self, endpoint, date_start, date_end, **kwargs):
+        self.requests.append((date_start, date_end))
+        start, end = datetime.fromisoformat(date_start), datetime.fromisoformat(date_end)
+        if (end - start).days > self.max_days:
+            raise CepsClientTimeoutException(f"Request {date_start} - {date_end} timed out")
+        if date_start in self.failing_starts:
+            raise CepsClientException(f"No data for {date_start}")
+        return [{"date": date_start}]
+
+
+class StreamingClient(SplittingClient):
+    """Streams the rows of SplittingClient followed by a row dated by the interval end, intervals starting at
+    broken_starts fail after their first row."""
+
+    def __init__(self, max_days, broken_starts=()):
+        super().__init__(max_days)
+        self.broken_starts = broken_starts
+
+    def iter_data(self, endpoint, date_start, date_end, **kwargs):
+        yield from self.get_data(endpoint, date_start, date_end, **kwargs)
+        if date_start in self.broken_starts:
+            raise CepsClientTimeoutException(f"Reading {date_start} - {date_end} timed out")
+        yield {"date": date_end}
+
+
+class ListWriter:
+    def __init__(self, table_name=""):
+        self.table_name = table_name
+        self.rows = []
+
+    def writerows(self, rows):
+        self.rows.extend(rows)
 
 
 class TestComponent(unittest.TestCase):
@@ -23,6 +97,249 @@ class TestComponent(unittest.TestCase):
             comp = Component()
             comp.run()
 
+    def test_heavy_modules_are_imported_lazily(self):
+        code = f"import sys, component; print([module for module in {LAZY_MODULES} if module in sys.modules])"
+        result = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_endpoint_metadata(self):
+        self.assertEqual(Component.get_endpoint_p_keys("OfferPrices"), ["hour", "date", "unit"])
+        self.assertIsNone(Component.get_endpoint_p_keys("DataVersion"))
+        self.assertEqual(
+            CepsClient.get_request_options("Load", "QH", "MAX"),
+            {"granularity": "QH", "function": "MAX", "version": "RT", "add_para1": False},
+        )
+        self.assertEqual(
+            CepsClient.get_request_options("AktualniSystemovaOdchylkaCR"),
+            {"granularity": "HR", "function": "AVG", "add_para1": False},
+        )
+        self.assertEqual(CepsClient.get_request_options("OfferPrices"), {"add_para1": False})
+        self.assertEqual(
+            CepsClient.build_request_data("2026-01-01", "2026-01-02", **CepsClient.get_request_options("Generation")),
+            {
+                "dateFrom": "2026-01-01",
+                "dateTo": "2026-01-02",
+                "para1": "all",
+                "version": "RT",
+                "function": "AVG",
+                "agregation": "HR",
+            },
+        )
+
+    @staticmethod
+    def _component():
+        component = Component.__new__(Component)
+        component._watermarks = {}
+        component._split_failed_intervals = False
+        component._stream_rows = False
+        component._checkpoint = None
+        component._previous_day_hashes = None
+        return component
+
+    def _process(self, client, max_workers, continue_on_fail=True):
+        intervals = [{"start_date": str(i), "end_date": str(i + 1)} for i in range(8)]
+        writer = ListWriter()
+        component = self._component()
+        component.process_intervals(
+            {"endpoint_name": "Generation"}, intervals, client, writer, continue_on_fail, max_workers
+        )
+        return [row["date"] for row in writer.rows]
+
+    def test_concurrent_intervals_are_written_in_order(self):
+        self.assertEqual(self._process(FakeClient(), max_workers=4), [str(i) for i in range(8)])
+
+    def test_concurrent_intervals_continue_on_fail_skips_failed_interval(self):
+        written = self._process(FakeClient(failing_starts=("2",)), max_workers=4)
+        self.assertEqual(written, ["0", "1", "3", "4", "5", "6", "7"])
+
+    def test_concurrent_intervals_fail_raises_user_exception(self):
+        with self.assertRaises(UserException):
+            self._process(FakeClient(failing_starts=("2",)), max_workers=4, continue_on_fail=False)
+
+    def _run_pipeline(self, client, continue_on_fail=True):
+        intervals = [{"start_date": str(i), "end_date": str(i + 1)} for i in range(6)]
+        writers = {}
+
+        def init_output(endpoint, endpoint_columns):
+            table_name = f"{endpoint['endpoint_name']}.csv"
+            return writers.setdefault(table_name, ListWriter(table_name))
+
+        component = self._component()
+        endpoint_jobs = [
+            ({"endpoint_name": "Generation", "granularity": "HR"}, intervals, []),
+            ({"endpoint_name": "Load"}, intervals, []),
+            ({"endpoint_name": "Generation", "granularity": "DY"}, intervals[:2], []),
+        ]
+        with mock.patch.object(component, "init_endpoint_output", side_effect=init_output):
+            component.process_endpoints_pipeline(endpoint_jobs, client, continue_on_fail, max_workers=3)
+        return {name: [row["date"] for row in writer.rows] for name, writer in writers.items()}
+
+    def test_pipeline_writes_each_table_in_endpoint_and_interval_order(self):
+        written = self._run_pipeline(FakeClient())
+        self.assertEqual(written["Generation.csv"], ["0", "1", "2", "3", "4", "5", "0", "1"])
+        self.assertEqual(written["Load.csv"], ["0", "1", "2", "3", "4", "5"])
+
+    def test_pipeline_failure_raises_user_exception(self):
+        with self.assertRaises(UserException):
+            self._run_pipeline(FakeClient(failing_starts=("3",)), continue_on_fail=False)
+
+    def test_watermark_stops_at_first_failed_interval(self):
+        component = self._component()
+        intervals = [{"start_date": str(i), "end_date": str(i + 1)} for i in range(4)]
+        client = DatedClient(failing_starts=("2",))
+        component.process_intervals(
+            {"endpoint_name": "Generation", "granularity": "HR"}, intervals, client, ListWriter(), True, 2
+        )
+        self.assertEqual(component._watermarks, {"Generation/HR/AVG": "2026-01-02T23:00:00+01:00"})
+
+    def test_incremental_start_date(self):
+        component = self._component()
+        component._watermarks = {"Generation/HR/AVG": "2026-02-27T23:00:00+01:00"}
+        endpoint = {"endpoint_name": "Generation", "granularity": "HR"}
+        start, end = datetime(2026, 1, 1), datetime(2026, 3, 1)
+
+        self.assertEqual(component.get_incremental_start_date(endpoint, start, end, {}), datetime(2026, 2, 26, 23))
+        self.assertEqual(
+            component.get_incremental_start_date(endpoint, start, end, {"incremental_overlap_hours": 0}),
+            datetime(2026, 2, 27, 23),
+        )
+        # no watermark for other granularity, watermark before start and after end
+        self.assertEqual(component.get_incremental_start_date({**endpoint, "granularity": "QH"}, start, end, {}), start)
+        late_start, early_end = datetime(2026, 2, 28), datetime(2026, 2, 1)
+        self.assertEqual(component.get_incremental_start_date(endpoint, late_start, end, {}), late_start)
+        self.assertEqual(component.get_incremental_start_date(endpoint, start, early_end, {}), early_end)
+
+    def test_max_workers_validation(self):
+        self.assertEqual(Component.get_max_workers({}), 1)
+        for invalid in (0, 17, "4", True):
+            with self.assertRaises(UserException):
+                Component.get_max_workers({"max_workers": invalid})
+
+    def test_offer_prices_days_validation(self):
+        self.assertEqual(Component.get_offer_prices_days_per_request({}), 1)
+        for invalid in (0, 32, "7", True):
+            with self.assertRaises(UserException):
+                Component.get_offer_prices_days_per_request({"offer_prices_days_per_request": invalid})
+
+    def test_slice_rows_validation(self):
+        self.assertIsNone(Component.get_slice_rows({}))
+        self.assertEqual(Component.get_slice_rows({"slice_rows": 50000}), 50000)
+        for invalid in (0, "100", True):
+            with self.assertRaises(UserException):
+                Component.get_slice_rows({"slice_rows": invalid})
+
+    def test_request_controller_validation(self):
+        self.assertIsNone(Component.get_request_controller({"retry_budget": 5}, 8))
+        controller = Component.get_request_controller({"adaptive_concurrency": True, "retry_budget": 0}, 8, 60)
+        self.assertEqual((controller.limiter.max_concurrency, controller.limiter.latency_target), (8, 30))
+        self.assertEqual((controller.retry_budget, controller.breaker.failure_threshold), (0, 10))
+        for invalid in ({"retry_budget": -1}, {"retry_budget": "5"}, {"circuit_breaker_failures": 0}):
+            with self.assertRaises(UserException):
+                Component.get_request_controller({"adaptive_concurrency": True, **invalid}, 8)
+
+    def test_http_transport_validation(self):
+        self.assertEqual(
+            Component.get_http_transport({}, 8), {"pool_size": 8, "compression": True, "stream_responses": False}
+        )
+        transport = Component.get_http_transport({"http_transport": {"pool_size": 32, "compression": False}}, 8)
+        self.assertEqual((transport["pool_size"], transport["compression"]), (32, False))
+        for invalid in (0, "8", True):
+            with self.assertRaises(UserException):
+                Component.get_http_transport({"http_transport": {"pool_size": invalid}}, 8)
+
+    def test_chunk_days_by_granularity(self):
+        self.assertEqual(Component.get_chunk_days({"granularity": "MI"}), 30)
+        self.assertEqual(Component.get_chunk_days({"granularity": "MI"}, 10000), 6)
+        self.assertEqual(Component.get_chunk_days({"granularity": "QH"}, 10000), 104)
+        self.assertEqual(Component.get_chunk_days({"granularity": "MI"}, 100), 1)
+        self.assertEqual(Component.get_chunk_days({"granularity": "DY"}, 10000), 365)
+        self.assertEqual(Component.get_chunk_days({"granularity": "None"}, 10000), 30)
+        for invalid in (0, "100", 1.5):
+            with self.assertRaises(UserException):
+                Component.get_target_rows_per_request({"target_rows_per_request": invalid})
+
+    def test_failed_interval_is_split_until_it_succeeds(self):
+        client = SplittingClient(max_days=2)
+        interval = {"start_date": "2026-01-01T00:00:00", "end_date": "2026-01-09T00:00:00"}
+        rows = Component.fetch_interval("Load", interval, {"endpoint_name": "Load"}, client, split_failed=True)
+        self.assertEqual(
+            [row["date"] for row in rows],
+            ["2026-01-01T00:00:00", "2026-01-03T00:00:00", "2026-01-05T00:00:00", "2026-01-07T00:00:00"],
+        )
+        self.assertEqual(len(client.requests), 7)
+
+        with self.assertRaises(CepsClientTimeoutException):
+            Component.fetch_interval("Load", interval, {"endpoint_name": "Load"}, client)
+
+    def test_partially_fetched_interval_writes_recovered_rows(self):
+        client = SplittingClient(max_days=2, failing_starts=("2026-01-03T00:00:00",))
+        intervals = [{"start_date": "2026-01-01T00:00:00", "end_date": "2026-01-09T00:00:00"}]
+        component = self._component()
+        component._split_failed_intervals = True
+        writer = ListWriter()
+        component.process_intervals({"endpoint_name": "Load"}, intervals, client, writer, True, 1)
+        self.assertEqual(
+            [row["date"] for row in writer.rows],
+            ["2026-01-01T00:00:00", "2026-01-04T00:00:00", "2026-01-05T00:00:00", "2026-01-07T00:00:00"],
+        )
+        # the gap keeps the watermark from moving
+        self.assertEqual(component._watermarks, {})
+
+        with self.assertRaises(PartialIntervalException):
+            Component.fetch_interval("Load", intervals[0], {"endpoint_name": "Load"}, client, split_failed=True)
+
+    def test_streamed_interval_is_split_only_before_rows_are_read(self):
+        intervals = [{"start_date": "2026-01-01T00:00:00", "end_date": "2026-01-09T00:00:00"}]
+        component = self._component()
+        component._split_failed_intervals = True
+        component._stream_rows = True
+
+        writer = ListWriter()
+        component.process_intervals({"endpoint_name": "Load"}, intervals, StreamingClient(max_days=2), writer, True, 1)
+        self.assertEqual(len(writer.rows), 8)
+        self.assertEqual(component._watermarks, {"Load/None/AVG": "2026-01-09T00:00:00"})
+
+        component._watermarks = {}
+        writer = ListWriter()
+        client = StreamingClient(max_days=2, broken_starts=("2026-01-05T00:00:00",))
+        component.process_intervals({"endpoint_name": "Load"}, intervals, client, writer, True, 1)
+        # the interval that broke after its first row is not fetched again
+        self.assertEqual(
+            [row["date"] for row in writer.rows],
+            [
+                "2026-01-01T00:00:00",
+                "2026-01-03T00:00:00",
+                "2026-01-03T00:00:00",
+                "2026-01-05T00:00:00",
+                "2026-01-05T00:00:00",
+                "2026-01-07T00:00:00",
+                "2026-01-09T00:00:00",
+            ],
+        )
+        self.assertEqual(client.requests.count(("2026-01-05T00:00:00", "2026-01-07T00:00:00")), 1)
+        self.assertEqual(component._watermarks, {})
+
+        with self.assertRaises(UserException):
+            component.process_intervals({"endpoint_name": "Load"}, intervals, client, ListWriter(), False, 1)
+
+    def test_streaming_is_serial_only(self):
+        self.assertTrue(Component.get_stream_rows({"stream_rows": True}, 1))
+        self.assertFalse(Component.get_stream_rows({"stream_rows": True}, 4))
+        self.assertFalse(Component.get_stream_rows({}, 1))
+
+    def test_day_and_short_intervals_are_not_split(self):
+        self.assertIsNone(Component.split_interval({"start_date": "2026-01-01", "end_date": "2026-01-02"}))
+        self.assertIsNone(
+            Component.split_interval({"start_date": "2026-01-01T00:00:00", "end_date": "2026-01-02T12:00:00"})
+        )
+        self.assertEqual(
+            Component.split_interval({"start_date": "2026-01-01T00:00:00", "end_date": "2026-01-04T00:00:00"}),
+            [
+                {"start_date": "2026-01-01T00:00:00", "end_date": "2026-01-02T12:00:00"},
+                {"start_date": "2026-01-02T12:00:00", "end_date": "2026-01-04T00:00:00"},
+            ],
+        )
+
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
@@ -0,0 +1,151 @@
+import csv
+import gzip
+import os
+import tempfile
+import unittest
+
+from ceps.batch import RowBatch, TextColumn
+from csv_tools import CachedOrthogonalDictWriter, SlicedCsvWriter
+
+
+def row_batch(rows):
+    """
+    Returns RowBatch of the rows, which all have the same keys.
+    """
+    return RowBatch({key: TextColumn([row[key] for row in rows]) for key in rows[0]}, len(rows))
+
+
+class TestCachedOrthogonalDictWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.result_path = os.path.join(self.tmp_dir, "result.csv")
+
+    def _read_result(self):
+        with open(self.result_path, newline="") as result_file:
+            return list(csv.reader(result_file))
+
+    def _writer(self, fieldnames):
+        writer = CachedOrthogonalDictWriter(
+            self.result_path, fieldnames, temp_directory=os.path.join(self.tmp_dir, "temp")
+        )
+        writer.writeheader()
+        return writer
+
+    def test_rows_with_different_key_order_are_written_by_fieldnames(self):
+        with self._writer(["a", "b", "c"]) as writer:
+            writer.writerows([{"c": 3, "a": 1, "b": 2}, {"b": 5, "c": 6, "a": 4}])
+            writer.writerow({"a": 7})
+
+        self.assertEqual(self._read_result(), [["a", "b", "c"], ["1", "2", "3"], ["4", "5", "6"], ["7", "", ""]])
+
+    def test_new_columns_extend_header(self):
+        with self._writer(["a", "b"]) as writer:
+            writer.writerows([{"a": 1, "b": 2}, {"a": 3, "d": 4}, {"a": 5, "b": 6}])
+
+        result = self._read_result()
+        self.assertEqual(result[0], ["a", "b", "d"])
+        # rows written after the header was extended come first
+        self.assertEqual(result[1:], [["3", "", "4"], ["5", "6", ""], ["1", "2", ""]])
+
+    def test_widened_partitions_are_merged_by_position(self):
+        with self._writer(["a", "b", "c"]) as writer:
+            writer.writerows([{"c": "3", "a": "1"}, {"a": "x,y", "d": "4"}])
+
+        result = self._read_result()
+        self.assertEqual(result[0], ["a", "b", "c", "d"])
+        self.assertEqual(result[1:], [["x,y", "", "", "4"], ["1", "", "3", ""]])
+
+    def test_single_schema_is_finalized_without_copy(self):
+        writer = self._writer(["a", "b"])
+        writer.writerows([{"a": 1, "b": 2}] * 3)
+        writer.close()
+
+        with open(self.result_path, "rb") as result_file:
+            self.assertEqual(result_file.read(), b"a,b\n1,2\n1,2\n1,2\n")
+        self.assertEqual(writer.peak_disk_usage, os.path.getsize(self.result_path))
+        self.assertFalse(os.path.exists(writer.temp_directory))
+
+    def test_result_without_header(self):
+        writer = CachedOrthogonalDictWriter(
+            self.result_path, ["a", "b"], temp_directory=os.path.join(self.tmp_dir, "temp")
+        )
+        writer.writerows([{"a": 1, "b": 2}])
+        writer.close()
+
+        self.assertEqual(self._read_result(), [["1", "2"]])
+
+    def test_single_column(self):
+        with self._writer(["a"]) as writer:
+            writer.writerows([{"a": 1}, {"a": 2}])
+
+        self.assertEqual(self._read_result(), [["a"], ["1"], ["2"]])
+
+    def test_row_batches_are_written_as_rows(self):
+        calls = [[{"a": "1", "b": "2"}], [{"c": "3", "a": "x,y"}, {"c": "5", "a": "4"}], [{"b": "6", "a": "7"}]]
+        with self._writer(["a", "b"]) as writer:
+            for rows in calls:
+                writer.writerows(row_batch(rows))
+            writer.writerows(RowBatch({"a": TextColumn([])}, 0))
+        self.assertEqual(writer.rows_written, 4)
+        with open(self.result_path, "rb") as result_file:
+            batch_result = result_file.read()
+
+        with self._writer(["a", "b"]) as writer:
+            for rows in calls:
+                writer.writerows(rows)
+        with open(self.result_path, "rb") as result_file:
+            self.assertEqual(batch_result, result_file.read())
+
+
+class TestSlicedCsvWriter(unittest.TestCase):
+    def setUp(self):
+        self.table_directory = os.path.join(tempfile.mkdtemp(), "table.csv")
+
+    def _read_slices(self):
+        slices = []
+        for name in sorted(os.listdir(self.table_directory)):
+            with gzip.open(os.path.join(self.table_directory, name), "rt", newline="") as slice_file:
+                slices.append(list(csv.reader(slice_file)))
+        return slices
+
+    def test_slice_per_writerows_call(self):
+        with SlicedCsvWriter(self.table_directory, ["a", "b"]) as writer:
+            writer.writeheader()
+            writer.writerows([{"b": 2, "a": 1}, {"a": 3, "b": 4}])
+            writer.writerows([])
+            writer.writerows([{"a": 5}])
+
+        self.assertEqual(self._read_slices(), [[["1", "2"], ["3", "4"]], [["5", ""]]])
+        self.assertEqual(writer.rows_written, 3)
+
+    def test_slices_by_row_count(self):
+        with SlicedCsvWriter(self.table_directory, ["a"], rows_per_slice=2) as writer:
+            writer.writerows([{"a": 1}, {"a": 2}, {"a": 3}])
+            writer.writerows([{"a": 4}, {"a": 5}])
+
+        self.assertEqual(self._read_slices(), [[["1"], ["2"]], [["3"], ["4"]], [["5"]]])
+
+    def test_new_columns_pad_earlier_slices(self):
+        fieldnames = ["a", "b"]
+        with SlicedCsvWriter(self.table_directory, fieldnames) as writer:
+            writer.writerows([{"a": 1, "b": 2}])
+            writer.writerows([{"a": 3, "b": "x,y"}, {"a": 5, "c": 6}])
+
+        self.assertEqual(writer.fieldnames, ["a", "b", "c"])
+        self.assertEqual(fieldnames, ["a", "b"])
+        self.assertEqual(self._read_slices(), [[["1", "2", ""]], [["3", "x,y", ""], ["5", "", "6"]]])
+
+    def test_row_batches_are_sliced_by_row_count(self):
+        with SlicedCsvWriter(self.table_directory, ["a"], rows_per_slice=2) as writer:
+            writer.writerows(row_batch([{"a": "1"}, {"a": "2"}, {"a": "3"}]))
+            writer.writerows([{"a": "4"}])
+            writer.writerows(row_batch([{"a": "5", "b": "6"}, {"a": "7", "b": "8"}]))
+
+        self.assertEqual(writer.rows_written, 6)
+        self.assertEqual(
+            self._read_slices(), [[["1", ""], ["2", ""]], [["3", ""], ["4", ""]], [["5", "6"], ["7", "8"]]]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from csv_tools import CachedOrthogonalDictWriter
+from deduplication import DeduplicatingWriter, PrimaryKeyIndex
+
+FUNCTIONAL_DIR = os.path.join(os.path.dirname(__file__), "functional")
+
+
+class TestPrimaryKeyIndex(unittest.TestCase):
+    def test_date_keys(self):
+        index = PrimaryKeyIndex(["date"])
+        added = [
+            index.add({"date": date})
+            for date in [
+                "2026-01-01T00:00:00+01:00",
+                "2026-01-01T01:00:00+01:00",
+                "2026-01-01T01:00:00+01:00",
+                # the same hour before and after the DST change
+                "2026-10-25T02:00:00+02:00",
+                "2026-10-25T02:00:00+01:00",
+                # out of order
+                "2026-01-01T00:30:00+01:00",
+                "2026-01-01T00:30:00+01:00",
+            ]
+        ]
+        self.assertEqual(added, [True, True, False, True, True, True, False])
+        self.assertEqual((len(index), index.duplicates), (5, 2))
+        self.assertEqual(index._keys.itemsize, 8)
+
+    def test_composite_keys(self):
+        index = PrimaryKeyIndex(["hour", "date", "unit"])
+        rows = [
+            {"date": "2026-01-01T00:00:00+01:00", "hour": "1", "unit": "A"},
+            {"date": "2026-01-01T00:00:00+01:00", "hour": "1", "unit": "B"},
+            {"date": "2026-01-01T00:00:00+01:00", "hour": "2", "unit": "A"},
+            {"date": "2026-01-02T00:00:00+01:00", "hour": "2", "unit": "A"},
+            {"date": "2026-01-01T00:00:00+01:00", "hour": "1", "unit": "B"},
+        ]
+        self.assertEqual([index.add(row) for row in rows], [True, True, True, True, False])
+
+    def test_keys_without_valid_date(self):
+        index = PrimaryKeyIndex(["date"])
+        self.assertEqual(
+            [index.add({"date": value}) for value in ["n/a", "n/a", None, None]], [True, False, True, False]
+        )
+        self.assertEqual(len(index._keys), 0)
+
+
+class TestDeduplicatingWriter(unittest.TestCase):
+    def test_boundary_rows_are_written_once(self):
+        expected_path = os.path.join(FUNCTIONAL_DIR, "02_generation_HR/expected/data/out/tables/Generation.csv")
+        with open(expected_path, newline="") as expected_file:
+            reader = csv.DictReader(expected_file)
+            fieldnames, rows = reader.fieldnames, list(reader)
+
+        result_path = os.path.join(tempfile.mkdtemp(), "Generation.csv")
+        with DeduplicatingWriter(CachedOrthogonalDictWriter(result_path, fieldnames), ["date"]) as writer:
+            writer.writeheader()
+            # streamed rows are filtered as they pass
+            writer.writerows(iter(rows))
+
+        self.assertEqual((writer.rows_written, writer.duplicates_dropped), (len(rows) - 1, 1))
+        with open(result_path, newline="") as result_file:
+            dates = [row["date"] for row in csv.DictReader(result_file)]
+        self.assertEqual(dates, list(dict.fromkeys(row["date"] for row in rows)))
+
+
+if __name__ == "__main__":
+    unittest.main()
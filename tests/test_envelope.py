@@ -0,0 +1,79 @@
+import glob
+import json
+import os
+import unittest
+from http.server import BaseHTTPRequestHandler
+
+from lxml import etree
+
+from ceps.envelope import EnvelopeBuilder, EnvelopeException
+
+FUNCTIONAL_DIR = os.path.join(os.path.dirname(__file__), "functional")
+CASSETTE_PATH = "source/data/cassettes/requests.json"
+
+EMPTY_RESPONSE = (
+    b'<?xml version="1.0" encoding="utf-8"?><soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+    b'<soap:Body><GenerationResponse xmlns="https://www.ceps.cz/CepsData/"><GenerationResult>'
+    b'<root xmlns="https://www.ceps.cz/CepsData/StructuredData/1.0"><series /><data /></root>'
+    b"</GenerationResult></GenerationResponse></soap:Body></soap:Envelope>"
+)
+
+
+def load_soap_interactions(test_name="*"):
+    """
+    Returns (operation, request_data, request body, response body) of the recorded SOAP calls.
+    """
+    interactions = []
+    for cassette in sorted(glob.glob(os.path.join(FUNCTIONAL_DIR, test_name, CASSETTE_PATH))):
+        with open(cassette) as cassette_file:
+            for interaction in json.load(cassette_file)["interactions"]:
+                request = interaction["request"]
+                if request["method"] != "POST":
+                    continue
+                operation = etree.fromstring(request["body"].encode("utf-8"))[0][0]
+                request_data = {etree.QName(parameter).localname: parameter.text for parameter in operation}
+                interactions.append(
+                    (
+                        etree.QName(operation).localname,
+                        request_data,
+                        request["body"].encode("utf-8"),
+                        interaction["response"]["body"]["string"].encode("utf-8"),
+                    )
+                )
+    return interactions
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers with the recorded response of the request with the same envelope, or with an empty response."""
+
+    responses = {}
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        response = self.responses.get(body, EMPTY_RESPONSE)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestEnvelopeBuilder(unittest.TestCase):
+    def test_envelopes_match_recorded_requests(self):
+        builder = EnvelopeBuilder()
+        interactions = load_soap_interactions()
+        self.assertTrue(interactions)
+        for operation, request_data, request_body, _ in interactions:
+            self.assertEqual(builder.build(operation, request_data), request_body)
+
+    def test_unknown_parameter_is_rejected(self):
+        builder = EnvelopeBuilder()
+        with self.assertRaises(EnvelopeException):
+            builder.build("OfferPrices", {"dateFrom": "2026-01-01", "dateTo": "2026-01-02", "para1": "all"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,6 @@
 """Guard against CSV/manifest column drift.
 
-The component builds the output manifest from the static ``endpoint_columns.json`` list, while
+The component builds the output manifest from the static ``ceps.endpoints.ENDPOINT_COLUMNS`` lists, while
 ``CachedOrthogonalDictWriter`` extends the CSV with any extra columns the API returns. If the API adds
 or renames a column that is not in the static list, the CSV gains a column the manifest does not declare.
 Snowflake then rejects the load with "Number of columns in file (N) does not match that of the
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ceps.client import MeteredTransport, create_session
+from metrics import PROFILE_REPORT_FILE, RunMetrics, profiled
+
+REQUEST = {"dateFrom": "2026-01-01T00:00:00", "dateTo": "2026-01-31T00:00:00", "agregation": "HR"}
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Responds with 503 to the first request and with a fixed body to the next ones."""
+
+    request_count = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        FlakyHandler.request_count += 1
+        if FlakyHandler.request_count == 1:
+            self.send_error(503)
+            return
+        body = b"<ok />"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRunMetrics(unittest.TestCase):
+    def test_summary_per_endpoint_and_table(self):
+        metrics = RunMetrics()
+        metrics.add_request("Load", REQUEST, 0.5, 1000, 1, 0.1, 720)
+        metrics.add_request("Load", REQUEST, 1.5, 3000, 0, 0.2, None)
+        metrics.add_request("Load", REQUEST, None, 0, 0, 0.1, 720, cached=True)
+        metrics.add_table("Load.csv", 1440, 0.01, 2048)
+
+        summary = metrics.get_summary()
+        load = summary["endpoints"]["Load"]
+        self.assertEqual(
+            {key: load[key] for key in ("requests", "cached", "failed", "retries", "response_bytes", "rows")},
+            {"requests": 3, "cached": 1, "failed": 1, "retries": 1, "response_bytes": 4000, "rows": 1440},
+        )
+        self.assertEqual((load["latency_total"], load["latency_p50"], load["latency_max"]), (2.0, 1.5, 1.5))
+        self.assertEqual(summary["tables"]["Load.csv"]["rows_written"], 1440)
+
+    def test_metrics_file_contains_requests(self):
+        metrics = RunMetrics()
+        metrics.add_request("Load", REQUEST, 0.5, 1000, 0, 0.1, 720)
+        path = os.path.join(tempfile.mkdtemp(), "artifacts", "metrics.json")
+        metrics.write(path)
+
+        with open(path) as metrics_file:
+            written = json.load(metrics_file)
+        self.assertEqual(written["requests"][0]["date_from"], "2026-01-01T00:00:00")
+        self.assertEqual(written["endpoints"]["Load"]["rows"], 720)
+
+    def test_profile_report_is_written(self):
+        for mode in ("cprofile", "tracemalloc"):
+            output_directory = tempfile.mkdtemp()
+            with profiled(mode, output_directory):
+                sum(range(1000))
+            self.assertTrue(os.path.exists(os.path.join(output_directory, PROFILE_REPORT_FILE)))
+
+        with self.assertRaises(ValueError), profiled("perf", tempfile.mkdtemp()):
+            pass
+
+
+class TestMeteredTransport(unittest.TestCase):
+    def test_last_call_stats_include_retries(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            transport = MeteredTransport(session=create_session(max_retries=2, backoff_factor=0))
+            transport.post(f"http://127.0.0.1:{server.server_port}/", b"<request />", {})
+            latency, response_bytes, retries, wire_bytes, content_encoding = transport.pop_last_call()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertGreater(latency, 0)
+        self.assertEqual((response_bytes, retries, wire_bytes, content_encoding), (6, 1, 6, None))
+        self.assertEqual(transport.pop_last_call(), (None, 0, 0, 0, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from datetime import date, timedelta
+
+from ceps import CepsClientException
+from offer_prices import BatchedOfferPricesClient
+
+
+class OfferPricesClient:
+    """Returns two units per day, multi-day requests are cut to max_days days."""
+
+    def __init__(self, max_days, empty_days=()):
+        self.max_days = max_days
+        self.empty_days = empty_days
+        self.requests = []
+
+    def get_data(self, endpoint, date_start, date_end, **kwargs):
+        self.requests.append((endpoint, date_start, date_end))
+        start, end = date.fromisoformat(date_start), date.fromisoformat(date_end)
+        days = [start + timedelta(days=i) for i in range(min((end - start).days, self.max_days))]
+        rows = [
+            {"date": day.isoformat(), "hour": "1", "unit": unit}
+            for day in days
+            if day.isoformat() not in self.empty_days
+            for unit in ("A", "B")
+        ]
+        if not rows:
+            raise CepsClientException(f"No data returned for {endpoint}")
+        return rows
+
+
+class TestBatchedOfferPricesClient(unittest.TestCase):
+    def test_multi_day_requests_are_used_when_accepted(self):
+        client = OfferPricesClient(max_days=31)
+        batched = BatchedOfferPricesClient(client)
+
+        rows = batched.get_data("OfferPrices", "2026-01-01", "2026-01-08")
+        rows += batched.get_data("OfferPrices", "2026-01-08", "2026-01-15")
+
+        self.assertEqual(len(rows), 28)
+        self.assertTrue(batched.multi_day_accepted)
+        self.assertEqual(len(client.requests), 2)
+
+    def test_truncated_multi_day_response_falls_back_to_days(self):
+        client = OfferPricesClient(max_days=1)
+        batched = BatchedOfferPricesClient(client)
+
+        rows = batched.get_data("OfferPrices", "2026-01-01", "2026-01-04")
+        self.assertEqual(
+            [(row["date"], row["unit"]) for row in rows],
+            [(f"2026-01-0{day}", unit) for day in (1, 2, 3) for unit in ("A", "B")],
+        )
+        self.assertIs(batched.multi_day_accepted, False)
+
+        # further intervals are fetched per day right away, one day after another
+        client.requests.clear()
+        batched.get_data("OfferPrices", "2026-01-04", "2026-01-06")
+        self.assertEqual(
+            client.requests,
+            [("OfferPrices", "2026-01-04", "2026-01-05"), ("OfferPrices", "2026-01-05", "2026-01-06")],
+        )
+
+    def test_missing_last_day_is_verified_by_days_once(self):
+        client = OfferPricesClient(max_days=31, empty_days=("2026-01-03", "2026-01-06"))
+        batched = BatchedOfferPricesClient(client)
+
+        rows = batched.get_data("OfferPrices", "2026-01-01", "2026-01-04")
+        self.assertEqual(len(rows), 4)
+        # the days had nothing the multi-day response was missing
+        self.assertIs(batched.multi_day_accepted, True)
+
+        client.requests.clear()
+        rows = batched.get_data("OfferPrices", "2026-01-04", "2026-01-07")
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(client.requests, [("OfferPrices", "2026-01-04", "2026-01-07")])
+
+    def test_other_endpoints_are_passed_through(self):
+        client = OfferPricesClient(max_days=31)
+        BatchedOfferPricesClient(client).get_data("Load", "2026-01-01", "2026-01-04")
+        self.assertEqual(client.requests, [("Load", "2026-01-01", "2026-01-04")])
+
+
+if __name__ == "__main__":
+    unittest.main()
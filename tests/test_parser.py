@@ -0,0 +1,140 @@
+import unittest
+
+from lxml import etree
+
+from ceps import CepsClient, CepsClientException
+from ceps.batch import ConstantColumn, FloatColumn, RowBatch, TextColumn, TimestampColumn, format_floats
+from ceps.parser import STRUCTURED_DATA_NAMESPACE, RowMapper
+
+RESPONSE = """<root xmlns="https://www.ceps.cz/CepsData/StructuredData/1.0">
+<information><name>Load</name></information>
+<series><serie id="value1" name="Load [MW]" /><serie id="value2" name="Load including pumping [MW]" /></series>
+<data>
+<item date="2026-01-01T00:00:00+01:00" value1="6410" value2="6530.5" />
+<item date="2026-01-01T01:00:00+01:00" value2="6402" extra="x" />
+</data>
+</root>"""
+
+UNIFORM_RESPONSE = """<root xmlns="https://www.ceps.cz/CepsData/StructuredData/1.0">
+<information><name>Load</name></information>
+<series><serie id="value1" name="Load [MW]" /><serie id="value2" name="Load including pumping [MW]" /></series>
+<data>
+<item date="2026-10-25T02:00:00+02:00" value1="6410" value2="6530.5" />
+<item date="2026-10-25T02:00:00+01:00" value1="-12.25" value2="0" />
+<item date="2026-10-25T03:00:00+01:00" value1="1.50" value2="123456789.125" />
+</data>
+</root>"""
+
+EMPTY_RESPONSE = """<root xmlns="https://www.ceps.cz/CepsData/StructuredData/1.0">
+<information><name>Load</name></information><series /><data /></root>"""
+
+
+class TestParseResponse(unittest.TestCase):
+    def setUp(self):
+        self.client = CepsClient.__new__(CepsClient)
+
+    def test_rows_are_mapped_from_element_tree(self):
+        rows = self.client.parse_response("Load", {"agregation": "HR"}, etree.fromstring(RESPONSE))
+        self.assertEqual(
+            [list(row.items()) for row in rows],
+            [
+                [
+                    ("date", "2026-01-01T00:00:00+01:00"),
+                    ("load_mw", "6410"),
+                    ("load_including_pumping_mw", "6530.5"),
+                    ("granularity", "HR"),
+                ],
+                [
+                    ("@extra", "x"),
+                    ("date", "2026-01-01T01:00:00+01:00"),
+                    ("load_including_pumping_mw", "6402"),
+                    ("granularity", "HR"),
+                ],
+            ],
+        )
+
+    def test_ordered_index_is_added(self):
+        rows = self.client.parse_response("OdhadovanaCenaOdchylky", {}, etree.fromstring(RESPONSE))
+        self.assertEqual([row["ordered_index"] for row in rows], [0, 1])
+        self.assertEqual([row["granularity"] for row in rows], [None, None])
+
+    def test_row_mapper_is_cached_per_endpoint_and_series(self):
+        series = (("value1", "Load [MW]"),)
+        mapper = CepsClient.get_row_mapper("Load", series, "HR")
+        self.assertIs(CepsClient.get_row_mapper("Load", series, "HR"), mapper)
+        self.assertIsNot(CepsClient.get_row_mapper("Load", series, "QH"), mapper)
+        self.assertEqual(mapper.field_names_dict, {"date": "date", "value1": "load_mw"})
+
+    def test_duplicate_column_keeps_first_position_and_last_value(self):
+        mapper = RowMapper({"date": "date", "value13": "date", "value2": "price"}, None)
+        item = f'<item xmlns="{STRUCTURED_DATA_NAMESPACE}" value2="1" value13="2026-01-01" date="x" />'
+        root = etree.fromstring(f'<root xmlns="{STRUCTURED_DATA_NAMESPACE}"><data>{item}</data></root>')
+        self.assertEqual(
+            [list(row.items()) for row in mapper.iter_rows(root)],
+            [[("date", "2026-01-01"), ("price", "1"), ("granularity", None)]],
+        )
+
+    def test_empty_response_raises(self):
+        with self.assertRaises(CepsClientException):
+            self.client.parse_response("Load", {"agregation": "HR"}, etree.fromstring(EMPTY_RESPONSE))
+
+
+class TestRowBatch(unittest.TestCase):
+    def setUp(self):
+        self.root = etree.fromstring(UNIFORM_RESPONSE)
+
+    def test_batch_has_rows_of_dict_path(self):
+        batch = CepsClient.parse_response("Load", {"agregation": "HR"}, self.root, columnar=True)
+        expected = CepsClient.parse_response("Load", {"agregation": "HR"}, self.root)
+
+        self.assertIsInstance(batch, RowBatch)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual([list(row.items()) for row in batch], [list(row.items()) for row in expected])
+        self.assertEqual(batch[-1], expected[-1])
+        self.assertEqual(batch[1:], expected[1:])
+        self.assertEqual(
+            list(batch.format_rows(["granularity", "date", "missing"], "-"))[1], ("HR", expected[1]["date"], "-")
+        )
+
+    def test_columns_are_typed_when_formatted_back_exactly(self):
+        batch = RowMapper({"date": "date", "value1": "load_mw", "value2": "load_including_pumping_mw"}, "HR").get_batch(
+            self.root, ("date", "load_mw", "load_including_pumping_mw", "granularity")
+        )
+        column_types = {name: type(column) for name, column in batch.columns.items()}
+        self.assertEqual(
+            column_types,
+            {
+                "date": TimestampColumn,
+                # 1.50 would be written as 1.5
+                "load_mw": TextColumn,
+                "load_including_pumping_mw": FloatColumn,
+                "granularity": ConstantColumn,
+            },
+        )
+        self.assertEqual(list(batch.columns["date"].offsets), ["+01:00", "+02:00"])
+
+    def test_ordered_index_is_added(self):
+        batch = CepsClient.parse_response("OdhadovanaCenaOdchylky", {}, self.root, columnar=True)
+        expected = CepsClient.parse_response("OdhadovanaCenaOdchylky", {}, self.root)
+        self.assertEqual(list(batch), expected)
+        self.assertEqual([row["ordered_index"] for row in batch], [0, 1, 2])
+
+    def test_unknown_columns_fall_back_to_dicts(self):
+        # the second item has an extra attribute and a missing one
+        rows = CepsClient.parse_response("Load", {"agregation": "HR"}, etree.fromstring(RESPONSE), columnar=True)
+        self.assertIsInstance(rows, list)
+
+        mapper = RowMapper({"date": "date", "value1": "load_mw"}, "HR")
+        self.assertIsNone(mapper.get_batch(self.root, ("date", "load_mw", "granularity")))
+        self.assertIsInstance(CepsClient.parse_response("Unknown", {}, self.root, columnar=True), list)
+
+    def test_format_floats(self):
+        values = ["0", "-0", "-3", "6530.5", "0.1", "1e-05", "123456789.125", "1e+22", "nan"]
+        self.assertEqual(format_floats(FloatColumn.parse(values).values), values)
+        self.assertIsNone(FloatColumn.parse(["1", "x"]))
+        self.assertIsNone(FloatColumn.parse(["1", "0.00001"]))
+        self.assertIsNone(TimestampColumn.parse(["2026-01-01"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from freezegun import freeze_time
+from lxml import etree
+
+from ceps import ResponseCache
+
+RESPONSE = etree.fromstring(
+    '<root xmlns="https://www.ceps.cz/CepsData/StructuredData/1.0"><series><serie id="value1" name="Load" /></series>'
+    '<data><item date="2026-01-01" value1="1" /></data></root>'
+)
+EMPTY_RESPONSE = etree.fromstring(
+    '<root xmlns="https://www.ceps.cz/CepsData/StructuredData/1.0"><series><serie id="value1" name="Load" /></series>'
+    "<data /></root>"
+)
+CLOSED_REQUEST = {"dateFrom": "2026-01-01T00:00:00", "dateTo": "2026-01-30T00:00:00", "agregation": "HR"}
+RECENT_REQUEST = {"dateFrom": "2026-02-28T00:00:00", "dateTo": "2026-03-02T00:00:00", "agregation": "HR"}
+
+
+@freeze_time("2026-03-02T12:00:00")
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def test_miss_then_hit(self):
+        cache = ResponseCache(self.cache_dir)
+        self.assertIsNone(cache.get("Load", CLOSED_REQUEST))
+        cache.put("Load", CLOSED_REQUEST, RESPONSE)
+
+        cached = cache.get("Load", CLOSED_REQUEST)
+        self.assertEqual(etree.tostring(cached), etree.tostring(RESPONSE))
+        self.assertIsNone(cache.get("Generation", CLOSED_REQUEST))
+        self.assertIsNone(cache.get("Load", {**CLOSED_REQUEST, "agregation": "QH"}))
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_recent_interval_expires_and_closed_does_not(self):
+        cache = ResponseCache(self.cache_dir, recent_ttl_minutes=15)
+        cache.put("Load", CLOSED_REQUEST, RESPONSE)
+        cache.put("Load", RECENT_REQUEST, RESPONSE)
+
+        with freeze_time("2026-03-02T12:14:00"):
+            self.assertIsNotNone(cache.get("Load", RECENT_REQUEST))
+        with freeze_time("2027-03-02T12:16:00"):
+            self.assertIsNone(cache.get("Load", RECENT_REQUEST))
+            self.assertIsNotNone(cache.get("Load", CLOSED_REQUEST))
+
+    def test_closed_interval_without_data_expires(self):
+        cache = ResponseCache(self.cache_dir, recent_ttl_minutes=15)
+        cache.put("Load", CLOSED_REQUEST, EMPTY_RESPONSE)
+
+        self.assertIsNotNone(cache.get("Load", CLOSED_REQUEST))
+        with freeze_time("2026-03-02T12:16:00"):
+            self.assertIsNone(cache.get("Load", CLOSED_REQUEST))
+
+    def test_failed_write_is_not_cached(self):
+        cache = ResponseCache(self.cache_dir)
+        with mock.patch("os.replace", side_effect=OSError(28, "No space left on device")):
+            with self.assertLogs(level="WARNING"):
+                cache.put("Load", CLOSED_REQUEST, RESPONSE)
+        self.assertIsNone(cache.get("Load", CLOSED_REQUEST))
+        self.assertFalse(os.listdir(self.cache_dir))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(self.cache_dir)
+        requests = [{**CLOSED_REQUEST, "dateFrom": f"2026-01-0{day}T00:00:00"} for day in range(1, 4)]
+        for request in requests:
+            cache.put("Load", request, RESPONSE)
+        entry_size = max(cache._sizes.values())
+        os.utime(cache._get_entry_path("Load", requests[0]), (1, 1))
+
+        cache.max_size = entry_size * 2
+        cache.put("Load", {**CLOSED_REQUEST, "dateFrom": "2026-01-05T00:00:00"}, RESPONSE)
+
+        self.assertIsNone(cache.get("Load", requests[0]))
+        self.assertEqual(cache.evictions, 2)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_corrupted_entry_is_a_miss(self):
+        cache = ResponseCache(self.cache_dir)
+        cache.put("Load", CLOSED_REQUEST, RESPONSE)
+        with open(cache._get_entry_path("Load", CLOSED_REQUEST), "wb") as entry_file:
+            entry_file.write(b"garbage")
+
+        self.assertIsNone(cache.get("Load", CLOSED_REQUEST))
+        self.assertFalse(os.listdir(self.cache_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+from datetime import datetime, timedelta
+
+from ceps.batch import RowBatch, TextColumn
+from component import INTERVAL_DATE_FORMAT, Component
+from revisions import UnchangedDaysWriter, hash_rows
+from tests.test_component import ListWriter
+
+
+def day_rows(day, value="1", hours=3):
+    return [{"date": f"2026-01-{day:02d}T{hour:02d}:00:00+01:00", "value": value} for hour in range(hours)]
+
+
+class RevisedClient:
+    """Returns hourly rows of the day given by the interval start, revised_days get a different value."""
+
+    def __init__(self, revised_days=()):
+        self.revised_days = revised_days
+
+    def get_data(self, endpoint, date_start, date_end, **kwargs):
+        day = int(date_start) + 1
+        return day_rows(day, "2" if day in self.revised_days else "1", 24)
+
+    def iter_data(self, endpoint, date_start, date_end, **kwargs):
+        return iter(self.get_data(endpoint, date_start, date_end, **kwargs))
+
+
+class HourlyClient:
+    """Returns a row for each hour of the interval (end included) published by now."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def get_data(self, endpoint, date_start, date_end, **kwargs):
+        date = datetime.strptime(date_start, INTERVAL_DATE_FORMAT)
+        end = min(datetime.strptime(date_end, INTERVAL_DATE_FORMAT), self.now)
+        rows = []
+        while date <= end:
+            rows.append({"date": date.strftime(INTERVAL_DATE_FORMAT) + "+01:00", "value": "1"})
+            date += timedelta(hours=1)
+        return rows
+
+    def iter_data(self, endpoint, date_start, date_end, **kwargs):
+        return iter(self.get_data(endpoint, date_start, date_end, **kwargs))
+
+
+class TestUnchangedDaysWriter(unittest.TestCase):
+    def test_unchanged_days_are_skipped(self):
+        previous = UnchangedDaysWriter(ListWriter())
+        previous.writerows(day_rows(1) + day_rows(2) + [{"date": None, "value": "1"}])
+
+        writer = UnchangedDaysWriter(ListWriter(), previous.day_hashes)
+        writer.writerows(day_rows(1) + day_rows(2, value="2") + day_rows(3) + [{"date": None, "value": "1"}])
+        self.assertEqual(writer.writer.rows, day_rows(2, value="2") + day_rows(3) + [{"date": None, "value": "1"}])
+        self.assertEqual((writer.skipped_days, writer.skipped_rows), (1, 3))
+        self.assertEqual(sorted(writer.day_hashes), ["2026-01-01", "2026-01-02", "2026-01-03"])
+
+    def test_day_split_between_intervals_is_compared_by_parts(self):
+        previous = UnchangedDaysWriter(ListWriter())
+        previous.writerows(day_rows(1)[:1])
+        previous.writerows(day_rows(1)[1:])
+        self.assertEqual(len(previous.day_hashes["2026-01-01"]), 2)
+
+        writer = UnchangedDaysWriter(ListWriter(), previous.day_hashes)
+        writer.writerows(iter(day_rows(1)[:1]))
+        writer.writerows(iter(day_rows(1)[1:]))
+        # the whole day differs from both parts
+        writer.writerows(day_rows(1))
+        self.assertEqual(writer.writer.rows, day_rows(1))
+
+    def test_rows_held_before_a_failure_are_written(self):
+        def failing_rows():
+            yield from day_rows(1)
+            yield from day_rows(2)[:2]
+            raise ConnectionError("connection reset")
+
+        previous = UnchangedDaysWriter(ListWriter())
+        previous.writerows(day_rows(1) + day_rows(2)[:2])
+
+        writer = UnchangedDaysWriter(ListWriter(), previous.day_hashes)
+        with self.assertRaises(ConnectionError):
+            writer.writerows(failing_rows())
+        self.assertEqual(writer.writer.rows, day_rows(2)[:2])
+        # the incomplete day is not hashed, the next run writes it whole
+        self.assertEqual(list(writer.day_hashes), ["2026-01-01"])
+
+    def test_row_batches_are_passed_whole(self):
+        rows = day_rows(1) + day_rows(2)
+        batch = RowBatch({name: TextColumn([row[name] for row in rows]) for name in rows[0]}, len(rows))
+        previous = UnchangedDaysWriter(ListWriter())
+        previous.writerows(day_rows(1))
+
+        first_run = UnchangedDaysWriter(ListWriter())
+        first_run.writer.writerows = lambda row_dicts: first_run.writer.rows.append(row_dicts)
+        first_run.writerows(batch)
+        self.assertIs(first_run.writer.rows[0], batch)
+
+        writer = UnchangedDaysWriter(ListWriter(), previous.day_hashes)
+        writer.writerows(batch)
+        self.assertEqual(writer.writer.rows, day_rows(2))
+
+    def test_hash_depends_on_values_and_order(self):
+        rows = day_rows(1)
+        self.assertEqual(hash_rows(rows), hash_rows([dict(row) for row in rows]))
+        self.assertNotEqual(hash_rows(rows), hash_rows(rows[::-1]))
+        self.assertNotEqual(hash_rows(rows), hash_rows(day_rows(1, value="1.0")))
+
+
+class TestSkipUnchangedDays(unittest.TestCase):
+    def _process(self, client, previous_day_hashes, stream_rows=False, intervals=None, watermarks=None):
+        component = Component.__new__(Component)
+        component._watermarks = dict(watermarks or {})
+        component._split_failed_intervals = False
+        component._stream_rows = stream_rows
+        component._checkpoint = None
+        component._previous_day_hashes = previous_day_hashes
+        component._unchanged_days_writers = {}
+        component._writer_cache = {}
+        writer = ListWriter()
+        intervals = intervals or [{"start_date": str(i), "end_date": str(i + 1)} for i in range(4)]
+        component.process_intervals({"endpoint_name": "Load", "granularity": "HR"}, intervals, client, writer, True, 2)
+        return component, writer.rows
+
+    def test_only_revised_days_are_written(self):
+        component, rows = self._process(RevisedClient(), {})
+        self.assertEqual(len(rows), 96)
+        day_hashes = component.update_state()["day_hashes"]
+
+        for stream_rows in (False, True):
+            component, rows = self._process(RevisedClient(revised_days=(3,)), day_hashes, stream_rows)
+            self.assertEqual(rows, day_rows(3, "2", 24))
+            # the watermark still moves over the skipped days
+            self.assertEqual(component._watermarks["Load/HR/AVG"], "2026-01-04T23:00:00+01:00")
+
+    def test_successive_incremental_runs_skip_the_days_of_the_overlap(self):
+        endpoint = {"endpoint_name": "Load", "granularity": "HR"}
+        params = {"incremental_fetch": True, "skip_unchanged_days": True}
+        watermarks, day_hashes = {"Load/HR/AVG": "2026-02-10T08:00:00+01:00"}, {}
+        for now in (datetime(2026, 2, 10, 9), datetime(2026, 2, 10, 10)):
+            component = Component.__new__(Component)
+            component._watermarks = watermarks
+            start = component.get_incremental_start_date(endpoint, datetime(2026, 1, 1), now, params)
+            # the overlap starts at a different hour each run, the fetch at the start of its day
+            self.assertEqual(start, datetime(2026, 2, 9))
+            intervals = Component.split_date_intervals(start, now)
+            component, rows = self._process(HourlyClient(now), day_hashes, intervals=intervals, watermarks=watermarks)
+            watermarks, day_hashes = component._watermarks, component.update_state()["day_hashes"]
+        # the previous day is unchanged, the current one grew
+        self.assertEqual([row["date"][:10] for row in rows], ["2026-02-10"] * 11)
+        self.assertEqual(component._unchanged_days_writers["Load/HR/AVG"].skipped_days, 1)
+
+    def test_state_is_unchanged_when_disabled(self):
+        component, rows = self._process(RevisedClient(), None)
+        self.assertEqual(len(rows), 96)
+        self.assertNotIn("day_hashes", component.update_state())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,281 @@
+import csv
+import gzip
+import multiprocessing
+import os
+import resource
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lxml import etree
+from requests.exceptions import RetryError
+
+from ceps import CepsClient, CepsClientException, WsdlCache
+from ceps.client import create_session
+from ceps.envelope import EnvelopeBuilder, EnvelopeException
+from csv_tools import CachedOrthogonalDictWriter
+from metrics import RunMetrics
+from tests.test_envelope import EMPTY_RESPONSE, FUNCTIONAL_DIR, StubHandler, load_soap_interactions
+
+# rows of the synthetic response of the memory test, about 48 MB of XML
+LARGE_RESPONSE_ITEMS = 250_000
+# growth of the peak RSS allowed while the large response is streamed to a file
+MEMORY_CEILING_MB = 24
+
+LARGE_RESPONSE_HEAD = (
+    b'<?xml version="1.0" encoding="utf-8"?><soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+    b'<soap:Body><GenerationResponse xmlns="https://www.ceps.cz/CepsData/"><GenerationResult>'
+    b'<root xmlns="https://www.ceps.cz/CepsData/StructuredData/1.0"><series>'
+    + b"".join(b'<serie id="value%d" name="Serie %d [MW]" />' % (i, i) for i in range(1, 10))
+    + b"</series><data>"
+)
+LARGE_RESPONSE_TAIL = b"</data></root></GenerationResult></GenerationResponse></soap:Body></soap:Envelope>"
+
+
+class LargeResponseHandler(BaseHTTPRequestHandler):
+    """Answers with a response of LARGE_RESPONSE_ITEMS items generated while it is sent."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.end_headers()
+        self.wfile.write(LARGE_RESPONSE_HEAD)
+        values = b"".join(b' value%d="%d.5"' % (i, 1000 + i) for i in range(1, 10))
+        for start in range(0, LARGE_RESPONSE_ITEMS, 1000):
+            self.wfile.write(
+                b"".join(
+                    b'<item date="2026-01-01T00:00:00+01:00" index="%d"%s />' % (index, values)
+                    for index in range(start, min(start + 1000, LARGE_RESPONSE_ITEMS))
+                )
+            )
+        self.wfile.write(LARGE_RESPONSE_TAIL)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TruncatedHandler(StubHandler):
+    """Answers with the first half of the recorded response."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        response = self.responses[body][: len(self.responses[body]) // 2]
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(response)
+
+
+class ServerErrorHandler(StubHandler):
+    """Answers with status 500 and an empty response that is not a fault."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(500)
+        self.send_header("Content-Length", str(len(EMPTY_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(EMPTY_RESPONSE)
+
+
+class CompressingHandler(StubHandler):
+    """Answers with the recorded response, gzip compressed when the request accepts it."""
+
+    accept_encodings = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        response = self.responses[body]
+        accept_encoding = self.headers.get("Accept-Encoding", "")
+        CompressingHandler.accept_encodings.append(accept_encoding)
+        self.send_response(200)
+        if "gzip" in accept_encoding:
+            response = gzip.compress(response)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def create_client(server, **kwargs):
+    return CepsClient(
+        wsdl_cache=WsdlCache(cache_directory=tempfile.mkdtemp()),
+        max_retries=0,
+        service_url=f"http://127.0.0.1:{server.server_port}/_layouts/CepsData.asmx",
+        **kwargs,
+    )
+
+
+def stream_large_response():
+    """
+    Runs in a fresh process. Returns the number of rows written and the growth of the peak RSS in MiB.
+    """
+    server = serve(LargeResponseHandler)
+    client = create_client(server)
+    # the lazily built envelope builder is warmed up before the RSS baseline
+    _ = client.envelope_builder
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # kilobytes on Linux
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        with CachedOrthogonalDictWriter(
+            os.path.join(tmp_dir, "Generation.csv"), ["date"], temp_directory=os.path.join(tmp_dir, "temp")
+        ) as writer:
+            writer.writerows(client.iter_data("Generation", "2026-01-01T00:00:00", "2026-07-01T00:00:00", "MI"))
+        growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    server.shutdown()
+    return writer.rows_written, growth / 1024
+
+
+class TestStreamResult(unittest.TestCase):
+    def test_streamed_rows_match_parsed_rows(self):
+        builder = EnvelopeBuilder()
+        for operation, request_data, _, response in load_soap_interactions():
+            try:
+                expected = CepsClient.parse_response(operation, request_data, builder.parse_result(operation, response))
+            except CepsClientException:
+                continue
+            chunks = (response[position : position + 512] for position in range(0, len(response), 512))
+            series, items = builder.stream_result(operation, chunks)
+            row_mapper = CepsClient.get_row_mapper(operation, series, request_data.get("agregation"))
+            self.assertEqual(list(row_mapper.map_items(items)), expected)
+
+    def test_tree_built_from_chunks_matches_parsed_tree(self):
+        builder = EnvelopeBuilder()
+        for operation, _, _, response in load_soap_interactions("2*"):
+            chunks = (response[position : position + 512] for position in range(0, len(response), 512))
+            parsed = builder.parse_result(operation, response)
+            built = builder.parse_chunks(operation, chunks)
+            if parsed is None:
+                self.assertIsNone(built)
+            else:
+                self.assertEqual(etree.tostring(built), etree.tostring(parsed))
+        with self.assertRaises(EnvelopeException):
+            builder.parse_chunks("Load", [b"<soap:Envelope", b""])
+
+    def test_fault_is_raised(self):
+        response = (
+            b'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body><soap:Fault>'
+            b"<faultcode>soap:Server</faultcode><faultstring>Server was unable to process request</faultstring>"
+            b"</soap:Fault></soap:Body></soap:Envelope>"
+        )
+        with self.assertRaisesRegex(EnvelopeException, "unable to process"):
+            EnvelopeBuilder().stream_result("Load", [response])
+
+
+class TestIterData(unittest.TestCase):
+    def setUp(self):
+        self.interactions = load_soap_interactions("02_generation_HR")
+        StubHandler.responses = {request_body: response for _, _, request_body, response in self.interactions}
+
+    def test_rows_match_component_output(self):
+        server = serve(StubHandler)
+        try:
+            client = create_client(server)
+            rows = [
+                row
+                for _, request_data, _, _ in self.interactions
+                for row in client.iter_data("Generation", request_data["dateFrom"], request_data["dateTo"], "HR")
+            ]
+            with self.assertRaises(CepsClientException):
+                list(client.iter_data("Generation", "2020-01-01T00:00:00", "2020-01-02T00:00:00", "QH"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        expected_path = os.path.join(FUNCTIONAL_DIR, "02_generation_HR/expected/data/out/tables/Generation.csv")
+        with open(expected_path, newline="") as expected_file:
+            expected = list(csv.DictReader(expected_file))
+        self.assertEqual([{column: row.get(column, "") for column in expected[0]} for row in rows], expected)
+
+    def test_truncated_response_fails_after_the_read_rows(self):
+        server = serve(TruncatedHandler)
+        _, request_data, _, _ = self.interactions[0]
+        rows = []
+        try:
+            with self.assertRaises(CepsClientException):
+                for row in create_client(server).iter_data(
+                    "Generation", request_data["dateFrom"], request_data["dateTo"], "HR"
+                ):
+                    rows.append(row)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertTrue(rows)
+
+    def test_server_error_without_fault_is_raised(self):
+        server = serve(ServerErrorHandler)
+        try:
+            client = create_client(server, stream_responses=True)
+            args = ("Generation", "2026-01-01T00:00:00", "2026-01-02T00:00:00", "HR")
+            # not returned as an interval without data
+            with self.assertRaises(RetryError):
+                client.get_data(*args)
+            with self.assertRaises(RetryError):
+                list(client.iter_data(*args))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestHttpTransport(unittest.TestCase):
+    def setUp(self):
+        self.interactions = load_soap_interactions("02_generation_HR")
+        CompressingHandler.responses = {request_body: response for _, _, request_body, response in self.interactions}
+        CompressingHandler.accept_encodings = []
+        self.server = serve(CompressingHandler)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _fetch(self, streamed, **kwargs):
+        metrics = RunMetrics()
+        client = create_client(self.server, metrics=metrics, **kwargs)
+        _, request_data, _, response = self.interactions[0]
+        args = ("Generation", request_data["dateFrom"], request_data["dateTo"], "HR")
+        rows = list(client.iter_data(*args)) if streamed else client.get_data(*args)
+        expected = CepsClient.parse_response(
+            "Generation", request_data, EnvelopeBuilder().parse_result("Generation", response)
+        )
+        self.assertEqual(rows, expected)
+        return metrics.requests[0], len(response)
+
+    def test_compressed_responses_are_streamed_into_the_parser(self):
+        for streamed in (False, True):
+            record, body_size = self._fetch(streamed, stream_responses=True)
+            self.assertEqual((record["response_bytes"], record["content_encoding"]), (body_size, "gzip"))
+            # the verbose XML compresses to a fraction of its size
+            self.assertLess(record["wire_bytes"], body_size / 4)
+            self.assertGreater(record["first_row_time"], 0)
+        self.assertEqual(CompressingHandler.accept_encodings, ["gzip, deflate"] * 2)
+
+    def test_configured_pool_size_is_used(self):
+        for pool_size in (2, 32):
+            adapter = create_session(pool_size=pool_size).get_adapter("https://www.ceps.cz")
+            self.assertEqual(adapter._pool_maxsize, pool_size)
+
+    def test_compression_can_be_disabled(self):
+        record, body_size = self._fetch(True, compression=False)
+        self.assertEqual((record["wire_bytes"], record["content_encoding"]), (body_size, None))
+        self.assertEqual(CompressingHandler.accept_encodings, ["identity"])
+
+
+@unittest.skipUnless(os.path.exists("/proc/self"), "peak RSS is measured on Linux")
+class TestStreamingMemory(unittest.TestCase):
+    def test_peak_memory_does_not_grow_with_response(self):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            rows_written, growth = executor.submit(stream_large_response).result()
+
+        self.assertEqual(rows_written, LARGE_RESPONSE_ITEMS)
+        self.assertLess(growth, MEMORY_CEILING_MB)
+
+
+if __name__ == "__main__":
+    unittest.main()
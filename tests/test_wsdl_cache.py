@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from freezegun import freeze_time
+
+from ceps.wsdl_cache import BUNDLED_WSDL_PATH, WsdlCache
+
+
+class TestWsdlCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        with open(BUNDLED_WSDL_PATH, "rb") as wsdl_file:
+            self.wsdl_content = wsdl_file.read()
+        self.fetch_count = 0
+
+    def _fetch(self):
+        self.fetch_count += 1
+        return self.wsdl_content
+
+    def _fail_fetch(self):
+        raise ConnectionError("offline")
+
+    def _age_entry(self, cache):
+        with open(cache.meta_path) as meta_file:
+            meta = json.load(meta_file)
+        meta["fetched_at"] = time.time() - cache.ttl - 1
+        with open(cache.meta_path, "w") as meta_file:
+            json.dump(meta, meta_file)
+
+    def test_empty_cache_is_seeded_from_bundle_without_fetch(self):
+        cache = WsdlCache(self.cache_dir)
+        location = cache.get_location(self._fetch)
+        self.assertEqual(location, os.path.join(self.cache_dir, "CepsData.wsdl"))
+        self.assertEqual(self.fetch_count, 0)
+
+    def test_bundled_snapshot_does_not_expire(self):
+        # a fresh container long after the snapshot was taken
+        with freeze_time("2036-01-01"):
+            cache = WsdlCache(tempfile.mkdtemp())
+            self.assertEqual(cache.get_location(self._fetch), cache.wsdl_path)
+        with freeze_time("2046-01-01"):
+            self.assertTrue(cache.is_valid())
+        self.assertEqual(self.fetch_count, 0)
+
+    def test_stale_entry_is_used_when_fetch_fails(self):
+        cache = WsdlCache(self.cache_dir, bundled_path=None)
+        cache.refresh(self._fetch)
+        self._age_entry(cache)
+        self.assertEqual(cache.get_location(self._fail_fetch), cache.wsdl_path)
+        self.assertFalse(cache.is_valid())
+
+    def test_stale_entry_is_refreshed(self):
+        cache = WsdlCache(self.cache_dir, bundled_path=None)
+        cache.refresh(self._fetch)
+        self._age_entry(cache)
+
+        self.assertIsNotNone(cache.get_location(self._fetch))
+        self.assertEqual(self.fetch_count, 2)
+        self.assertTrue(cache.is_valid())
+
+    def test_corrupted_entry_is_refreshed(self):
+        cache = WsdlCache(self.cache_dir)
+        cache.get_location(self._fetch)
+        with open(cache.wsdl_path, "wb") as wsdl_file:
+            wsdl_file.write(b"<broken")
+
+        cache.get_location(self._fetch)
+        self.assertEqual(self.fetch_count, 1)
+        with open(cache.wsdl_path, "rb") as wsdl_file:
+            self.assertEqual(wsdl_file.read(), self.wsdl_content)
+
+    def test_invalid_cache_and_failed_fetch_returns_none(self):
+        cache = WsdlCache(self.cache_dir, bundled_path=None)
+        self.assertIsNone(cache.get_location(self._fail_fetch))
+
+    def test_fetched_content_that_is_not_wsdl_is_not_cached(self):
+        cache = WsdlCache(self.cache_dir, bundled_path=None)
+        self.assertIsNone(cache.refresh(lambda: b"<html><body>maintenance</body></html>"))
+        self.assertFalse(os.path.exists(cache.wsdl_path))
+
+
+if __name__ == "__main__":
+    unittest.main()